@@ -1,6 +1,6 @@
 {
     'name': 'Italy - Ritenuta e Cassa Previdenziale Semplificata',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.3.0',
     'author': 'Clan Informatico',
     'license': 'AGPL-3',
     'category': 'Accounting',
@@ -19,8 +19,14 @@
     ],
     'data': [
         #'security/portal_security.xml',  # Prima le regole di sicurezza
+        'security/ir.model.access.csv',
+        'security/fiscal_security.xml',
+        'data/ir_sequence.xml',
+        'data/ir_cron.xml',
+        'views/fiscal_profile_view.xml',
         'views/res_company_view.xml',
         'views/account_move_view.xml',
+        'views/account_bank_statement_line_view.xml',
         'views/sale_order_view.xml',
         'views/report_saleorder_template.xml',
         'views/report_invoice_template.xml',
@@ -28,7 +34,20 @@
 ##        'views/sale_subscription_view.xml',
         #'views/portal_sale_order_templates.xml',
         'views/assets.xml',
+        'views/sale_subscription_fiscal_mrr_view.xml',
+        'views/fiscal_check_view.xml',
+        'report/fiscal_report_views.xml',
+        'wizard/cu_export_views.xml',
+        'wizard/fatturapa_export_views.xml',
+        'wizard/fiscal_totals_export_views.xml',
     ],
+    'assets': {
+        'web.assets_backend': [
+            'l10n_it_simple_withholding_cassa/static/src/components/**/*',
+        ],
+    },
+    'pre_init_hook': 'pre_init_hook',
+    'post_init_hook': 'post_init_hook',
     'installable': True,
     'application': False,
 }
\ No newline at end of file
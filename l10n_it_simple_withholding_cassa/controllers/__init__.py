@@ -1 +1,3 @@
-from . import main
\ No newline at end of file
+from . import main
+from . import export
+from . import simulate
@@ -0,0 +1,81 @@
+import tempfile
+
+from werkzeug.exceptions import NotFound
+from werkzeug.wsgi import wrap_file
+
+from odoo import api, http
+from odoo.http import request, Response, content_disposition
+from odoo.modules.registry import Registry
+
+
+def _stream_with_new_cursor(model, res_id, method):
+    """Generatore che apre un proprio cursore
+
+    Il corpo della risposta viene letto dopo la chiusura del cursore della
+    richiesta, quindi la generazione usa una transazione dedicata.
+    """
+    dbname = request.env.cr.dbname
+    uid = request.env.uid
+    context = dict(request.env.context)
+
+    def generate():
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            yield from getattr(env[model].browse(res_id), method)()
+
+    return generate()
+
+
+class FiscalExportController(http.Controller):
+
+    @http.route('/l10n_it_withholding/cu/<int:wizard_id>', type='http', auth='user')
+    def download_cu(self, wizard_id, **kw):
+        wizard = request.env['l10n_it.cu.export'].browse(wizard_id).exists()
+        if not wizard:
+            raise NotFound()
+        wizard.check_access('read')
+        wizard._check_exportable()
+        headers = [
+            ('Content-Type', 'text/plain; charset=ascii'),
+            ('Content-Disposition', content_disposition(wizard._get_cu_filename())),
+            ('X-Content-Type-Options', 'nosniff'),
+        ]
+        body = _stream_with_new_cursor(wizard._name, wizard.id, '_generate_cu_file')
+        return Response(body, headers=headers, direct_passthrough=True)
+
+    @http.route('/l10n_it_withholding/fatturapa/<int:wizard_id>', type='http', auth='user')
+    def download_fatturapa(self, wizard_id, **kw):
+        wizard = request.env['l10n_it.fatturapa.export'].browse(wizard_id).exists()
+        if not wizard:
+            raise NotFound()
+        wizard.check_access('read')
+        # Lo ZIP viene scritto su file temporaneo e poi servito a blocchi
+        tmp = tempfile.TemporaryFile()
+        wizard._write_zip(tmp)
+        size = tmp.tell()
+        tmp.seek(0)
+        headers = [
+            ('Content-Type', 'application/zip'),
+            ('Content-Length', str(size)),
+            ('Content-Disposition', content_disposition(wizard._get_filename())),
+        ]
+        return Response(wrap_file(request.httprequest.environ, tmp), headers=headers, direct_passthrough=True)
+
+    @http.route('/l10n_it_withholding/fiscal_totals/<int:wizard_id>', type='http', auth='user')
+    def download_fiscal_totals(self, wizard_id, **kw):
+        wizard = request.env['l10n_it.fiscal.totals.export'].browse(wizard_id).exists()
+        if not wizard:
+            raise NotFound()
+        wizard.check_access('read')
+        wizard._check_companies()
+        content_type = {
+            'csv': 'text/csv; charset=utf-8',
+            'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        }[wizard.file_format]
+        headers = [
+            ('Content-Type', content_type),
+            ('Content-Disposition', content_disposition(wizard._get_filename())),
+            ('X-Content-Type-Options', 'nosniff'),
+        ]
+        body = _stream_with_new_cursor(wizard._name, wizard.id, '_generate_export')
+        return Response(body, headers=headers, direct_passthrough=True)
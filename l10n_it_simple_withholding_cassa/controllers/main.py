@@ -1,6 +1,27 @@
 from odoo import http
+from odoo.http import request
 from odoo.addons.portal.controllers.portal import CustomerPortal
 
+# Campi fiscali letti dalle pagine del portale
+PORTAL_FISCAL_FIELDS = [
+    'apply_cassa', 'cassa_percent', 'cassa_amount',
+    'apply_withholding', 'withholding_percent', 'withholding_amount',
+    'total_gross', 'net_amount',
+]
+
+
+def _portal_page_readonly(self, rule, args):
+    """Pagine di dettaglio in sola lettura, tranne il download del PDF
+
+    Il rendering PDF può salvare allegati (copia della fattura validata,
+    cache dei report) e resta quindi sul database principale. Se la pagina
+    scrive comunque (es. messaggio "preventivo visualizzato"), Odoo ripete
+    la richiesta con il cursore in scrittura. Odoo passa controller, regola
+    e argomenti della rotta: i parametri si leggono da ``request``.
+    """
+    return request.params.get('report_type') != 'pdf'
+
+
 class CustomerPortalExtended(CustomerPortal):
 
     def _prepare_portal_layout_values(self):
@@ -8,13 +29,48 @@ class CustomerPortalExtended(CustomerPortal):
         # puoi aggiungere dati generici se vuoi
         return values
 
-    @http.route(['/my/orders/<int:order_id>'], type='http', auth="user", website=True)
+    def _prefetch_fiscal_fields(self, response, key):
+        """Legge con una sola query i campi fiscali dei documenti della pagina"""
+        qcontext = getattr(response, 'qcontext', None) or {}
+        records = qcontext.get(key)
+        if isinstance(records, list):
+            # Elenco fatture: dizionari con la fattura sotto 'invoice'
+            records = request.env['account.move'].union(*(
+                item['invoice'] for item in records if isinstance(item, dict) and item.get('invoice')))
+        if records:
+            records.fetch(PORTAL_FISCAL_FIELDS)
+
+    @http.route(readonly=True)
+    def portal_my_quotes(self, **kwargs):
+        response = super().portal_my_quotes(**kwargs)
+        self._prefetch_fiscal_fields(response, 'quotations')
+        return response
+
+    @http.route(readonly=True)
+    def portal_my_orders(self, **kwargs):
+        response = super().portal_my_orders(**kwargs)
+        self._prefetch_fiscal_fields(response, 'orders')
+        return response
+
+    @http.route(readonly=True)
+    def portal_my_invoices(self, **kwargs):
+        response = super().portal_my_invoices(**kwargs)
+        self._prefetch_fiscal_fields(response, 'invoices')
+        return response
+
+    @http.route(readonly=_portal_page_readonly)
+    def portal_my_invoice_detail(self, invoice_id, **kw):
+        return super().portal_my_invoice_detail(invoice_id, **kw)
+
+    @http.route(['/my/orders/<int:order_id>'], type='http', auth="user", website=True, readonly=_portal_page_readonly)
     def portal_order_page(self, order_id, **kw):
         response = super().portal_order_page(order_id, **kw)
-        order = request.env['sale.order'].browse(order_id)
+        qcontext = getattr(response, 'qcontext', None)
         # qui aggiungi i campi personalizzati ai valori del template
-        if response.qcontext:
-            response.qcontext.update({
+        if qcontext and qcontext.get('sale_order'):
+            order = qcontext['sale_order']
+            order.fetch(PORTAL_FISCAL_FIELDS)
+            qcontext.update({
                 'cassa_amount': order.cassa_amount,
                 'cassa_percent': order.cassa_percent,
                 'withholding_amount': order.withholding_amount,
@@ -22,4 +78,3 @@ class CustomerPortalExtended(CustomerPortal):
                 'total_gross': order.total_gross,
             })
         return response
-
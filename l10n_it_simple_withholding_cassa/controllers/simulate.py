@@ -0,0 +1,31 @@
+from werkzeug.exceptions import BadRequest, Forbidden
+
+from odoo import http
+from odoo.http import request
+
+MAX_ITEMS = 1000
+
+
+class FiscalSimulationController(http.Controller):
+
+    @http.route('/l10n_it_withholding/simulate', type='json', auth='user', methods=['POST'], readonly=True)
+    def simulate(self, items, company_id=None, **kw):
+        """Simula cassa, IVA, ritenuta e netto senza creare documenti
+
+        Parametri JSON-RPC: ``items`` (lista, vedi
+        ``res.company._l10n_it_simulate_fiscal``) e ``company_id`` facoltativo
+        (default: azienda corrente dell'utente). La route gira su un cursore
+        in sola lettura e non scrive nulla.
+        """
+        if not isinstance(items, list) or len(items) > MAX_ITEMS:
+            raise BadRequest(f"'items' deve essere una lista di al massimo {MAX_ITEMS} elementi")
+        company = request.env.company
+        if company_id:
+            company = request.env['res.company'].browse(int(company_id))
+            if company not in request.env.user.company_ids:
+                raise Forbidden()
+        return {
+            'company_id': company.id,
+            'currency': company.currency_id.name,
+            'items': company._l10n_it_simulate_fiscal(items),
+        }
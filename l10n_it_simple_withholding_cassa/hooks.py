@@ -0,0 +1,140 @@
+"""Installazione e aggiornamento su basi dati grandi
+
+Le colonne dei campi fiscali vengono create prima che l'ORM carichi i
+modelli: così Odoo non lancia il ricalcolo dei campi memorizzati su tutti i
+record esistenti. Le colonne vengono poi riempite con UPDATE SQL a blocchi
+di id (valori costanti per i documenti senza cassa/ritenuta) e solo i
+documenti interessati passano dal ricalcolo ORM a blocchi.
+"""
+import logging
+
+from odoo.tools import sql
+
+from .tools import recompute_fields
+
+_logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 50000
+
+INVOICE_TYPES = "('out_invoice', 'out_refund', 'in_invoice', 'in_refund', 'out_receipt', 'in_receipt')"
+
+# tabella -> (modello, [(colonna, tipo SQL, valore di default SQL)], campi calcolati, condizione SQL
+# dei record da ricalcolare con l'ORM)
+FISCAL_COLUMNS = {
+    'account_move': (
+        'account.move',
+        [
+            ('apply_withholding', 'boolean', 'FALSE'),
+            ('withholding_percent', 'double precision', '20.0'),
+            ('apply_cassa', 'boolean', 'FALSE'),
+            ('cassa_percent', 'double precision', '4.0'),
+            ('cassa_amount', 'numeric', '0'),
+            ('withholding_amount', 'numeric', '0'),
+            ('total_gross', 'numeric', f"CASE WHEN move_type IN {INVOICE_TYPES} THEN amount_total ELSE 0 END"),
+            ('amount_total_gross', 'numeric', f"CASE WHEN move_type IN {INVOICE_TYPES} THEN amount_total ELSE 0 END"),
+            ('net_amount', 'numeric', f"CASE WHEN move_type IN {INVOICE_TYPES} THEN amount_total ELSE 0 END"),
+        ],
+        ['cassa_amount', 'total_gross', 'withholding_amount', 'net_amount', 'amount_total_gross'],
+        """apply_withholding OR apply_cassa OR EXISTS (
+               SELECT 1 FROM account_move_line l
+                WHERE l.move_id = account_move.id
+                  AND (l.name LIKE 'Cassa previdenziale%' OR l.name LIKE 'Ritenuta d''acconto%'))""",
+    ),
+    'sale_order': (
+        'sale.order',
+        [
+            ('apply_withholding', 'boolean', 'FALSE'),
+            ('withholding_percent', 'double precision', '20.0'),
+            ('apply_cassa', 'boolean', 'FALSE'),
+            ('cassa_percent', 'double precision', '4.0'),
+            ('cassa_amount', 'numeric', '0'),
+            ('withholding_amount', 'numeric', '0'),
+            ('total_gross', 'numeric', 'amount_total'),
+            ('net_amount', 'numeric', 'amount_total'),
+            ('cassa_invoiced_amount', 'numeric', '0'),
+            ('withholding_invoiced_amount', 'numeric', '0'),
+        ],
+        ['amount_untaxed', 'cassa_amount', 'amount_tax', 'total_gross',
+         'withholding_amount', 'net_amount', 'amount_total',
+         'cassa_invoiced_amount', 'withholding_invoiced_amount'],
+        """apply_withholding OR apply_cassa OR EXISTS (
+               SELECT 1 FROM sale_order_line l
+                WHERE l.order_id = sale_order.id AND l.name LIKE '[AUTO]%')""",
+    ),
+    'sale_subscription': (
+        'sale.subscription',
+        [
+            ('apply_withholding', 'boolean', 'FALSE'),
+            ('withholding_percent', 'double precision', '20.0'),
+            ('apply_cassa', 'boolean', 'FALSE'),
+            ('cassa_percent', 'double precision', '4.0'),
+            ('cassa_amount', 'numeric', '0'),
+            ('withholding_amount', 'numeric', '0'),
+            ('total_gross', 'numeric', 'recurring_total'),
+            ('net_amount', 'numeric', 'recurring_total'),
+            ('net_mrr', 'numeric', 'recurring_monthly'),
+            ('cassa_mrr', 'numeric', '0'),
+        ],
+        ['cassa_amount', 'withholding_amount', 'total_gross', 'net_amount', 'net_mrr', 'cassa_mrr'],
+        "apply_withholding OR apply_cassa",
+    ),
+}
+
+# Colonne create in anticipo ma lasciate vuote sui documenti esistenti
+# (nessun profilo: restano le aliquote già memorizzate)
+EMPTY_COLUMNS = [
+    ('fiscal_profile_id', 'int4', None),
+]
+
+
+def add_fiscal_columns(cr):
+    """Crea le colonne mancanti (nullable, senza default: l'aggiunta è immediata)"""
+    for table, (_model, columns, _fnames, _condition) in FISCAL_COLUMNS.items():
+        if not sql.table_exists(cr, table):
+            continue
+        for column, column_type, _default in columns + EMPTY_COLUMNS:
+            if not sql.column_exists(cr, table, column):
+                sql.create_column(cr, table, column, column_type)
+                _logger.info("Colonna %s.%s creata", table, column)
+
+
+def backfill_fiscal_columns(env):
+    """Riempie le colonne ancora vuote e ricalcola solo i documenti interessati"""
+    cr = env.cr
+    for table, (model, columns, fnames, condition) in FISCAL_COLUMNS.items():
+        if not sql.table_exists(cr, table):
+            continue
+        columns = [col for col in columns if sql.column_exists(cr, table, col[0])]
+        missing = " OR ".join(f"{column} IS NULL" for column, _type, _default in columns)
+
+        # Documenti con cassa/ritenuta da ricalcolare, individuati prima di
+        # riempire i flag con i valori di default
+        cr.execute(f"SELECT id FROM {table} WHERE ({missing}) AND ({condition})")
+        affected_ids = [row[0] for row in cr.fetchall()]
+
+        cr.execute(f"SELECT MIN(id), MAX(id) FROM {table} WHERE {missing}")
+        min_id, max_id = cr.fetchone()
+        if min_id is None:
+            continue
+        assignments = ", ".join(
+            f"{column} = COALESCE({column}, {default})" for column, _type, default in columns)
+        updated = 0
+        for start in range(min_id, max_id + 1, CHUNK_SIZE):
+            cr.execute(
+                f"UPDATE {table} SET {assignments} WHERE id >= %s AND id < %s AND ({missing})",
+                [start, start + CHUNK_SIZE])
+            updated += cr.rowcount
+            _logger.info("%s: id %s-%s, %s record valorizzati (max id %s)",
+                         table, start, start + CHUNK_SIZE - 1, updated, max_id)
+
+        if affected_ids:
+            _logger.info("%s: %s documenti con cassa/ritenuta da ricalcolare", table, len(affected_ids))
+            recompute_fields(env, model, affected_ids, fnames)
+
+
+def pre_init_hook(env):
+    add_fiscal_columns(env.cr)
+
+
+def post_init_hook(env):
+    backfill_fiscal_columns(env)
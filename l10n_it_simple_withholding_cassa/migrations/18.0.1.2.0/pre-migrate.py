@@ -0,0 +1,5 @@
+from odoo.addons.l10n_it_simple_withholding_cassa.hooks import add_fiscal_columns
+
+
+def migrate(cr, version):
+    add_fiscal_columns(cr)
@@ -0,0 +1,7 @@
+from odoo import api, SUPERUSER_ID
+from odoo.addons.l10n_it_simple_withholding_cassa.hooks import backfill_fiscal_columns
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    backfill_fiscal_columns(env)
@@ -1,5 +1,18 @@
+from . import fiscal_profile
 from . import account_move_line
+from . import account_tax
 from . import res_company
+from . import res_currency
+from . import res_partner
 from . import sale_order
+from . import sale_order_line
 from . import account_move
-from . import sale_subscription
\ No newline at end of file
+from . import account_move_fiscal_breakdown
+from . import account_move_fatturapa
+from . import account_bank_statement_line
+from . import sale_subscription
+from . import sale_subscription_fiscal_mrr
+from . import fiscal_batch
+from . import ir_actions_report
+
+from . import fiscal_check
@@ -0,0 +1,189 @@
+from odoo import models, api, Command, _
+from odoo.tools import float_compare, float_is_zero, float_round
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class AccountBankStatementLine(models.Model):
+    _inherit = 'account.bank.statement.line'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Override create per la riconciliazione automatica sul Netto a Pagare"""
+        lines = super().create(vals_list)
+        to_match = lines.filtered(lambda l: l.company_id.withholding_auto_match)
+        if to_match:
+            to_match._l10n_it_match_net_amount()
+        return lines
+
+    def _l10n_it_get_net_amount_candidates(self):
+        """Fatture aperte con ritenuta per (azienda, cliente, importo netto)
+
+        Una sola query per tutte le righe dell'estratto conto. Le fatture non
+        pagate si abbinano sul Netto a Pagare (indice parziale
+        account_move_net_amount_match_idx), quelle pagate in parte sul
+        residuo, con o senza la ritenuta.
+        Restituisce {(company_id, partner_id, importo): [move_id, ...]} con le
+        fatture ordinate per scadenza.
+        """
+        keys = {
+            (line.company_id.id, line.partner_id.commercial_partner_id.id,
+             float_round(line.amount, precision_rounding=line.currency_id.rounding))
+            for line in self
+        }
+        if not keys:
+            return {}
+        company_ids, partner_ids, amounts = zip(*keys)
+        self.env['account.move'].flush_model([
+            'company_id', 'commercial_partner_id', 'net_amount', 'move_type',
+            'state', 'apply_withholding', 'payment_state', 'amount_residual', 'withholding_amount',
+        ])
+        self.env.cr.execute("""
+            SELECT k.company_id, k.partner_id, k.amount,
+                   ARRAY_AGG(am.id ORDER BY am.invoice_date_due, am.id)
+              FROM UNNEST(%s::int[], %s::int[], %s::numeric[]) AS k(company_id, partner_id, amount)
+              JOIN account_move am
+                ON am.company_id = k.company_id
+               AND am.commercial_partner_id = k.partner_id
+             WHERE am.move_type = 'out_invoice'
+               AND am.state = 'posted'
+               AND am.apply_withholding
+               AND (
+                    (am.payment_state = 'not_paid' AND am.net_amount = k.amount)
+                    OR (am.payment_state = 'partial'
+                        AND k.amount IN (am.amount_residual, am.amount_residual - am.withholding_amount))
+               )
+          GROUP BY k.company_id, k.partner_id, k.amount
+        """, [list(company_ids), list(partner_ids), list(amounts)])
+        return {
+            (company_id, partner_id, float(amount)): move_ids
+            for company_id, partner_id, amount, move_ids in self.env.cr.fetchall()
+        }
+
+    def _l10n_it_prepare_net_amount_lines(self, invoice, receivable_lines):
+        """Righe che sostituiscono la contropartita sospesa del movimento di banca
+
+        Se il residuo della fattura comprende ancora la ritenuta (fattura
+        senza riga di ritenuta, non pagata o pagata in parte), la differenza
+        rispetto all'incasso viene girata sul conto ritenute.
+        """
+        self.ensure_one()
+        currency = self.currency_id
+        residual = sum(receivable_lines.mapped('amount_residual'))
+        difference = residual - self.amount
+        if float_is_zero(difference, precision_rounding=currency.rounding):
+            withholding = 0.0
+        elif float_compare(difference, invoice.withholding_amount, precision_rounding=currency.rounding) == 0:
+            withholding = difference
+        else:
+            return None
+
+        account = receivable_lines[0].account_id
+        partner = invoice.commercial_partner_id
+        vals_list = [{
+            'name': invoice.name,
+            'account_id': account.id,
+            'partner_id': partner.id,
+            'balance': -self.amount,
+            'amount_currency': -self.amount,
+            'currency_id': currency.id,
+        }]
+        if withholding:
+            withholding_account = invoice._get_fiscal_account('withholding')
+            if not withholding_account:
+                return None
+            vals_list += [{
+                'name': _("Ritenuta d'acconto %s", invoice.name),
+                'account_id': withholding_account.id,
+                'partner_id': partner.id,
+                'balance': withholding,
+                'amount_currency': withholding,
+                'currency_id': currency.id,
+            }, {
+                'name': _("Ritenuta d'acconto %s", invoice.name),
+                'account_id': account.id,
+                'partner_id': partner.id,
+                'balance': -withholding,
+                'amount_currency': -withholding,
+                'currency_id': currency.id,
+            }]
+        return vals_list
+
+    def _l10n_it_match_net_amount(self):
+        """Riconcilia le righe di estratto conto con le fatture sul Netto a Pagare
+
+        Restituisce le righe riconciliate.
+        """
+        lines = self.filtered(lambda l: (
+            not l.is_reconciled
+            and l.partner_id
+            and l.amount > 0
+            and not l.foreign_currency_id
+            and l.currency_id == l.company_id.currency_id
+        ))
+        candidates = lines._l10n_it_get_net_amount_candidates()
+        if not candidates:
+            return self.browse()
+
+        invoices = self.env['account.move'].browse(
+            {move_id for move_ids in candidates.values() for move_id in move_ids})
+        used = set()
+        matched = self.browse()
+        reconcile_plan = []
+        for line in lines:
+            key = (line.company_id.id, line.partner_id.commercial_partner_id.id,
+                   float_round(line.amount, precision_rounding=line.currency_id.rounding))
+            invoice = next(
+                (invoices.browse(move_id) for move_id in candidates.get(key, []) if move_id not in used),
+                None)
+            if not invoice or invoice.currency_id != line.currency_id:
+                continue
+            receivable_lines = invoice.line_ids.filtered(
+                lambda l: l.account_id.account_type == 'asset_receivable' and not l.reconciled)
+            if not receivable_lines:
+                continue
+            vals_list = line._l10n_it_prepare_net_amount_lines(invoice, receivable_lines)
+            if not vals_list:
+                continue
+
+            # La contropartita sospesa viene sostituita sul movimento già
+            # registrato, come fa la riconciliazione standard: nessun
+            # ritorno in bozza né nuova validazione del movimento di banca
+            _liquidity_lines, suspense_lines, _other_lines = line._seek_for_lines()
+            move = line.move_id.with_context(
+                skip_account_move_synchronization=True,
+                skip_readonly_check=True,
+                force_delete=True,
+            )
+            existing = move.line_ids
+            move.write({
+                'partner_id': invoice.commercial_partner_id.id,
+                'line_ids': [Command.unlink(l.id) for l in suspense_lines]
+                            + [Command.create(vals) for vals in vals_list],
+            })
+
+            new_receivable = (move.line_ids - existing).filtered(
+                lambda l: l.account_id == receivable_lines[0].account_id)
+            reconcile_plan.append(receivable_lines + new_receivable)
+            used.add(invoice.id)
+            matched |= line
+
+        if reconcile_plan:
+            # Un solo piano per tutte le righe abbinate
+            self.env['account.move.line']._reconcile_plan(reconcile_plan)
+        _logger.info("Riconciliazione su netto a pagare: %s/%s righe abbinate", len(matched), len(self))
+        return matched
+
+    def action_l10n_it_match_net_amount(self):
+        matched = self._l10n_it_match_net_amount()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success' if matched else 'warning',
+                'message': _("%(matched)s righe su %(total)s riconciliate sul Netto a Pagare.",
+                             matched=len(matched), total=len(self)),
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
@@ -1,21 +1,13 @@
 from odoo import models, fields, api
-from odoo.tools import float_round
+from odoo.tools import float_is_zero, float_round
+from odoo.tools.sql import create_index
 
+from ..tools import compute_fiscal_totals
 
-class AccountMove(models.Model):
-    _inherit = 'account.move'
-
-    apply_withholding = fields.Boolean(
-        string="Applica Ritenuta d'acconto",
-        default=lambda self: self.env.company.enable_withholding_tax,
-    )
-    withholding_percent = fields.Float(string="Ritenuta %", default=20.0)
 
-    apply_cassa = fields.Boolean(
-        string="Applica Cassa Previdenziale",
-        default=lambda self: self.env.company.enable_cassa_previdenziale,
-    )
-    cassa_percent = fields.Float(string="Cassa %", default=4.0)
+class AccountMove(models.Model):
+    _name = 'account.move'
+    _inherit = ['account.move', 'l10n_it.fiscal.profile.mixin']
 
     cassa_amount = fields.Monetary(
         string="Importo Cassa Previdenziale",
@@ -39,6 +31,38 @@ class AccountMove(models.Model):
         string='Netto a Pagare',
         compute="_compute_fiscal_amounts", store=True)
 
+    fiscal_breakdown_ids = fields.One2many(
+        'account.move.fiscal.breakdown', 'move_id',
+        string="Ripartizione cassa per aliquota", readonly=True, copy=False)
+
+    vat_label = fields.Char(string="Etichetta IVA", compute='_compute_vat_label')
+
+    fiscal_from_order = fields.Boolean(
+        string="Cassa e ritenuta ripartite dall'ordine", readonly=True, copy=False,
+        help="Fattura parziale o d'acconto: cassa e ritenuta sono la quota dell'ordine "
+             "e non vengono ricalcolate dalle aliquote")
+
+    # Copie in cache dei PDF (vedi ir.actions.report), riservate agli amministratori
+    l10n_it_pdf_cache = fields.Binary(
+        string="PDF in cache", attachment=True, copy=False, groups='base.group_system')
+
+    def init(self):
+        super().init()
+        # Ricerca delle fatture aperte per (azienda, cliente, netto a pagare)
+        # usata dalla riconciliazione bancaria
+        create_index(
+            self.env.cr,
+            'account_move_net_amount_match_idx',
+            self._table,
+            ['company_id', 'commercial_partner_id', 'net_amount'],
+            where="move_type = 'out_invoice' AND state = 'posted' AND apply_withholding",
+        )
+
+    @api.depends('fiscal_breakdown_ids.tax_ids', 'invoice_line_ids.tax_ids')
+    def _compute_vat_label(self):
+        for move in self:
+            move.vat_label = (move.fiscal_breakdown_ids.tax_ids | move.invoice_line_ids.tax_ids)._l10n_it_vat_label()
+
     @api.depends('total_gross')
     def _compute_amount_total_gross(self):
         for move in self:
@@ -50,55 +74,98 @@ class AccountMove(models.Model):
         'withholding_percent',
         'apply_cassa',
         'cassa_percent',
+        'fiscal_from_order',
+        'fiscal_breakdown_ids.cassa_amount',
     )
     def _compute_fiscal_amounts(self):
         for move in self:
-            # Calcola solo per le righe normali (escluse quelle fiscali auto-generate)
-            normal_lines = move.invoice_line_ids.filtered(
-                lambda l: not self._is_fiscal_line(l)
-            )
-
-            amount_untaxed = sum(line.price_subtotal for line in normal_lines)
-
-            # Calcolo Cassa Previdenziale
-            cassa_amount = 0.0
-            if move.apply_cassa:
-                cassa_amount = float_round(
-                    amount_untaxed * move.cassa_percent / 100.0,
-                    precision_rounding=move.currency_id.rounding
-                )
-
-            base_imponibile = amount_untaxed + cassa_amount
-
-            # Calcolo IVA su base con cassa
-            amount_tax = 0.0
-            for line in normal_lines:
-                base_line = line.price_subtotal
-                if move.apply_cassa:
-                    base_line += base_line * move.cassa_percent / 100.0
-
-                line_taxes = line.tax_ids.filtered(lambda t: t.amount_type == 'percent')
-                line_tax_amount = sum(base_line * t.amount / 100.0 for t in line_taxes)
-                amount_tax += line_tax_amount
-
-            amount_tax = float_round(amount_tax, precision_rounding=move.currency_id.rounding)
-            total_gross = base_imponibile + amount_tax
-
-            # Calcolo Ritenuta d'acconto
-            withholding_amount = 0.0
-            if move.apply_withholding:
-                withholding_amount = float_round(
-                    base_imponibile * move.withholding_percent / 100.0,
-                    precision_rounding=move.currency_id.rounding
-                )
-
-            total_net = float_round(total_gross - withholding_amount, precision_rounding=move.currency_id.rounding)
-
-            # Assegno i valori calcolati ai campi
-            move.cassa_amount = cassa_amount
-            move.total_gross = total_gross
-            move.withholding_amount = withholding_amount
-            move.net_amount = total_net
+            move.update(move._prepare_fiscal_amounts())
+
+    def _prepare_fiscal_amounts(self):
+        """Calcola gli importi fiscali senza scriverli
+
+        Restituisce un dizionario con cassa_amount, total_gross,
+        withholding_amount e net_amount. Per le fatture ripartite dall'ordine
+        cassa e ritenuta sono quelle delle righe fiscali.
+        """
+        self.ensure_one()
+        # Calcola solo per le righe normali (escluse quelle fiscali auto-generate)
+        normal_lines = self.invoice_line_ids.filtered(
+            lambda l: not self._is_fiscal_line(l)
+        )
+        order_amounts = {}
+        if self.fiscal_from_order:
+            withholding_lines = (self.invoice_line_ids - normal_lines).filtered(
+                lambda l: 'Ritenuta d\'acconto' in l.name)
+            order_amounts = {
+                'cassa_amount': sum(self.fiscal_breakdown_ids.mapped('cassa_amount')),
+                'withholding_amount': -sum(withholding_lines.mapped('price_subtotal')),
+            }
+        totals = compute_fiscal_totals(
+            [
+                (line.price_subtotal, line.tax_ids.filtered(lambda t: t.amount_type == 'percent').mapped('amount'))
+                for line in normal_lines
+            ],
+            self.apply_cassa, self.cassa_percent,
+            self.apply_withholding, self.withholding_percent,
+            self.currency_id.rounding,
+            **order_amounts,
+        )
+        return {fname: totals[fname] for fname in ('cassa_amount', 'total_gross', 'withholding_amount', 'net_amount')}
+
+    def _prepare_cassa_breakdown(self, lines=None, cassa_total=None):
+        """Ripartisce la cassa previdenziale per gruppo di imposte in un solo passaggio
+
+        Restituisce una lista di dizionari (uno per insieme di imposte delle
+        righe prodotto) con imponibile, cassa e IVA sulla cassa. Il residuo di
+        arrotondamento va sul gruppo con imponibile maggiore, così la somma
+        coincide con ``cassa_amount``. Se il profilo fiscale indica un'imposta
+        per la cassa, tutta la cassa confluisce in quel gruppo. Con
+        ``cassa_total`` (quota dell'ordine) la cassa da ripartire è quella
+        indicata invece della percentuale sull'imponibile di ``lines``.
+        """
+        self.ensure_one()
+        if not (self.apply_cassa and self.cassa_percent):
+            return []
+        rounding = self.currency_id.rounding
+        cassa_taxes = self.fiscal_profile_id.cassa_tax_id
+
+        groups = {}
+        for line in self.invoice_line_ids if lines is None else lines:
+            if line.display_type != 'product' or self._is_fiscal_line(line):
+                continue
+            taxes = cassa_taxes or line.tax_ids
+            key = ','.join(str(tax_id) for tax_id in sorted(taxes.ids))
+            group = groups.setdefault(key, {'tax_key': key, 'taxes': taxes, 'base_amount': 0.0})
+            group['base_amount'] += line.price_subtotal
+
+        base_total = sum(group['base_amount'] for group in groups.values())
+        if cassa_total is None:
+            ratio = self.cassa_percent / 100.0
+        else:
+            ratio = cassa_total / base_total if base_total else 0.0
+        rows = []
+        for group in groups.values():
+            if float_is_zero(group['base_amount'], precision_rounding=rounding):
+                continue
+            taxes = group.pop('taxes')
+            rows.append(dict(
+                group,
+                tax_ids=taxes.ids,
+                tax_rate=self._l10n_it_tax_rate(taxes),
+                nature=self._l10n_it_tax_nature(taxes),
+                cassa_amount=float_round(group['base_amount'] * ratio, precision_rounding=rounding),
+            ))
+        if rows:
+            total = float_round(base_total * ratio if cassa_total is None else cassa_total,
+                                precision_rounding=rounding)
+            residual = total - sum(row['cassa_amount'] for row in rows)
+            if not float_is_zero(residual, precision_rounding=rounding):
+                max(rows, key=lambda row: abs(row['base_amount']))['cassa_amount'] += residual
+        for row in rows:
+            row['tax_amount'] = float_round(row['cassa_amount'] * row['tax_rate'] / 100.0,
+                                            precision_rounding=rounding)
+        return rows
 
     def _is_fiscal_line(self, line):
         """Identifica se una riga è una riga fiscale auto-generata"""
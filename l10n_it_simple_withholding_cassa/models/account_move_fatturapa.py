@@ -0,0 +1,165 @@
+from collections import defaultdict
+
+from odoo import models
+from odoo.tools import float_round
+
+from ..tools import fiscal_code
+
+# Codici FatturaPA
+CASSA_TYPE = 'TC22'          # INPS
+WITHHOLDING_TYPE = 'RT01'    # Ritenuta persone fisiche
+WITHHOLDING_REASON = 'A'     # Prestazioni di lavoro autonomo
+DEFAULT_NATURE = 'N2.2'      # Operazioni non soggette - altri casi
+PROGRESSIVE_SEQUENCE = 'l10n_it.fatturapa.progressive'
+
+
+def _progressive(number):
+    """Progressivo invio alfanumerico di 5 caratteri (base 36)"""
+    digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    result = ''
+    while number:
+        number, remainder = divmod(number, 36)
+        result = digits[remainder] + result
+    return result.rjust(5, '0')[-5:]
+
+
+class AccountMoveFatturaPA(models.Model):
+    """Dati per l'esportazione FatturaPA con DatiRitenuta e DatiCassaPrevidenziale"""
+    _inherit = 'account.move'
+
+    def _l10n_it_fatturapa_address(self, partner):
+        return {
+            'street': ' '.join(filter(None, [partner.street, partner.street2])),
+            'zip': partner.zip,
+            'city': partner.city,
+            'state': partner.state_id.code if partner.country_id.code == 'IT' else False,
+            'country': partner.country_id.code,
+        }
+
+    def _l10n_it_tax_rate(self, taxes):
+        return sum(taxes.filtered(lambda t: t.amount_type == 'percent').mapped('amount'))
+
+    def _l10n_it_tax_nature(self, taxes):
+        if 'l10n_it_exempt_reason' in taxes._fields:
+            return taxes[:1].l10n_it_exempt_reason or DEFAULT_NATURE
+        return DEFAULT_NATURE
+
+    def _l10n_it_tax_by_rate(self):
+        """Imposta per aliquota dalle righe IVA della fattura, nel segno del documento"""
+        tax_by_rate = defaultdict(float)
+        for line in self.line_ids.filtered(lambda l: l.display_type == 'tax'):
+            tax_by_rate[self._l10n_it_tax_rate(line.tax_line_id)] += line.amount_currency * self.direction_sign
+        return tax_by_rate
+
+    def _l10n_it_next_progressive(self):
+        """Progressivo invio dalla sequenza dedicata: unico per ogni file trasmesso"""
+        number = self.env['ir.sequence'].sudo().next_by_code(PROGRESSIVE_SEQUENCE)
+        return _progressive(int(number))
+
+    def _l10n_it_fatturapa_payload(self, progressive):
+        """Restituisce un dizionario con tutti i dati della fattura
+
+        Il dizionario contiene solo tipi semplici, così la generazione
+        dell'XML avviene fuori dall'ORM. ``progressive`` è il progressivo
+        invio assegnato dall'esportazione (vedi ``_l10n_it_next_progressive``).
+        """
+        self.ensure_one()
+        company = self.company_id
+        partner = self.commercial_partner_id
+        rounding = self.currency_id.rounding
+        company_vat = fiscal_code(company.vat)
+
+        normal_lines = self.invoice_line_ids.filtered(
+            lambda l: l.display_type == 'product' and not self._is_fiscal_line(l)
+        )
+
+        lines = []
+        base_by_rate = defaultdict(float)
+        nature_by_rate = {}
+        for sequence, line in enumerate(normal_lines, start=1):
+            rate = self._l10n_it_tax_rate(line.tax_ids)
+            nature = self._l10n_it_tax_nature(line.tax_ids)
+            base_by_rate[rate] += line.price_subtotal
+            nature_by_rate.setdefault(rate, nature)
+            lines.append({
+                'sequence': sequence,
+                'name': (line.name or line.product_id.display_name or '-')[:1000],
+                'quantity': line.quantity,
+                'price_unit': line.price_unit * (1 - (line.discount or 0.0) / 100.0),
+                'price_subtotal': line.price_subtotal,
+                'tax_rate': rate,
+                'nature': nature,
+            })
+
+        # Cassa previdenziale ripartita per aliquota IVA: si usa la
+        # ripartizione memorizzata, ricalcolata solo per le fatture che non
+        # ce l'hanno (es. validate prima dell'aggiornamento del modulo)
+        cassa = []
+        summary_base = dict(base_by_rate)
+        breakdown = [{
+            'base_amount': row.base_amount,
+            'cassa_amount': row.cassa_amount,
+            'tax_rate': row.tax_rate,
+            'nature': row.nature,
+        } for row in self.fiscal_breakdown_ids] or self._prepare_cassa_breakdown()
+        for row in breakdown:
+            rate = row['tax_rate']
+            summary_base[rate] = summary_base.get(rate, 0.0) + row['cassa_amount']
+            nature_by_rate.setdefault(rate, row['nature'] or DEFAULT_NATURE)
+            cassa.append({
+                'type': CASSA_TYPE,
+                'percent': self.cassa_percent,
+                'amount': row['cassa_amount'],
+                'base': row['base_amount'],
+                'tax_rate': rate,
+                'nature': row['nature'] or nature_by_rate[rate],
+            })
+
+        # L'imposta è quella registrata nelle righe IVA, non imponibile per aliquota
+        tax_by_rate = self._l10n_it_tax_by_rate()
+        summary = [{
+            'tax_rate': rate,
+            'nature': nature_by_rate[rate],
+            'base': float_round(base, precision_rounding=rounding),
+            'tax': float_round(tax_by_rate.get(rate, 0.0), precision_rounding=rounding),
+        } for rate, base in summary_base.items()]
+
+        withholding = False
+        if self.apply_withholding and self.withholding_amount:
+            withholding = {
+                'type': WITHHOLDING_TYPE,
+                'amount': self.withholding_amount,
+                'percent': self.withholding_percent,
+                'reason': WITHHOLDING_REASON,
+            }
+
+        return {
+            'filename': f"IT{company_vat}_{progressive}.xml",
+            'progressive': progressive,
+            'document_type': 'TD04' if self.move_type == 'out_refund' else 'TD01',
+            'currency': self.currency_id.name,
+            'date': (self.invoice_date or self.date).isoformat(),
+            'date_due': self.invoice_date_due and self.invoice_date_due.isoformat(),
+            'number': self.name,
+            'amount_total': self.total_gross,
+            'net_amount': self.net_amount,
+            'company': dict(
+                self._l10n_it_fatturapa_address(company.partner_id),
+                name=company.name,
+                vat=company_vat,
+                country=company.country_id.code or 'IT',
+                tax_regime=company['l10n_it_tax_system'] if 'l10n_it_tax_system' in company._fields else 'RF01',
+                iban=company.bank_ids[:1].sanitized_acc_number,
+            ),
+            'partner': dict(
+                self._l10n_it_fatturapa_address(partner),
+                name=partner.name,
+                vat=fiscal_code(partner.vat),
+                fiscal_code=partner['l10n_it_codice_fiscale'] if 'l10n_it_codice_fiscale' in partner._fields else False,
+                destination_code=(partner['l10n_it_pa_index'] if 'l10n_it_pa_index' in partner._fields else False) or '0000000',
+            ),
+            'withholding': withholding,
+            'cassa': cassa,
+            'lines': lines,
+            'summary': summary,
+        }
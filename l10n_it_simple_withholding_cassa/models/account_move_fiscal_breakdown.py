@@ -0,0 +1,32 @@
+from odoo import models, fields
+
+
+class AccountMoveFiscalBreakdown(models.Model):
+    """Ripartizione della cassa previdenziale per gruppo di imposte
+
+    Una riga per (fattura, insieme di imposte), scritta dalla sincronizzazione
+    delle righe fiscali: report, esportazione XML e liquidazioni IVA leggono
+    questi valori invece di ricalcolare la ripartizione documento per
+    documento.
+    """
+    _name = 'account.move.fiscal.breakdown'
+    _description = "Ripartizione cassa previdenziale per aliquota IVA"
+    _order = 'move_id, tax_rate desc, id'
+
+    move_id = fields.Many2one('account.move', string="Fattura", required=True, ondelete='cascade', index=True)
+    company_id = fields.Many2one(related='move_id.company_id', store=True, index=True)
+    currency_id = fields.Many2one(related='move_id.currency_id')
+    tax_key = fields.Char(
+        string="Chiave imposte", required=True,
+        help="Id delle imposte del gruppo, ordinati e separati da virgola")
+    tax_ids = fields.Many2many('account.tax', string="Imposte")
+    tax_rate = fields.Float(string="Aliquota IVA", help="Somma delle aliquote percentuali del gruppo")
+    nature = fields.Char(string="Natura", help="Natura dell'operazione per i gruppi senza IVA (FatturaPA)")
+    base_amount = fields.Monetary(string="Imponibile righe")
+    cassa_amount = fields.Monetary(string="Importo cassa")
+    tax_amount = fields.Monetary(string="IVA sulla cassa")
+
+    _sql_constraints = [
+        ('move_tax_key_uniq', 'unique(move_id, tax_key)',
+         "Esiste già una ripartizione per queste imposte nella fattura."),
+    ]
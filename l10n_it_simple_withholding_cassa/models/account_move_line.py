@@ -1,4 +1,13 @@
+from collections import defaultdict
+
 from odoo import models, fields, api
+from odoo.tools import float_compare, str2bool
+import logging
+
+_logger = logging.getLogger(__name__)
+
+VERIFY_REVERSAL_PARAM = 'l10n_it_simple_withholding_cassa.verify_reversal'
+FISCAL_AMOUNT_FIELDS = ('cassa_amount', 'total_gross', 'withholding_amount', 'net_amount')
 
 
 class AccountMoveLine(models.Model):
@@ -98,16 +107,22 @@ class AccountMoveWithFiscalLines(models.Model):
         if self.env.context.get('updating_fiscal_lines'):
             return
 
+        # Fattura da ordine: si ripartiscono di nuovo le quote dell'ordine
+        if self.fiscal_from_order:
+            self._update_order_fiscal_lines()
+            return
+
         # Crea un nuovo context con il flag per evitare loop
         new_context = dict(self.env.context, updating_fiscal_lines=True, skip_fiscal_update=True)
 
         # Lavora con il nuovo context
         self_with_context = self.with_context(new_context)
 
-        # Rimuovi righe fiscali esistenti
+        # Rimuovi righe fiscali e ripartizione esistenti
         fiscal_lines = self_with_context.invoice_line_ids.filtered(self._is_fiscal_line)
         if fiscal_lines:
             fiscal_lines.unlink()
+        self_with_context.fiscal_breakdown_ids.unlink()
 
         # Calcola la base per le righe fiscali (senza le righe fiscali)
         normal_lines = self_with_context.invoice_line_ids.filtered(lambda l: not self._is_fiscal_line(l))
@@ -116,27 +131,22 @@ class AccountMoveWithFiscalLines(models.Model):
         if not base_amount:
             return
 
-        # Trova il conto e le imposte per le righe fiscali
+        # Trova il conto per le righe fiscali
         default_account = self_with_context._get_default_account()
-        main_tax_ids = self_with_context._get_main_tax_ids(normal_lines)
 
         # Crea le righe fiscali
         lines_to_create = []
 
-        # Riga cassa previdenziale
-        if self.apply_cassa and self.cassa_percent > 0:
-            cassa_amount = base_amount * (self.cassa_percent / 100.0)
-            cassa_account = self_with_context._get_fiscal_account('cassa') or default_account
-
-            if cassa_account:
-                lines_to_create.append({
-                    'name': f'Cassa previdenziale {self.cassa_percent}%',
-                    'account_id': cassa_account.id,
-                    'quantity': 1,
-                    'price_unit': cassa_amount,
-                    'tax_ids': [(6, 0, main_tax_ids)],  # Stesse imposte del prodotto principale
-                    'move_id': self.id,
-                })
+        # Righe cassa previdenziale: una per gruppo di imposte, con la
+        # ripartizione memorizzata per report ed esportazioni
+        breakdown = self_with_context._prepare_cassa_breakdown()
+        cassa_account = self_with_context._get_fiscal_account('cassa') or default_account
+        if breakdown and cassa_account:
+            lines_to_create += self._prepare_cassa_lines_vals(breakdown, cassa_account)
+            self.env['account.move.fiscal.breakdown'].create([
+                dict(row, move_id=self.id, tax_ids=[(6, 0, row['tax_ids'])])
+                for row in breakdown
+            ])
 
         # Riga ritenuta d'acconto
         if self.apply_withholding and self.withholding_percent > 0:
@@ -149,61 +159,207 @@ class AccountMoveWithFiscalLines(models.Model):
             withholding_account = self_with_context._get_fiscal_account('withholding') or default_account
 
             if withholding_account:
-                lines_to_create.append({
-                    'name': f'Ritenuta d\'acconto {self.withholding_percent}%',
-                    'account_id': withholding_account.id,
-                    'quantity': 1,
-                    'price_unit': -withholding_amount,  # Negativo per ridurre il totale
-                    'tax_ids': [(6, 0, [])],  # Nessuna IVA sulla ritenuta
-                    'move_id': self.id,
-                })
+                lines_to_create.append(self._prepare_withholding_line_vals(withholding_amount, withholding_account))
 
         # Crea tutte le righe fiscali in una volta con il context di protezione
         if lines_to_create:
             self.env['account.move.line'].with_context(new_context).create(lines_to_create)
 
+    def _prepare_cassa_lines_vals(self, breakdown, account):
+        """Valori delle righe cassa, una per riga della ripartizione"""
+        self.ensure_one()
+        vals_list = []
+        for row in breakdown:
+            name = f'Cassa previdenziale {self.cassa_percent}%'
+            if len(breakdown) > 1:
+                name += f' - IVA {row["tax_rate"]:g}%' if row['tax_rate'] else f' - {row["nature"]}'
+            vals_list.append({
+                'name': name,
+                'account_id': account.id,
+                'quantity': 1,
+                'price_unit': row['cassa_amount'],
+                'tax_ids': [(6, 0, row['tax_ids'])],
+                'move_id': self.id,
+            })
+        return vals_list
+
+    def _prepare_withholding_line_vals(self, withholding_amount, account):
+        """Valori della riga ritenuta d'acconto"""
+        self.ensure_one()
+        return {
+            'name': f'Ritenuta d\'acconto {self.withholding_percent}%',
+            'account_id': account.id,
+            'quantity': 1,
+            'price_unit': -withholding_amount,  # Negativo per ridurre il totale
+            'tax_ids': [(6, 0, [])],  # Nessuna IVA sulla ritenuta
+            'move_id': self.id,
+        }
+
+    def _get_fiscal_order_lines(self, auto_lines_by_order):
+        """Righe prodotto per ordine con cassa/ritenuta: {ordine: righe}, o None
+
+        ``auto_lines_by_order`` sono le righe [AUTO] per ordine (vedi
+        ``sale.order._get_fiscal_auto_lines``), calcolate una volta per
+        passaggio. None se la fattura ha righe non collegate a un unico
+        ordine con righe [AUTO]: in quel caso si usa il calcolo standard.
+        """
+        self.ensure_one()
+        lines_by_order = defaultdict(lambda: self.env['account.move.line'])
+        for line in self.invoice_line_ids:
+            if line.display_type != 'product' or self._is_fiscal_line(line):
+                continue
+            order = line.sale_line_ids.order_id
+            if len(order) != 1 or not any(auto_lines_by_order.get(order, {}).values()):
+                return None
+            lines_by_order[order] |= line
+        return lines_by_order or None
+
+    def _update_order_fiscal_lines(self):
+        """Righe fiscali delle fatture da ordine, ripartite dalle righe [AUTO]
+
+        Per ogni fattura e ordine cassa e ritenuta sono la quota dell'ordine
+        proporzionale all'imponibile fatturato; la fattura che completa
+        l'ordine (l'ultima bozza creata, a ordine fatturato per intero)
+        riceve il residuo non ancora fatturato, così la somma delle fatture
+        (acconti inclusi) coincide con le righe [AUTO] dell'ordine. Se si
+        ripartisce di nuovo un'altra bozza, anche la fattura che completa
+        l'ordine viene ricalcolata, per ultima. Righe e ripartizioni di tutte
+        le fatture vengono scritte con una sola create; le fatture con righe
+        non collegate a un ordine usano il calcolo standard.
+        """
+        moves = self.filtered(lambda m: m.move_type in ['out_invoice', 'out_refund'] and m.state == 'draft')
+        if not moves:
+            return
+        # Righe [AUTO] e fattura che completa l'ordine, una volta per ordine
+        completing_moves = {
+            order: order._get_fiscal_completing_move() for order in moves.invoice_line_ids.sale_line_ids.order_id
+        }
+        moves = (moves | self.browse().union(*completing_moves.values())).sorted('id')
+        orders = moves.invoice_line_ids.sale_line_ids.order_id
+        for order in orders.filtered(lambda o: o not in completing_moves):
+            completing_moves[order] = order._get_fiscal_completing_move()
+        auto_lines_by_order = {order: order._get_fiscal_auto_lines() for order in orders}
+
+        new_context = dict(self.env.context, updating_fiscal_lines=True, skip_fiscal_update=True)
+        moves_ctx = moves.with_context(new_context)
+        moves_ctx.invoice_line_ids.filtered(self._is_fiscal_line).unlink()
+        moves_ctx.fiscal_breakdown_ids.unlink()
+
+        lines_to_create = []
+        breakdown_to_create = []
+        standard_moves = self.browse()
+        # Quote già assegnate in questo passaggio, per ordine
+        pending = defaultdict(lambda: defaultdict(float))
+        for move in moves_ctx:
+            lines_by_order = move._get_fiscal_order_lines(auto_lines_by_order)
+            if not lines_by_order:
+                standard_moves |= move
+                continue
+            rounding = move.currency_id.rounding
+            sign = -1 if move.move_type == 'out_refund' else 1
+            default_account = move._get_default_account()
+            cassa_account = move._get_fiscal_account('cassa') or default_account
+            withholding_account = move._get_fiscal_account('withholding') or default_account
+            breakdown = {}
+            for order, lines in lines_by_order.items():
+                shares = order._get_fiscal_invoice_shares(
+                    sign * sum(lines.mapped('price_subtotal')), moves, pending[order],
+                    completing=move == completing_moves[order])
+                for fiscal_type, amount in shares.items():
+                    pending[order][fiscal_type] += amount
+                auto_lines = auto_lines_by_order[order]
+                cassa_share = sign * shares['cassa']
+                if move.apply_cassa and auto_lines['cassa'] and cassa_account \
+                        and float_compare(cassa_share, 0.0, precision_rounding=rounding):
+                    rows = move._prepare_cassa_breakdown(lines, cassa_total=cassa_share)
+                    for vals in move._prepare_cassa_lines_vals(rows, cassa_account):
+                        vals['sale_line_ids'] = [(6, 0, auto_lines['cassa'].ids)]
+                        lines_to_create.append(vals)
+                    for row in rows:
+                        merged = breakdown.setdefault(row['tax_key'], dict(row, base_amount=0.0, cassa_amount=0.0,
+                                                                          tax_amount=0.0))
+                        for fname in ('base_amount', 'cassa_amount', 'tax_amount'):
+                            merged[fname] += row[fname]
+                withholding_share = sign * shares['withholding']
+                if move.apply_withholding and auto_lines['withholding'] and withholding_account \
+                        and float_compare(withholding_share, 0.0, precision_rounding=rounding):
+                    vals = move._prepare_withholding_line_vals(withholding_share, withholding_account)
+                    vals['sale_line_ids'] = [(6, 0, auto_lines['withholding'].ids)]
+                    lines_to_create.append(vals)
+            breakdown_to_create += [
+                dict(row, move_id=move.id, tax_ids=[(6, 0, row['tax_ids'])]) for row in breakdown.values()
+            ]
+
+        order_moves = moves_ctx - standard_moves
+        order_moves.filtered(lambda m: not m.fiscal_from_order).write({'fiscal_from_order': True})
+        standard_moves.filtered('fiscal_from_order').write({'fiscal_from_order': False})
+        self.env['account.move.fiscal.breakdown'].create(breakdown_to_create)
+        self.env['account.move.line'].with_context(new_context).create(lines_to_create)
+        for move in standard_moves:
+            move.with_env(self.env)._update_fiscal_lines()
+
+    def _reverse_moves(self, default_values_list=None, cancel=False):
+        """Le note di credito copiano righe e importi fiscali dell'originale
+
+        Le righe cassa/ritenuta della nota di credito sono lo specchio di
+        quelle della fattura: vengono copiate con skip_fiscal_update invece di
+        essere cancellate e ricreate, e gli importi memorizzati vengono
+        copiati invece di essere ricalcolati.
+        """
+        reverse_moves = super(
+            AccountMoveWithFiscalLines, self.with_context(skip_fiscal_update=True)
+        )._reverse_moves(default_values_list=default_values_list, cancel=cancel)
+        reverse_moves = reverse_moves.with_env(self.env)
+
+        fiscal_fields = [self._fields[fname] for fname in FISCAL_AMOUNT_FIELDS]
+        for field in fiscal_fields:
+            self.env.remove_to_compute(field, reverse_moves)
+        for move, reverse_move in zip(self, reverse_moves):
+            reverse_move.write({
+                **{fname: move[fname] for fname in FISCAL_AMOUNT_FIELDS},
+                'fiscal_from_order': move.fiscal_from_order,
+            })
+            if move.fiscal_breakdown_ids:
+                move.fiscal_breakdown_ids.copy({'move_id': reverse_move.id})
+
+        if self.env.context.get('verify_fiscal_reversal') or str2bool(
+                self.env['ir.config_parameter'].sudo().get_param(VERIFY_REVERSAL_PARAM, 'False')):
+            reverse_moves._verify_fiscal_amounts()
+        return reverse_moves
+
+    def _verify_fiscal_amounts(self):
+        """Confronta gli importi memorizzati con un ricalcolo da zero
+
+        In caso di differenze registra un avviso e scrive i valori ricalcolati.
+        Restituisce i documenti corretti.
+        """
+        fixed = self.browse()
+        for move in self:
+            expected = move._prepare_fiscal_amounts()
+            rounding = move.currency_id.rounding
+            diff = {
+                fname: value for fname, value in expected.items()
+                if float_compare(move[fname], value, precision_rounding=rounding)
+            }
+            if diff:
+                _logger.warning(
+                    "Importi fiscali di %s diversi dal ricalcolo: %s",
+                    move.display_name,
+                    {fname: (move[fname], value) for fname, value in diff.items()},
+                )
+                move.write(diff)
+                fixed |= move
+        return fixed
+
     def _get_default_account(self):
         """Restituisce un conto di default per le righe fiscali"""
         return self.journal_id.default_account_id
 
-    def _get_main_tax_ids(self, normal_lines):
-        """Restituisce le imposte del prodotto principale"""
-        main_line = normal_lines.filtered(lambda l: l.product_id)[:1]
-        return main_line.tax_ids.ids if main_line else []
-
     def _get_fiscal_account(self, fiscal_type):
-        """Restituisce il conto fiscale configurato"""
-        company = self.env.company
-
-        if fiscal_type == 'cassa':
-            # Conto cassa previdenziale
-            if hasattr(company, 'cassa_account_id') and company.cassa_account_id:
-                return company.cassa_account_id
-            # Fallback: cerca il conto 310200
-            return self.env['account.account'].search([
-                ('code', '=', '310200'),
-            ], limit=1)
-
-        elif fiscal_type == 'withholding':
-            # Conto ritenuta d'acconto
-            if hasattr(company, 'withholding_account_id') and company.withholding_account_id:
-                return company.withholding_account_id
-            # Fallback: cerca il conto 160900
-            return self.env['account.account'].search([
-                ('code', '=', '160900'),
-            ], limit=1)
-
-        return None
-
-    @api.onchange('apply_cassa', 'apply_withholding', 'cassa_percent', 'withholding_percent')
-    def _onchange_fiscal_settings(self):
-        """Aggiorna le righe fiscali quando cambiano le impostazioni"""
-        if self.state == 'draft' and self.move_type in ['out_invoice', 'out_refund']:
-            # Solo messaggio informativo, l'aggiornamento avverrà automaticamente
-            if (self.apply_cassa or self.apply_withholding) and self.invoice_line_ids:
-                return {
-                    'warning': {
-                        'title': 'Aggiornamento Automatico',
-                        'message': 'Le righe fiscali verranno aggiornate automaticamente quando salvi o modifichi le righe prodotto.'
-                    }
-                }
\ No newline at end of file
+        """Restituisce il conto fiscale configurato nell'azienda del documento"""
+        company = self.company_id or self.env.company
+        accounts = company._l10n_it_fiscal_config()['accounts']
+        if fiscal_type not in accounts:
+            return None
+        profile_account = self.fiscal_profile_id[f'{fiscal_type}_account_id']
+        return profile_account or self.env['account.account'].browse(accounts[fiscal_type])
@@ -0,0 +1,39 @@
+from odoo import models, tools
+
+from ..tools import clear_ormcache, vat_label
+
+
+class AccountTax(models.Model):
+    _inherit = 'account.tax'
+
+    TAX_RATE_FIELDS = {'amount', 'amount_type', 'company_id', 'active'}
+
+    @tools.ormcache('tax_id')
+    def _l10n_it_get_tax_rate(self, tax_id):
+        """(azienda, aliquota %) di una imposta, o None se non esiste; in cache
+
+        Le imposte non percentuali valgono 0, come nel calcolo degli importi
+        fiscali delle fatture.
+        """
+        tax = self.sudo().browse(tax_id).exists()
+        if not tax:
+            return None
+        return tax.company_id.id, tax.amount if tax.amount_type == 'percent' else 0.0
+
+    def _l10n_it_vat_label(self):
+        """Etichetta IVA dei totali con le aliquote percentuali di queste imposte"""
+        taxes = self.flatten_taxes_hierarchy().filtered(lambda t: t.amount_type == 'percent')
+        return vat_label(taxes.mapped('amount'))
+
+    def _l10n_it_clear_tax_rate(self):
+        clear_ormcache(self, '_l10n_it_get_tax_rate', [(self, tax_id) for tax_id in self.ids])
+
+    def write(self, vals):
+        res = super().write(vals)
+        if self.TAX_RATE_FIELDS.intersection(vals):
+            self._l10n_it_clear_tax_rate()
+        return res
+
+    def unlink(self):
+        self._l10n_it_clear_tax_rate()
+        return super().unlink()
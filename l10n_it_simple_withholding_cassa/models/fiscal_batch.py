@@ -0,0 +1,126 @@
+import logging
+
+from odoo import api, models
+from odoo.tools import split_every
+
+from ..hooks import FISCAL_COLUMNS
+from ..tools import recompute_fields
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE_PARAM = 'l10n_it_simple_withholding_cassa.batch_size'
+BATCH_SIZE_DEFAULT = 500
+
+# modello -> metodo che rigenera le righe fiscali di un documento
+SYNC_METHODS = {
+    'account.move': '_update_fiscal_lines',
+    'sale.order': '_sync_auto_lines',
+}
+
+# modello -> campi fiscali memorizzati da ricalcolare
+RECOMPUTE_FIELDS = {model: fnames for model, _columns, fnames, _condition in FISCAL_COLUMNS.values()}
+
+
+class FiscalBatch(models.AbstractModel):
+    """Elaborazione massiva di righe e importi fiscali divisa per azienda
+
+    I documenti vengono raggruppati per ``company_id`` e ogni gruppo gira con
+    ``with_company``: conti fiscali e valori di default vengono letti dalla
+    configurazione dell'azienda del documento (caricata una volta sola per
+    azienda) e non da quella dell'utente che lancia il job. ``run`` lavora
+    nella transazione del chiamante senza mai fare commit; il job notturno
+    elabora i documenti a lotti, ognuno con un cursore e una transazione
+    propri.
+    """
+    _name = 'l10n_it.fiscal.batch'
+    _description = "Elaborazione fiscale massiva per azienda"
+
+    @api.model
+    def _group_by_company(self, model_name, ids):
+        """Restituisce {company_id: [id, ...]} con una sola query"""
+        Model = self.env[model_name]
+        Model.flush_model(['company_id'])
+        self.env.cr.execute(
+            f"""SELECT company_id, array_agg(id ORDER BY id)
+                  FROM {Model._table}
+                 WHERE id = ANY(%s)
+              GROUP BY company_id
+              ORDER BY company_id""",
+            [list(ids)],
+        )
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _run_company(self, model_name, company_id, ids, operation, chunk_size=500):
+        """Elabora i documenti ``ids`` di una azienda; restituisce il numero elaborato"""
+        company = self.env['res.company'].browse(company_id)
+        env = self.with_company(company).env if company else self.env
+        if company:
+            company._l10n_it_fiscal_config()
+        if operation == 'recompute':
+            return recompute_fields(env, model_name, ids, RECOMPUTE_FIELDS[model_name], chunk_size)
+
+        method = SYNC_METHODS[model_name]
+        done = 0
+        for chunk_ids in split_every(chunk_size, ids):
+            for record in env[model_name].browse(chunk_ids):
+                getattr(record, method)()
+            env.flush_all()
+            env.invalidate_all()
+            done += len(chunk_ids)
+            _logger.info("%s (azienda %s): %s/%s documenti sincronizzati",
+                         model_name, company_id, done, len(ids))
+        return done
+
+    @api.model
+    def run(self, model_name, ids, operation='sync', chunk_size=500):
+        """Sincronizza (``sync``) o ricalcola (``recompute``) i documenti indicati
+
+        Lavora nella transazione corrente. Restituisce {company_id: documenti
+        elaborati}.
+        """
+        if operation == 'sync' and model_name not in SYNC_METHODS:
+            raise ValueError(f"Sincronizzazione non disponibile per {model_name}")
+        if operation == 'recompute' and model_name not in RECOMPUTE_FIELDS:
+            raise ValueError(f"Ricalcolo non disponibile per {model_name}")
+        groups = self._group_by_company(model_name, ids)
+        return {
+            company_id: self._run_company(model_name, company_id, company_ids, operation, chunk_size)
+            for company_id, company_ids in groups.items()
+        }
+
+    @api.model
+    def _run_in_batches(self, model_name, ids, operation='sync'):
+        """Esegue ``run`` a lotti, ognuno in una transazione propria
+
+        Ogni lotto apre un cursore dedicato, confermato alla chiusura: un
+        errore annulla solo il proprio lotto e la transazione del chiamante
+        non viene toccata. Restituisce {company_id: documenti elaborati}.
+        """
+        batch_size = int(self.env['ir.config_parameter'].sudo().get_param(BATCH_SIZE_PARAM, BATCH_SIZE_DEFAULT))
+        results = {}
+        for batch_ids in split_every(max(batch_size, 1), ids):
+            try:
+                with self.env.registry.cursor() as cr:
+                    batch = self.env(cr=cr)[self._name]
+                    for company_id, done in batch.run(model_name, batch_ids, operation).items():
+                        results[company_id] = results.get(company_id, 0) + done
+            except Exception:
+                _logger.exception("%s: lotto di %s documenti non elaborato (primo id %s)",
+                                  model_name, len(batch_ids), batch_ids[0])
+        return results
+
+    @api.model
+    def _cron_sync_draft_documents(self):
+        """Job notturno: rigenera le righe fiscali delle bozze di tutte le aziende"""
+        for model_name, domain in (
+            ('account.move', [('state', '=', 'draft'), ('move_type', 'in', ['out_invoice', 'out_refund'])]),
+            ('sale.order', [('state', '=', 'draft')]),
+        ):
+            ids = self.env[model_name].sudo().search([
+                *domain,
+                '|', ('apply_cassa', '=', True), ('apply_withholding', '=', True),
+            ]).ids
+            if ids:
+                results = self.sudo()._run_in_batches(model_name, ids, 'sync')
+                _logger.info("%s: bozze sincronizzate per azienda %s", model_name, results)
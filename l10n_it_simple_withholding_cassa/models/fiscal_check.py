@@ -0,0 +1,215 @@
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools import float_compare, split_every
+
+_logger = logging.getLogger(__name__)
+
+# modello -> dominio dei documenti da controllare
+CHECK_DOMAINS = {
+    'account.move': [('state', '=', 'posted'), ('move_type', 'in', ['out_invoice', 'out_refund'])],
+    'sale.order': [('state', '=', 'sale')],
+}
+
+
+class FiscalCheck(models.Model):
+    """Controllo di coerenza degli importi fiscali memorizzati
+
+    Confronta gli importi memorizzati con quanto risulta davvero dal
+    documento: le righe fiscali (cassa e ritenuta) e i totali delle righe
+    per fatture e ordini, la ripartizione della cassa per aliquota per le
+    fatture. I documenti sono letti a blocchi nella transazione corrente; il
+    risultato è l'elenco delle differenze. La riparazione passa dal ricalcolo
+    massivo per azienda e vale solo per le differenze che il ricalcolo
+    elimina davvero.
+    """
+    _name = 'l10n_it.fiscal.check'
+    _description = "Controllo coerenza importi Ritenuta e Cassa"
+    _order = 'id desc'
+
+    name = fields.Char(
+        string="Controllo", required=True,
+        default=lambda self: _("Controllo del %s", fields.Date.context_today(self)))
+    target = fields.Selection([
+        ('account.move', 'Fatture validate'),
+        ('sale.order', 'Ordini confermati'),
+        ('all', 'Fatture e ordini'),
+    ], string="Documenti", required=True, default='all')
+    company_ids = fields.Many2many('res.company', string="Aziende", help="Vuoto: tutte le aziende")
+    chunk_size = fields.Integer(string="Documenti per blocco", default=2000)
+    repair = fields.Boolean(string="Ripara", help="Ricalcola e riscrive gli importi dei documenti con differenze")
+    state = fields.Selection([
+        ('draft', 'Da eseguire'),
+        ('done', 'Eseguito'),
+    ], string="Stato", default='draft', required=True, readonly=True)
+    document_count = fields.Integer(string="Documenti controllati", readonly=True)
+    drift_document_count = fields.Integer(string="Documenti con differenze", readonly=True)
+    drift_ids = fields.One2many('l10n_it.fiscal.drift', 'check_id', string="Differenze", readonly=True)
+
+    def _get_target_models(self):
+        self.ensure_one()
+        return list(CHECK_DOMAINS) if self.target == 'all' else [self.target]
+
+    def _get_document_ids(self, model_name):
+        domain = list(CHECK_DOMAINS[model_name])
+        if self.company_ids:
+            domain.append(('company_id', 'in', self.company_ids.ids))
+        return self.env[model_name].sudo().search(domain, order='id').ids
+
+    @api.model
+    def _get_expected_values(self, record):
+        """Restituisce [(tipo controllo, campo, valore atteso)] per un documento
+
+        I valori attesi vengono dalle righe e dalla ripartizione registrate,
+        non dalle formule che hanno prodotto gli importi memorizzati.
+        """
+        if record._name == 'sale.order':
+            auto_lines = record._get_fiscal_auto_lines()
+            normal_lines = record.order_line.filtered(lambda l: not l._is_fiscal_auto_line())
+            untaxed = sum(normal_lines.mapped('price_subtotal'))
+            cassa = sum(auto_lines['cassa'].mapped('price_subtotal'))
+            withholding = -sum(auto_lines['withholding'].mapped('price_subtotal'))
+            tax = sum(record.order_line.mapped('price_tax'))
+            return [
+                ('lines', 'amount_untaxed', untaxed),
+                ('lines', 'cassa_amount', cassa),
+                ('lines', 'withholding_amount', withholding),
+                ('lines', 'amount_tax', tax),
+                ('lines', 'net_amount', untaxed + cassa + tax - withholding),
+            ]
+
+        fiscal_lines = record.invoice_line_ids.filtered(record._is_fiscal_line)
+        cassa = sum(fiscal_lines.filtered(lambda l: 'Cassa previdenziale' in l.name).mapped('price_subtotal'))
+        withholding = -sum(fiscal_lines.filtered(lambda l: "Ritenuta d'acconto" in l.name).mapped('price_subtotal'))
+        expected = [
+            ('lines', 'cassa_amount', cassa),
+            ('lines', 'withholding_amount', withholding),
+            # Il netto a pagare è il totale delle righe, ritenuta inclusa
+            ('lines', 'net_amount', record.amount_total),
+            ('lines', 'total_gross', record.amount_total + withholding),
+        ]
+        if record.fiscal_breakdown_ids:
+            breakdown = record.fiscal_breakdown_ids
+            expected.append(('breakdown', 'cassa_amount', sum(breakdown.mapped('cassa_amount'))))
+        return expected
+
+    @api.model
+    def _check_chunk(self, model_name, ids):
+        """Controlla un blocco di documenti; restituisce le differenze come dizionari"""
+        drifts = []
+        for record in self.env[model_name].browse(ids):
+            rounding = record.currency_id.rounding or 0.01
+            for check_type, fname, expected in self._get_expected_values(record):
+                stored = record[fname]
+                if float_compare(stored, expected, precision_rounding=rounding):
+                    drifts.append({
+                        'res_model': model_name,
+                        'res_id': record.id,
+                        'document': record.display_name,
+                        'company_id': record.company_id.id,
+                        'check_type': check_type,
+                        'field_name': fname,
+                        'stored_value': stored,
+                        'expected_value': expected,
+                        'delta': stored - expected,
+                    })
+        self.env.invalidate_all()
+        return drifts
+
+    def _iter_drifts(self, model_name, ids):
+        """Restituisce le differenze blocco per blocco"""
+        Check = self.sudo()
+        for chunk_ids in split_every(max(self.chunk_size, 1), ids):
+            yield Check._check_chunk(model_name, chunk_ids)
+
+    def action_run(self):
+        self.ensure_one()
+        self.drift_ids.unlink()
+        Drift = self.env['l10n_it.fiscal.drift']
+        document_count = 0
+        drift_documents = defaultdict(set)
+        for model_name in self._get_target_models():
+            self.env[model_name].flush_model()
+            ids = self._get_document_ids(model_name)
+            done = 0
+            for drifts in self._iter_drifts(model_name, ids):
+                Drift.create([dict(drift, check_id=self.id) for drift in drifts])
+                for drift in drifts:
+                    drift_documents[model_name].add(drift['res_id'])
+                done = min(done + self.chunk_size, len(ids))
+                _logger.info("Controllo %s: %s/%s documenti, %s con differenze",
+                             model_name, done, len(ids), len(drift_documents[model_name]))
+            document_count += len(ids)
+
+        self.write({
+            'state': 'done',
+            'document_count': document_count,
+            'drift_document_count': sum(len(ids) for ids in drift_documents.values()),
+        })
+        if self.repair and self.drift_ids:
+            self.action_repair()
+        return True
+
+    def action_repair(self):
+        """Ricalcola con il job massivo i documenti con differenze
+
+        Dopo il ricalcolo i documenti vengono controllati di nuovo: sono
+        marcate riparate solo le differenze scomparse (es. non quelle tra
+        importi e righe di una fattura validata, da correggere a mano).
+        """
+        self.ensure_one()
+        drifts = self.drift_ids.filtered(lambda d: not d.repaired)
+        if not drifts:
+            raise UserError(_("Nessuna differenza da riparare."))
+        Batch = self.env['l10n_it.fiscal.batch'].sudo()
+        remaining = set()
+        for model_name in set(drifts.mapped('res_model')):
+            ids = sorted(set(drifts.filtered(lambda d: d.res_model == model_name).mapped('res_id')))
+            Batch.run(model_name, ids, 'recompute', chunk_size=self.chunk_size)
+            for chunk_drifts in self._iter_drifts(model_name, ids):
+                remaining.update(
+                    (drift['res_model'], drift['res_id'], drift['check_type'], drift['field_name'])
+                    for drift in chunk_drifts)
+        drifts.filtered(
+            lambda d: (d.res_model, d.res_id, d.check_type, d.field_name) not in remaining
+        ).write({'repaired': True})
+        return True
+
+    @api.model
+    def _cron_check(self):
+        """Job notturno: controlla tutti i documenti senza riparare"""
+        check = self.create({'name': _("Controllo notturno del %s", fields.Date.context_today(self))})
+        check.action_run()
+
+
+class FiscalDrift(models.Model):
+    """Differenza tra importo memorizzato e importo atteso su un documento"""
+    _name = 'l10n_it.fiscal.drift'
+    _description = "Differenza importi Ritenuta e Cassa"
+    _order = 'check_id desc, res_model, res_id, field_name'
+
+    check_id = fields.Many2one('l10n_it.fiscal.check', string="Controllo", required=True, ondelete='cascade', index=True)
+    res_model = fields.Char(string="Modello", required=True)
+    res_id = fields.Many2oneReference(string="ID documento", model_field='res_model', required=True)
+    document = fields.Char(string="Documento")
+    company_id = fields.Many2one('res.company', string="Azienda")
+    check_type = fields.Selection([
+        ('lines', 'Righe del documento'),
+        ('breakdown', 'Ripartizione cassa'),
+    ], string="Tipo controllo", required=True)
+    field_name = fields.Char(string="Campo", required=True)
+    stored_value = fields.Float(string="Valore memorizzato", digits=(16, 4))
+    expected_value = fields.Float(string="Valore atteso", digits=(16, 4))
+    delta = fields.Float(string="Differenza", digits=(16, 4))
+    repaired = fields.Boolean(string="Riparato", readonly=True)
+
+    def action_open_document(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self.res_model,
+            'res_id': self.res_id,
+            'view_mode': 'form',
+        }
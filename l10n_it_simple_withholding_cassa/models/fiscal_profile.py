@@ -0,0 +1,158 @@
+from odoo import models, fields, api, tools
+
+from ..tools import clear_ormcache
+
+FISCAL_SETTING_FIELDS = ('apply_cassa', 'cassa_percent', 'apply_withholding', 'withholding_percent')
+# Aliquote proposte: nuovi profili e aziende senza profilo
+DEFAULT_CASSA_PERCENT = 4.0
+DEFAULT_WITHHOLDING_PERCENT = 20.0
+
+
+class FiscalProfile(models.Model):
+    """Profilo fiscale riutilizzabile: aliquote, conti e imposta della cassa
+
+    Il profilo si assegna all'azienda (profilo di default) e al cliente
+    (per azienda); i documenti lo ricevono con un solo many2one indicizzato e
+    ne copiano le aliquote, che restano modificabili sul singolo documento.
+    """
+    _name = 'l10n_it.fiscal.profile'
+    _description = "Profilo Ritenuta e Cassa"
+    _order = 'sequence, name, id'
+    _check_company_auto = True
+
+    name = fields.Char(string="Nome", required=True, translate=True)
+    sequence = fields.Integer(default=10)
+    active = fields.Boolean(default=True)
+    company_id = fields.Many2one(
+        'res.company', string="Azienda", required=True, index=True,
+        default=lambda self: self.env.company)
+
+    apply_cassa = fields.Boolean(string="Applica Cassa Previdenziale")
+    cassa_percent = fields.Float(string="Cassa %", default=DEFAULT_CASSA_PERCENT)
+    cassa_account_id = fields.Many2one(
+        'account.account', string="Conto Cassa Previdenziale", check_company=True)
+    cassa_tax_id = fields.Many2one(
+        'account.tax', string="IVA sulla Cassa", check_company=True,
+        domain="[('type_tax_use', '=', 'sale')]",
+        help="Imposta applicata alla riga della cassa; se vuota si usa quella della prima riga prodotto")
+
+    apply_withholding = fields.Boolean(string="Applica Ritenuta d'acconto")
+    withholding_percent = fields.Float(string="Ritenuta %", default=DEFAULT_WITHHOLDING_PERCENT)
+    withholding_account_id = fields.Many2one(
+        'account.account', string="Conto Ritenuta d'Acconto", check_company=True)
+
+    @api.model
+    @tools.ormcache('partner_id', 'company_id')
+    def _get_profile_id(self, partner_id, company_id):
+        """Id del profilo da usare per un cliente in una azienda (o False)
+
+        Profilo attivo del cliente commerciale nell'azienda, altrimenti
+        quello dell'azienda, se attivo. Il risultato è in cache: la creazione massiva di
+        documenti fa una sola lettura per coppia cliente/azienda.
+        """
+        company = self.env['res.company'].browse(company_id).sudo()
+        if partner_id:
+            partner = self.env['res.partner'].browse(partner_id).sudo().with_company(company)
+            profile = partner.commercial_partner_id.fiscal_profile_id.filtered('active')
+            if profile:
+                return profile.id
+        return company.fiscal_profile_id.filtered('active').id
+
+    @api.model
+    def _get_document_profile(self, partner, company):
+        return self.browse(self._get_profile_id(partner.id, company.id))
+
+    def _get_document_values(self):
+        """Valori fiscali da copiare sul documento"""
+        self.ensure_one()
+        return {fname: self[fname] for fname in FISCAL_SETTING_FIELDS}
+
+    @api.model
+    def _clear_profile_cache(self, partners=None):
+        """Svuota la cache di _get_profile_id
+
+        Con ``partners`` solo le voci di quei contatti e dei loro figli (che
+        ereditano il profilo dal cliente commerciale), in tutte le aziende;
+        altrimenti tutte le voci del metodo.
+        """
+        if partners is None:
+            clear_ormcache(self, '_get_profile_id')
+            return
+        partner_ids = self.env['res.partner'].with_context(active_test=False).sudo().search(
+            [('id', 'child_of', partners.ids)]).ids
+        company_ids = self.env['res.company'].sudo().search([]).ids
+        clear_ormcache(self, '_get_profile_id', [
+            (self, partner_id, company_id) for partner_id in partner_ids for company_id in company_ids
+        ])
+
+    def _clear_company_config(self):
+        """Le aziende con questo profilo di default ne tengono in cache i valori"""
+        self.env['res.company'].sudo().with_context(active_test=False).search(
+            [('fiscal_profile_id', 'in', self.ids)])._l10n_it_clear_fiscal_config()
+
+    def write(self, vals):
+        if {'active', 'company_id'}.intersection(vals):
+            self._clear_company_config()
+        res = super().write(vals)
+        if {'active', 'company_id'}.intersection(vals):
+            self._clear_profile_cache()
+        if {'active', 'company_id', *FISCAL_SETTING_FIELDS}.intersection(vals):
+            self._clear_company_config()
+        return res
+
+    def unlink(self):
+        self._clear_company_config()
+        res = super().unlink()
+        self._clear_profile_cache()
+        return res
+
+
+class FiscalProfileMixin(models.AbstractModel):
+    """Campi fiscali dei documenti calcolati dal profilo
+
+    Il profilo viene risolto da cliente e azienda; aliquote e flag vengono
+    copiati dal profilo e restano modificabili. Senza profilo si usano i
+    default dell'azienda (vedi ``res.company._l10n_it_fiscal_config``).
+    """
+    _name = 'l10n_it.fiscal.profile.mixin'
+    _description = "Campi Ritenuta e Cassa da profilo fiscale"
+
+    fiscal_profile_id = fields.Many2one(
+        'l10n_it.fiscal.profile', string="Profilo Ritenuta e Cassa",
+        compute='_compute_fiscal_profile_id', store=True, readonly=False, precompute=True,
+        index=True, check_company=True)
+
+    apply_withholding = fields.Boolean(
+        string="Applica Ritenuta d'acconto",
+        compute='_compute_fiscal_settings', store=True, readonly=False, precompute=True)
+    withholding_percent = fields.Float(
+        string="Ritenuta %",
+        compute='_compute_fiscal_settings', store=True, readonly=False, precompute=True)
+    apply_cassa = fields.Boolean(
+        string="Applica Cassa Previdenziale",
+        compute='_compute_fiscal_settings', store=True, readonly=False, precompute=True)
+    cassa_percent = fields.Float(
+        string="Cassa %",
+        compute='_compute_fiscal_settings', store=True, readonly=False, precompute=True)
+
+    def _get_fiscal_profile_partner(self):
+        return self.partner_id
+
+    @api.depends('partner_id', 'company_id')
+    def _compute_fiscal_profile_id(self):
+        Profile = self.env['l10n_it.fiscal.profile']
+        for record in self:
+            company = record.company_id or self.env.company
+            record.fiscal_profile_id = Profile._get_document_profile(record._get_fiscal_profile_partner(), company)
+
+    @api.depends('fiscal_profile_id')
+    def _compute_fiscal_settings(self):
+        for record in self:
+            if record.fiscal_profile_id:
+                record.update(record.fiscal_profile_id._get_document_values())
+                continue
+            if record._origin.id:
+                # Documento esistente senza profilo: restano i valori impostati
+                record.update({fname: record[fname] for fname in FISCAL_SETTING_FIELDS})
+                continue
+            record.update((record.company_id or self.env.company)._l10n_it_fiscal_config()['defaults'])
@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import logging
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+PDF_CACHE_MAX_MB_PARAM = 'l10n_it_simple_withholding_cassa.pdf_cache_max_mb'
+PDF_CACHE_DEFAULT_MAX_MB = 500
+# Da incrementare quando cambia il modo in cui il PDF viene generato
+PDF_CACHE_VERSION = 1
+PDF_CACHE_TAG = 'l10n_it_pdf_cache'
+# Campo binario (solo amministratori) a cui sono legati gli allegati in cache:
+# con res_field valorizzato non compaiono nel chatter e /web/content li nega
+PDF_CACHE_FIELD = 'l10n_it_pdf_cache'
+
+# modello -> stati in cui il PDF del documento è memorizzabile
+PDF_CACHE_STATES = {
+    'account.move': ('posted',),
+    'sale.order': ('sent', 'sale'),
+}
+
+# modello -> (modello righe, campo inverso): le righe entrano nella chiave
+PDF_CACHE_LINES = {
+    'account.move': ('account.move.line', 'move_id'),
+    'sale.order': ('sale.order.line', 'order_id'),
+}
+
+
+class IrActionsReport(models.Model):
+    """Cache dei PDF di fatture validate e ordini inviati/confermati
+
+    Il PDF di un singolo documento viene salvato come allegato del documento
+    stesso, legato a un campo riservato agli amministratori (non visibile nel
+    chatter né scaricabile da /web/content), sotto una chiave che comprende
+    documento, ``write_date`` di documento, righe e cliente, versione dei
+    template QWeb e dati aziendali stampati (azienda e conti bancari): ogni
+    modifica produce una chiave nuova e la copia precedente non viene più
+    usata. Un job elimina le copie più vecchie oltre la dimensione massima.
+    """
+    _inherit = 'ir.actions.report'
+
+    def _l10n_it_pdf_cacheable_record(self, res_ids, data):
+        """Documento da servire dalla cache, o None"""
+        if data or not res_ids or len(res_ids) != 1 or (self.attachment_use and self.attachment):
+            return None
+        if self.env.context.get('l10n_it_pdf_cache') is False:
+            return None
+        states = PDF_CACHE_STATES.get(self.model)
+        if not states or self._l10n_it_pdf_cache_max_bytes() <= 0:
+            return None
+        record = self.env[self.model].browse(res_ids)
+        return record if record.exists() and record.state in states else None
+
+    @api.model
+    def _l10n_it_pdf_cache_max_bytes(self):
+        param = self.env['ir.config_parameter'].sudo().get_param(PDF_CACHE_MAX_MB_PARAM, PDF_CACHE_DEFAULT_MAX_MB)
+        return int(float(param) * 1024 * 1024)
+
+    def _l10n_it_pdf_cache_lines_version(self, record):
+        """(numero, somma degli id, ultima modifica) delle righe del documento
+
+        Le righe possono cambiare senza toccare il documento: numero e somma
+        degli id coprono righe aggiunte o eliminate, la data le modifiche.
+        """
+        line_model, inverse_name = PDF_CACHE_LINES[record._name]
+        [(count, ids_sum, last_write)] = self.env[line_model].sudo()._read_group(
+            [(inverse_name, '=', record.id)], [], ['__count', 'id:sum', 'write_date:max'])
+        return count, ids_sum, last_write
+
+    def _l10n_it_pdf_cache_key(self, record):
+        """Chiave della copia in cache: cambia con documento, righe, template e dati bancari"""
+        self.ensure_one()
+        self.env.cr.execute("SELECT MAX(write_date) FROM ir_ui_view WHERE type = 'qweb'")
+        templates_date = self.env.cr.fetchone()[0]
+        company = record.company_id.sudo()
+        banks = company.bank_ids
+        parts = [
+            PDF_CACHE_VERSION, self.report_name, self.write_date, self.paperformat_id.write_date,
+            templates_date, self.env.context.get('lang'),
+            record._name, record.id, record.write_date, self._l10n_it_pdf_cache_lines_version(record),
+            record.partner_id.write_date,
+            company.write_date, company.partner_id.write_date,
+            [(bank.id, bank.write_date, bank.bank_id.write_date) for bank in banks],
+        ]
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def _l10n_it_pdf_cache_prefix(self, record):
+        # Separatore "-": "_" in un LIKE vale come carattere qualsiasi
+        return f"{PDF_CACHE_TAG}-{self.id}-{record._name}-{record.id}-"
+
+    @api.model
+    def _l10n_it_pdf_cache_domain(self, record=None):
+        """Allegati della cache (di un documento, se indicato)"""
+        domain = [
+            ('res_model', 'in', list(PDF_CACHE_STATES)),
+            ('res_field', '=', PDF_CACHE_FIELD),
+            ('description', '=', PDF_CACHE_TAG),
+        ]
+        if record is not None:
+            domain += [('res_model', '=', record._name), ('res_id', '=', record.id)]
+        return domain
+
+    def _render_qweb_pdf(self, report_ref, res_ids=None, data=None):
+        report = self._get_report(report_ref)
+        if isinstance(res_ids, int):
+            res_ids = [res_ids]
+        record = report._l10n_it_pdf_cacheable_record(res_ids, data)
+        if not record:
+            return super()._render_qweb_pdf(report_ref, res_ids=res_ids, data=data)
+
+        # La copia in cache non passa dal rendering: controllo di accesso esplicito
+        record.check_access('read')
+        prefix = report._l10n_it_pdf_cache_prefix(record)
+        name = f"{prefix}{report._l10n_it_pdf_cache_key(record)}.pdf"
+        Attachment = self.env['ir.attachment'].sudo()
+        cached = Attachment.search([*self._l10n_it_pdf_cache_domain(record), ('name', '=', name)], limit=1)
+        if cached:
+            return base64.b64decode(cached.datas), 'pdf'
+
+        pdf_content, content_type = super()._render_qweb_pdf(report_ref, res_ids=res_ids, data=data)
+        if content_type != 'pdf':
+            # es. HTML al posto del PDF durante i test
+            return pdf_content, content_type
+        # Le copie precedenti dello stesso documento non sono più valide
+        Attachment.search([*self._l10n_it_pdf_cache_domain(record), ('name', '=like', f"{prefix}%")]).unlink()
+        Attachment.create({
+            'name': name,
+            'description': PDF_CACHE_TAG,
+            'res_model': record._name,
+            'res_id': record.id,
+            'res_field': PDF_CACHE_FIELD,
+            'mimetype': 'application/pdf',
+            'raw': pdf_content,
+        })
+        return pdf_content, content_type
+
+    @api.model
+    def _l10n_it_clear_pdf_cache(self):
+        """Svuota la cache (es. dopo la modifica dei conti bancari aziendali)"""
+        self.env['ir.attachment'].sudo().search(self._l10n_it_pdf_cache_domain()).unlink()
+
+    @api.model
+    def _cron_gc_l10n_it_pdf_cache(self):
+        """Elimina le copie più vecchie finché la cache supera la dimensione massima"""
+        max_bytes = self._l10n_it_pdf_cache_max_bytes()
+        self.env['ir.attachment'].flush_model()
+        self.env.cr.execute(
+            """SELECT id, file_size
+                 FROM ir_attachment
+                WHERE res_model IN %s AND res_field = %s AND description = %s
+             ORDER BY create_date DESC, id DESC""",
+            [tuple(PDF_CACHE_STATES), PDF_CACHE_FIELD, PDF_CACHE_TAG],
+        )
+        total = 0
+        to_delete = []
+        for attachment_id, file_size in self.env.cr.fetchall():
+            total += file_size or 0
+            if total > max_bytes:
+                to_delete.append(attachment_id)
+        if to_delete:
+            self.env['ir.attachment'].sudo().browse(to_delete).unlink()
+        _logger.info("Cache PDF: eliminate %s copie, dimensione massima %s byte", len(to_delete), max_bytes)
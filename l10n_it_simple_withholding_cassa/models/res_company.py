@@ -1,4 +1,8 @@
-from odoo import models, fields
+from odoo import models, fields, tools, _
+from odoo.exceptions import UserError
+
+from ..tools import clear_ormcache, compute_fiscal_totals
+from .fiscal_profile import DEFAULT_CASSA_PERCENT, DEFAULT_WITHHOLDING_PERCENT
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -26,4 +30,130 @@ class ResCompany(models.Model):
         string="Conto Ritenuta d'Acconto"
     )
 
-_logger.info("🔥 MODELLO RES.COMPANY CARICATO")
\ No newline at end of file
+    fiscal_profile_id = fields.Many2one(
+        'l10n_it.fiscal.profile',
+        string="Profilo Ritenuta e Cassa",
+        domain="[('company_id', '=', id)]",
+        help="Profilo di default per i documenti dei clienti senza un profilo proprio"
+    )
+
+    withholding_auto_match = fields.Boolean(
+        string="Riconcilia incassi sul Netto a Pagare",
+        help="Alla creazione delle righe di estratto conto abbina automaticamente "
+             "le fatture con ritenuta il cui netto a pagare corrisponde all'incasso",
+        default=False
+    )
+
+    # Conti usati quando in azienda non è configurato un conto fiscale
+    FISCAL_ACCOUNT_FALLBACK_CODES = {
+        'cassa': '310200',
+        'withholding': '160900',
+    }
+    FISCAL_CONFIG_FIELDS = {
+        'enable_withholding_tax', 'enable_cassa_previdenziale',
+        'cassa_account_id', 'withholding_account_id',
+        'currency_id', 'parent_id',
+    }
+
+    def _l10n_it_fiscal_config(self):
+        """Configurazione fiscale dell'azienda, letta una sola volta
+
+        Restituisce solo id e valori semplici. I conti di ripiego vengono
+        cercati tra quelli dell'azienda stessa, non di ``env.company``; un
+        conto di ripiego non trovato non resta in cache, così viene
+        individuato appena creato.
+        """
+        config = self._l10n_it_fiscal_config_cached()
+        missing = [fiscal_type for fiscal_type, account_id in config['accounts'].items() if not account_id]
+        if not missing:
+            return config
+        Account = self.env['account.account'].with_company(self).sudo()
+        accounts = dict(config['accounts'])
+        for fiscal_type in missing:
+            accounts[fiscal_type] = Account.search([
+                *Account._check_company_domain(self),
+                ('code', '=', self.FISCAL_ACCOUNT_FALLBACK_CODES[fiscal_type]),
+            ], limit=1).id
+        return dict(config, accounts=accounts)
+
+    @tools.ormcache('self.id')
+    def _l10n_it_fiscal_config_cached(self):
+        """Parte in cache di _l10n_it_fiscal_config (resta valida tra le transazioni)"""
+        self.ensure_one()
+        Account = self.env['account.account'].with_company(self).sudo()
+        accounts = {}
+        for fiscal_type, code in self.FISCAL_ACCOUNT_FALLBACK_CODES.items():
+            account = self.sudo()[f'{fiscal_type}_account_id'] or Account.search([
+                *Account._check_company_domain(self),
+                ('code', '=', code),
+            ], limit=1)
+            accounts[fiscal_type] = account.id
+        profile = self.sudo().fiscal_profile_id.filtered('active')
+        return {
+            'apply_withholding': self.enable_withholding_tax,
+            'apply_cassa': self.enable_cassa_previdenziale,
+            'accounts': accounts,
+            'rounding': self.sudo().currency_id.rounding,
+            # Imposte utilizzabili: dell'azienda o delle aziende madri (filiali)
+            'tax_company_ids': self.sudo().parent_ids.ids,
+            # Valori proposti per i nuovi documenti: profilo dell'azienda o default
+            'defaults': profile._get_document_values() if profile else {
+                'apply_cassa': self.enable_cassa_previdenziale,
+                'cassa_percent': DEFAULT_CASSA_PERCENT,
+                'apply_withholding': self.enable_withholding_tax,
+                'withholding_percent': DEFAULT_WITHHOLDING_PERCENT,
+            },
+        }
+
+    def _l10n_it_simulate_fiscal(self, items):
+        """Calcola cassa, IVA, ritenuta e netto per una lista di documenti ipotetici
+
+        Ogni elemento ha ``lines`` ([{'amount', 'tax_ids'}]) e, facoltativi,
+        ``apply_cassa``, ``cassa_percent``, ``apply_withholding`` e
+        ``withholding_percent`` (se mancano valgono i default dell'azienda).
+        Configurazione e aliquote vengono dalle cache: nessuna scrittura e,
+        a cache calda, nessuna query.
+        """
+        self.ensure_one()
+        config = self._l10n_it_fiscal_config()
+        get_rate = self.env['account.tax']._l10n_it_get_tax_rate
+        results = []
+        for item in items:
+            settings = {key: item.get(key, default) for key, default in config['defaults'].items()}
+            try:
+                lines = []
+                for line in item.get('lines') or []:
+                    rates = []
+                    for tax_id in line.get('tax_ids') or []:
+                        tax = get_rate(int(tax_id))
+                        if not tax or tax[0] not in config['tax_company_ids']:
+                            raise UserError(_("Imposta %s non valida per l'azienda %s", tax_id, self.name))
+                        rates.append(tax[1])
+                    lines.append((float(line.get('amount') or 0.0), rates))
+                totals = compute_fiscal_totals(
+                    lines,
+                    bool(settings['apply_cassa']), float(settings['cassa_percent'] or 0.0),
+                    bool(settings['apply_withholding']), float(settings['withholding_percent'] or 0.0),
+                    config['rounding'],
+                )
+            except (UserError, TypeError, ValueError, AttributeError) as e:
+                results.append({'error': str(e)})
+                continue
+            results.append(dict(totals, **settings))
+        return results
+
+    def _l10n_it_clear_fiscal_config(self):
+        """Svuota la cache della configurazione fiscale delle sole aziende indicate"""
+        clear_ormcache(self, '_l10n_it_fiscal_config_cached', [(company,) for company in self])
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'parent_id' in vals:
+            # Anche le filiali: le imposte utilizzabili seguono la gerarchia
+            self.sudo().search([('id', 'child_of', self.ids)])._l10n_it_clear_fiscal_config()
+        elif self.FISCAL_CONFIG_FIELDS.intersection(vals) or 'fiscal_profile_id' in vals:
+            self._l10n_it_clear_fiscal_config()
+        if 'fiscal_profile_id' in vals:
+            # Profilo di ripiego dei clienti senza un profilo proprio
+            self.env['l10n_it.fiscal.profile']._clear_profile_cache()
+        return res
\ No newline at end of file
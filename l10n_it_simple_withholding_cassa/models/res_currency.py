@@ -0,0 +1,13 @@
+from odoo import models
+
+
+class ResCurrency(models.Model):
+    _inherit = 'res.currency'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'rounding' in vals:
+            # L'arrotondamento della valuta è nella configurazione fiscale in cache
+            self.env['res.company'].sudo().with_context(active_test=False).search(
+                [('currency_id', 'in', self.ids)])._l10n_it_clear_fiscal_config()
+        return res
@@ -0,0 +1,47 @@
+from odoo import models, fields, api
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    fiscal_profile_id = fields.Many2one(
+        'l10n_it.fiscal.profile',
+        string="Profilo Ritenuta e Cassa",
+        company_dependent=True,
+        domain="[('company_id', '=', current_company_id)]",
+        help="Profilo usato per i documenti di questo cliente nell'azienda corrente; "
+             "se vuoto si usa quello dell'azienda")
+
+    def write(self, vals):
+        res = super().write(vals)
+        # Il profilo dei documenti viene dal cliente commerciale: cambia anche
+        # quando il contatto passa sotto un'altra azienda
+        if {'fiscal_profile_id', 'parent_id', 'is_company'}.intersection(vals):
+            self.env['l10n_it.fiscal.profile']._clear_profile_cache(self)
+        return res
+
+
+class ResPartnerBank(models.Model):
+    _inherit = 'res.partner.bank'
+
+    def _clear_company_pdf_cache(self):
+        """I conti dell'azienda sono stampati nei PDF: le copie in cache non valgono più"""
+        if self.sudo().partner_id.ref_company_ids:
+            self.env['ir.actions.report']._l10n_it_clear_pdf_cache()
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        banks = super().create(vals_list)
+        banks._clear_company_pdf_cache()
+        return banks
+
+    def write(self, vals):
+        self._clear_company_pdf_cache()
+        res = super().write(vals)
+        if 'partner_id' in vals:
+            self._clear_company_pdf_cache()
+        return res
+
+    def unlink(self):
+        self._clear_company_pdf_cache()
+        return super().unlink()
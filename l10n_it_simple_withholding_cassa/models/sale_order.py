@@ -1,24 +1,14 @@
 from odoo import models, fields, api
 import logging
-from odoo.tools import float_round
+from odoo.tools import float_compare, float_round
+
+from .fiscal_profile import FISCAL_SETTING_FIELDS
 
 _logger = logging.getLogger(__name__)
 
 class SaleOrder(models.Model):
-    _inherit = 'sale.order'
-
-    # Flag e parametri
-    apply_withholding = fields.Boolean(
-        string="Applica Ritenuta d'acconto",
-        default=lambda self: self.env.company.enable_withholding_tax,
-    )
-    withholding_percent = fields.Float(string="Ritenuta %", default=20.0)
-
-    apply_cassa = fields.Boolean(
-        string="Applica Cassa Previdenziale",
-        default=lambda self: self.env.company.enable_cassa_previdenziale,
-    )
-    cassa_percent = fields.Float(string="Cassa %", default=4.0)
+    _name = 'sale.order'
+    _inherit = ['sale.order', 'l10n_it.fiscal.profile.mixin']
 
     # Valute
     currency_id = fields.Many2one(related='pricelist_id.currency_id', store=True)
@@ -52,20 +42,30 @@ class SaleOrder(models.Model):
         string="Totale a pagare",
         compute='_amount_all', store=True, readonly=True)
 
+    cassa_invoiced_amount = fields.Monetary(
+        string="Cassa fatturata",
+        compute='_compute_fiscal_invoiced_amounts', store=True, readonly=True)
+
+    withholding_invoiced_amount = fields.Monetary(
+        string="Ritenuta fatturata",
+        compute='_compute_fiscal_invoiced_amounts', store=True, readonly=True)
+
     vat_label = fields.Char(string="Etichetta IVA", compute="_compute_vat_label", store=False)
 
+    # Copie in cache dei PDF (vedi ir.actions.report), riservate agli amministratori
+    l10n_it_pdf_cache = fields.Binary(
+        string="PDF in cache", attachment=True, copy=False, groups='base.group_system')
+
     @api.depends('order_line.tax_id')
     def _compute_vat_label(self):
         for order in self:
-            taxes = order.order_line.mapped('tax_id')
-            if taxes:
-                order.vat_label = f"IVA {taxes[0].amount:.0f}%"
-            else:
-                order.vat_label = "IVA"
+            order.vat_label = order.order_line.tax_id._l10n_it_vat_label()
 
     @api.depends(
         'order_line.price_subtotal',
         'order_line.tax_id',
+        'order_line.price_tax',
+        'order_line.name',
         'apply_withholding',
         'withholding_percent',
         'apply_cassa',
@@ -73,60 +73,182 @@ class SaleOrder(models.Model):
     )
     def _amount_all(self):
         for order in self:
-            # Separa le righe normali da quelle auto
-            normal_lines = order.order_line.filtered(lambda l: not (l.name and l.name.startswith('[AUTO]')))
-            auto_lines = order.order_line - normal_lines
-            
-            # Calcola imponibile base dalle righe normali
-            amount_untaxed = sum(normal_lines.mapped('price_subtotal'))
-
-            # Trova riga cassa e ritenuta
-            cassa_line = auto_lines.filtered(lambda l: 'Cassa Previdenziale' in (l.name or ''))
-            ritenuta_line = auto_lines.filtered(lambda l: 'Ritenuta' in (l.name or ''))
-
-            # Prendi i valori dalle righe
-            cassa_amount = sum(cassa_line.mapped('price_subtotal')) if cassa_line else 0.0
-            withholding_amount = -sum(ritenuta_line.mapped('price_subtotal')) if ritenuta_line else 0.0
+            order.update(order._prepare_amount_all())
 
-            # Calcola IVA totale
-            amount_tax = sum(order.order_line.mapped('price_tax'))
+    @api.depends('order_line.name', 'order_line.invoice_lines.price_subtotal',
+                 'order_line.invoice_lines.parent_state', 'order_line.invoice_lines.move_id.move_type')
+    def _compute_fiscal_invoiced_amounts(self):
+        for order in self:
+            invoiced = order._get_fiscal_invoiced_amounts()
+            order.cassa_invoiced_amount = invoiced['cassa']
+            order.withholding_invoiced_amount = invoiced['withholding']
+
+    def _get_fiscal_auto_lines(self):
+        """Righe [AUTO] dell'ordine per tipo: {'cassa': riga, 'withholding': riga}"""
+        self.ensure_one()
+        auto_lines = self.order_line.filtered(lambda l: l._is_fiscal_auto_line())
+        return {
+            'cassa': auto_lines.filtered(lambda l: 'Cassa Previdenziale' in l.name)[:1],
+            'withholding': auto_lines.filtered(lambda l: 'Ritenuta' in l.name)[:1],
+        }
+
+    def _get_fiscal_invoiced_amounts(self, exclude_moves=None):
+        """Cassa e ritenuta già fatturate (note di credito in negativo)
+
+        Somma le righe fiscali delle fatture non annullate collegate alle
+        righe [AUTO], escluse quelle di ``exclude_moves``.
+        """
+        self.ensure_one()
+        exclude_moves = exclude_moves or self.env['account.move']
+        invoiced = {}
+        for fiscal_type, auto_line in self._get_fiscal_auto_lines().items():
+            invoice_lines = auto_line.invoice_lines.filtered(
+                lambda l: l.parent_state != 'cancel' and l.move_id not in exclude_moves)
+            invoiced[fiscal_type] = sum(
+                -line.price_subtotal if line.move_id.move_type == 'out_refund' else line.price_subtotal
+                for line in invoice_lines
+            )
+        # La riga ritenuta è negativa
+        invoiced['withholding'] = -invoiced['withholding']
+        return invoiced
+
+    def _is_fiscal_fully_invoiced(self):
+        """Tutte le righe prodotto sono fatturate per intero"""
+        self.ensure_one()
+        lines = self.order_line.filtered(
+            lambda l: not l.display_type and not l.is_downpayment and not l._is_fiscal_auto_line())
+        return all(
+            float_compare(line.qty_invoiced, line.product_uom_qty, precision_rounding=line.product_uom.rounding) >= 0
+            for line in lines
+        )
+
+    def _get_fiscal_completing_move(self):
+        """Fattura che completa l'ordine: l'ultima bozza creata, se l'ordine è fatturato per intero"""
+        self.ensure_one()
+        if not self._is_fiscal_fully_invoiced():
+            return self.env['account.move']
+        moves = self.order_line.invoice_lines.move_id.filtered(
+            lambda m: m.state == 'draft' and m.move_type in ('out_invoice', 'out_refund'))
+        return moves.sorted('id')[-1:]
+
+    def _get_fiscal_invoice_shares(self, invoiced_base, exclude_moves, pending=None, completing=False):
+        """Quote di cassa e ritenuta dell'ordine per una fattura (con segno)
+
+        ``invoiced_base`` è l'imponibile dell'ordine nella fattura, negativo
+        per le note di credito; ``pending`` le quote già assegnate ad altre
+        fatture dello stesso passaggio. Solo la fattura che completa l'ordine
+        (``completing``, vedi ``_get_fiscal_completing_move``) riceve il
+        residuo non ancora fatturato, le altre la quota proporzionale
+        all'imponibile.
+        """
+        self.ensure_one()
+        totals = {'cassa': self.cassa_amount, 'withholding': self.withholding_amount}
+        pending = pending or {}
+        if completing:
+            invoiced = self._get_fiscal_invoiced_amounts(exclude_moves)
+            return {
+                fiscal_type: total - invoiced[fiscal_type] - pending.get(fiscal_type, 0.0)
+                for fiscal_type, total in totals.items()
+            }
+        ratio = invoiced_base / self.amount_untaxed if self.amount_untaxed else 0.0
+        return {
+            fiscal_type: float_round(total * ratio, precision_rounding=self.currency_id.rounding)
+            for fiscal_type, total in totals.items()
+        }
+
+    def _get_invoiceable_lines(self, final=False):
+        """Le righe [AUTO] non si fatturano: cassa e ritenuta vengono ripartite sulle fatture"""
+        return super()._get_invoiceable_lines(final).filtered(lambda l: not l._is_fiscal_auto_line())
+
+    def _prepare_invoice(self):
+        invoice_vals = super()._prepare_invoice()
+        invoice_vals['fiscal_profile_id'] = self.fiscal_profile_id.id
+        invoice_vals.update({fname: self[fname] for fname in FISCAL_SETTING_FIELDS})
+        return invoice_vals
+
+    def _create_invoices(self, grouped=False, final=False, date=None):
+        """Righe fiscali di tutte le fatture create in un solo passaggio"""
+        moves = super(SaleOrder, self.with_context(skip_fiscal_update=True))._create_invoices(
+            grouped=grouped, final=final, date=date)
+        moves = moves.with_context(skip_fiscal_update=False)
+        moves._update_order_fiscal_lines()
+        return moves
+
+    def _prepare_amount_all(self):
+        """Calcola i totali dell'ordine senza scriverli"""
+        self.ensure_one()
+        # Separa le righe normali da quelle auto
+        normal_lines = self.order_line.filtered(lambda l: not (l.name and l.name.startswith('[AUTO]')))
+        auto_lines = self.order_line - normal_lines
+
+        # Calcola imponibile base dalle righe normali
+        amount_untaxed = sum(normal_lines.mapped('price_subtotal'))
+
+        # Trova riga cassa e ritenuta
+        cassa_line = auto_lines.filtered(lambda l: 'Cassa Previdenziale' in (l.name or ''))
+        ritenuta_line = auto_lines.filtered(lambda l: 'Ritenuta' in (l.name or ''))
+
+        # Prendi i valori dalle righe
+        cassa_amount = sum(cassa_line.mapped('price_subtotal')) if cassa_line else 0.0
+        withholding_amount = -sum(ritenuta_line.mapped('price_subtotal')) if ritenuta_line else 0.0
+
+        # Calcola IVA totale
+        amount_tax = sum(self.order_line.mapped('price_tax'))
+
+        # Calcola totali
+        total_gross = amount_untaxed + cassa_amount + amount_tax
+        total_net = total_gross - withholding_amount
+
+        return {
+            'amount_untaxed': amount_untaxed,
+            'cassa_amount': cassa_amount,
+            'amount_tax': amount_tax,
+            'total_gross': total_gross,
+            'withholding_amount': withholding_amount,
+            'amount_total': total_net,
+            'net_amount': total_net,
+        }
+
+    @api.model
+    def _find_cassa_tax(self, profile, company):
+        """Imposta della riga cassa: quella del profilo, altrimenti l'IVA vendite al 22% dell'azienda"""
+        Tax = self.env['account.tax']
+        return profile.cassa_tax_id or Tax.search([
+            *Tax._check_company_domain(company),
+            ('type_tax_use', '=', 'sale'),
+            ('amount', '=', 22),
+        ], limit=1)
 
-            # Calcola totali
-            total_gross = amount_untaxed + cassa_amount + amount_tax
-            total_net = total_gross - withholding_amount
+    def _get_cassa_tax(self):
+        self.ensure_one()
+        return self._find_cassa_tax(self.fiscal_profile_id, self.company_id or self.env.company)
 
-            # Assegnazione ai campi
-            order.amount_untaxed = amount_untaxed
-            order.cassa_amount = cassa_amount
-            order.amount_tax = amount_tax
-            order.total_gross = total_gross
-            order.withholding_amount = withholding_amount
-            order.amount_total = total_net
-            order.net_amount = total_net
+    @api.model
+    def l10n_it_get_cassa_tax_id(self, profile_id, company_id):
+        """Id dell'imposta della riga cassa, per l'anteprima dei totali nel form"""
+        profile = self.env['l10n_it.fiscal.profile'].browse(profile_id or [])
+        company = self.env['res.company'].browse(company_id) if company_id else self.env.company
+        return self._find_cassa_tax(profile, company).id or False
 
     def _get_or_create_auto_product(self, product_type='cassa'):
         """Trova o crea un prodotto per le righe automatiche con conto specifico"""
         if product_type == 'cassa':
             code = 'AUTO_CASSA'
             name = 'Servizio Automatico - Cassa Previdenziale'
-            account_code = '310200'
+            fiscal_type = 'cassa'
         else:  # ritenuta
             code = 'AUTO_RITENUTA'
             name = 'Servizio Automatico - Ritenuta d\'acconto'
-            account_code = '160900'
+            fiscal_type = 'withholding'
             
         auto_product = self.env['product.product'].search([
             ('default_code', '=', code)
         ], limit=1)
         
         if not auto_product:
-            # Cerca il conto contabile specifico
-            account = self.env['account.account'].search([
-                ('code', '=', account_code)
-            ], limit=1)
-            
-            # Usa il conto specifico se trovato, altrimenti None (userà quello di default)
-            account_id = account.id if account else False
+            # Conto fiscale dell'azienda dell'ordine, altrimenti None (userà quello di default)
+            company = self.company_id or self.env.company
+            account_id = company._l10n_it_fiscal_config()['accounts'][fiscal_type] or False
             
             auto_product = self.env['product.product'].create({
                 'name': name,
@@ -142,7 +264,7 @@ class SaleOrder(models.Model):
         
         return auto_product
 
-    @api.onchange('order_line', 'apply_withholding', 'withholding_percent', 'apply_cassa', 'cassa_percent')
+    @api.onchange('order_line')
     def _onchange_withholding_cassa(self):
         _logger.info("=== ONCHANGE TRIGGERATO ===")
         try:
@@ -173,10 +295,7 @@ class SaleOrder(models.Model):
             cassa_amount = 0
             if self.apply_cassa:
                 _logger.info("Calcolo cassa...")
-                tax_22 = self.env['account.tax'].search([
-                    ('type_tax_use', '=', 'sale'),
-                    ('amount', '=', 22),
-                ], limit=1)
+                tax_22 = self._get_cassa_tax()
 
                 auto_product_cassa = self._get_or_create_auto_product('cassa')
                 cassa_amount = base_total * self.cassa_percent / 100.0
@@ -238,7 +357,7 @@ class SaleOrder(models.Model):
     def write(self, vals):
         """Override write per gestire le righe automatiche al salvataggio"""
         result = super().write(vals)
-        if any(key in vals for key in ['apply_withholding', 'withholding_percent', 'apply_cassa', 'cassa_percent', 'order_line']):
+        if any(key in vals for key in ['fiscal_profile_id', 'apply_withholding', 'withholding_percent', 'apply_cassa', 'cassa_percent', 'order_line']):
             for order in self.filtered(lambda o: o.state == 'draft'):
                 try:
                     order._sync_auto_lines()
@@ -267,11 +386,7 @@ class SaleOrder(models.Model):
             # Calcola prima la cassa
             cassa_amount = 0
             if self.apply_cassa:
-                tax_22 = self.env['account.tax'].search([
-                    ('type_tax_use', '=', 'sale'),
-                    ('amount', '=', 22),
-                    ('company_id', '=', self.company_id.id)
-                ], limit=1)
+                tax_22 = self._get_cassa_tax()
 
                 auto_product_cassa = self._get_or_create_auto_product('cassa')
                 cassa_amount = base_total * self.cassa_percent / 100.0
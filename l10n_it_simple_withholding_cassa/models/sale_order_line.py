@@ -0,0 +1,44 @@
+from odoo import api, models
+
+
+class SaleOrderLine(models.Model):
+    _inherit = 'sale.order.line'
+
+    def _is_fiscal_auto_line(self):
+        """Riga [AUTO] di cassa o ritenuta generata dall'ordine"""
+        self.ensure_one()
+        return bool(self.name and self.name.startswith('[AUTO]'))
+
+    @api.depends('invoice_lines.price_subtotal')
+    def _compute_qty_invoiced(self):
+        # Righe [AUTO]: quota fatturata dell'importo, non numero di righe
+        # fiscali collegate (una per fattura e gruppo IVA)
+        super()._compute_qty_invoiced()
+        for line in self.filtered(lambda l: l._is_fiscal_auto_line()):
+            invoice_lines = line.invoice_lines.filtered(lambda l: l.parent_state != 'cancel')
+            invoiced = sum(
+                -inv_line.price_subtotal if inv_line.move_id.move_type == 'out_refund' else inv_line.price_subtotal
+                for inv_line in invoice_lines
+            )
+            line.qty_invoiced = invoiced / line.price_subtotal * line.product_uom_qty if line.price_subtotal else 0.0
+
+    def _compute_qty_to_invoice(self):
+        # Le righe [AUTO] non si fatturano direttamente: vengono ripartite
+        # sulle fatture dell'ordine
+        super()._compute_qty_to_invoice()
+        for line in self:
+            if line._is_fiscal_auto_line():
+                line.qty_to_invoice = 0.0
+
+    def _compute_invoice_status(self):
+        super()._compute_invoice_status()
+        for line in self:
+            if line._is_fiscal_auto_line():
+                line.invoice_status = 'invoiced'
+
+    def _prepare_base_line_for_taxes_computation(self, **kwargs):
+        # Acconti: le righe [AUTO] non entrano nella base, cassa e ritenuta
+        # vengono ripartite sulla fattura d'acconto come sulle altre fatture
+        if self.env.context.get('l10n_it_down_payment_base') and self._is_fiscal_auto_line():
+            kwargs['quantity'] = 0.0
+        return super()._prepare_base_line_for_taxes_computation(**kwargs)
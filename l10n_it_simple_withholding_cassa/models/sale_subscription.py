@@ -3,19 +3,9 @@ from odoo.tools import float_round
 
 
 class SaleSubscription(models.Model):
-    _inherit = "sale.subscription"
+    _name = "sale.subscription"
+    _inherit = ["sale.subscription", "l10n_it.fiscal.profile.mixin"]
 
-    # Campi per la Cassa Previdenziale
-    apply_cassa = fields.Boolean(
-        string="Applica Cassa Previdenziale",
-        default=lambda self: self.env.company.enable_cassa_previdenziale,
-        help="Applica la cassa previdenziale a questo abbonamento"
-    )
-    cassa_percent = fields.Float(
-        string="Percentuale Cassa",
-        default=4.0,
-        help="Percentuale della cassa previdenziale"
-    )
     cassa_amount = fields.Monetary(
         string="Importo Cassa",
         compute="_compute_fiscal_amounts",
@@ -23,17 +13,6 @@ class SaleSubscription(models.Model):
         currency_field='currency_id'
     )
 
-    # Campi per la Ritenuta d'Acconto
-    apply_withholding = fields.Boolean(
-        string="Applica Ritenuta d'Acconto",
-        default=lambda self: self.env.company.enable_withholding_tax,
-        help="Applica la ritenuta d'acconto a questo abbonamento"
-    )
-    withholding_percent = fields.Float(
-        string="Percentuale Ritenuta",
-        default=20.0,
-        help="Percentuale della ritenuta d'acconto"
-    )
     withholding_amount = fields.Monetary(
         string="Importo Ritenuta",
         compute="_compute_fiscal_amounts",
@@ -55,23 +34,41 @@ class SaleSubscription(models.Model):
         currency_field='currency_id'
     )
 
-    @api.depends('recurring_total', 'apply_cassa', 'cassa_percent',
+    # MRR fiscale (importi normalizzati al mese)
+    net_mrr = fields.Monetary(
+        string="MRR Netto Ritenuta",
+        compute="_compute_fiscal_mrr",
+        store=True,
+        currency_field='currency_id'
+    )
+    cassa_mrr = fields.Monetary(
+        string="MRR Cassa",
+        compute="_compute_fiscal_mrr",
+        store=True,
+        currency_field='currency_id'
+    )
+
+    @api.depends('recurring_invoice_line_ids.price_subtotal', 'recurring_invoice_line_ids.name',
+                 'currency_id', 'apply_cassa', 'cassa_percent',
                  'apply_withholding', 'withholding_percent')
     def _compute_fiscal_amounts(self):
         """Calcola gli importi fiscali per l'abbonamento"""
         for subscription in self:
-            # Base: totale ricorrente dell'abbonamento dalle righe normali
-            normal_lines = subscription.recurring_invoice_line_ids.filtered(
-                lambda l: not subscription._is_fiscal_line(l)
+            # Base: totale ricorrente delle righe normali; le righe di tutti gli
+            # abbonamenti in self vengono lette insieme grazie al prefetch
+            base_amount = sum(
+                line.price_subtotal
+                for line in subscription.recurring_invoice_line_ids
+                if not subscription._is_fiscal_line(line)
             )
-            base_amount = sum(line.price_subtotal for line in normal_lines)
+            rounding = subscription.currency_id.rounding
 
             # Calcolo Cassa Previdenziale
             cassa_amount = 0.0
             if subscription.apply_cassa:
                 cassa_amount = float_round(
                     base_amount * subscription.cassa_percent / 100.0,
-                    precision_rounding=subscription.currency_id.rounding
+                    precision_rounding=rounding
                 )
 
             # Totale lordo (base + cassa)
@@ -82,13 +79,13 @@ class SaleSubscription(models.Model):
             if subscription.apply_withholding:
                 withholding_amount = float_round(
                     total_gross * subscription.withholding_percent / 100.0,
-                    precision_rounding=subscription.currency_id.rounding
+                    precision_rounding=rounding
                 )
 
             # Netto a pagare (totale lordo - ritenuta)
             net_amount = float_round(
                 total_gross - withholding_amount,
-                precision_rounding=subscription.currency_id.rounding
+                precision_rounding=rounding
             )
 
             # Assegnazione valori
@@ -97,6 +94,17 @@ class SaleSubscription(models.Model):
             subscription.total_gross = total_gross
             subscription.net_amount = net_amount
 
+    @api.depends('net_amount', 'cassa_amount', 'recurring_total', 'recurring_monthly')
+    def _compute_fiscal_mrr(self):
+        """Riporta netto e cassa al mese con lo stesso rapporto di recurring_monthly"""
+        for subscription in self:
+            factor = 0.0
+            if subscription.recurring_total:
+                factor = subscription.recurring_monthly / subscription.recurring_total
+            rounding = subscription.currency_id.rounding
+            subscription.net_mrr = float_round(subscription.net_amount * factor, precision_rounding=rounding)
+            subscription.cassa_mrr = float_round(subscription.cassa_amount * factor, precision_rounding=rounding)
+
     def _is_fiscal_line(self, line):
         """Identifica se una riga è una riga fiscale auto-generata"""
         if not line.name:
@@ -110,6 +118,7 @@ class SaleSubscription(models.Model):
 
         # Trasferisci le impostazioni fiscali alla fattura
         invoice_data.update({
+            'fiscal_profile_id': self.fiscal_profile_id.id,
             'apply_cassa': self.apply_cassa,
             'cassa_percent': self.cassa_percent,
             'apply_withholding': self.apply_withholding,
@@ -117,18 +126,3 @@ class SaleSubscription(models.Model):
         })
 
         return invoice_data
-
-    @api.model
-    def create(self, vals):
-        """Override create per applicare i default aziendali"""
-        company = self.env.company
-
-        # Applica default cassa se non specificato
-        if 'cassa_percent' not in vals:
-            vals['cassa_percent'] = getattr(company, 'default_cassa_percent', 4.0)
-
-        # Applica default ritenuta se non specificato
-        if 'withholding_percent' not in vals:
-            vals['withholding_percent'] = getattr(company, 'default_withholding_percent', 20.0)
-
-        return super().create(vals)
\ No newline at end of file
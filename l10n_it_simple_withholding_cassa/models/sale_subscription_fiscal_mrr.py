@@ -0,0 +1,109 @@
+from collections import defaultdict
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import models, fields, api, tools
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleSubscriptionFiscalMrr(models.Model):
+    """Aggregati mensili per azienda di MRR netto ritenuta e MRR cassa
+
+    Gli importi sono convertiti nella valuta dell'azienda. Il modulo non
+    dipende da ``sale_subscription``: senza il modello (o la tabella) degli
+    abbonamenti l'aggiornamento non fa nulla.
+    """
+    _name = 'sale.subscription.fiscal.mrr'
+    _description = "MRR fiscale abbonamenti per azienda e mese"
+    _order = 'month desc, company_id'
+    _rec_name = 'month'
+
+    company_id = fields.Many2one('res.company', string="Azienda", required=True, readonly=True, index=True)
+    month = fields.Date(string="Mese", required=True, readonly=True, index=True)
+    currency_id = fields.Many2one(related='company_id.currency_id', string="Valuta")
+    subscription_count = fields.Integer(string="Abbonamenti attivi", readonly=True, aggregator='sum')
+    net_mrr = fields.Monetary(string="MRR Netto Ritenuta", readonly=True)
+    cassa_mrr = fields.Monetary(string="MRR Cassa", readonly=True)
+
+    _sql_constraints = [
+        ('company_month_uniq', 'unique(company_id, month)',
+         "Esiste già un aggregato per questa azienda e questo mese."),
+    ]
+
+    @api.model
+    def _subscriptions_available(self):
+        return 'sale.subscription' in self.env and tools.sql.table_exists(self.env.cr, 'sale_subscription')
+
+    @api.model
+    def _active_subscriptions_query(self, month):
+        """Condizione SQL degli abbonamenti attivi nel mese
+
+        Con le date di inizio e fine si individuano anche gli abbonamenti
+        attivi nei mesi passati; senza, vale lo stato corrente.
+        """
+        cr = self.env.cr
+        if tools.sql.column_exists(cr, 'sale_subscription', 'date_start') \
+                and tools.sql.column_exists(cr, 'sale_subscription', 'date'):
+            return (
+                """s.state NOT IN ('draft', 'cancel')
+                   AND s.date_start <= %(month_end)s
+                   AND (s.date IS NULL OR s.date >= %(month)s)"""
+            )
+        return "s.state = 'open'"
+
+    @api.model
+    def _refresh_month(self, month=None):
+        """Aggiorna l'aggregato del mese indicato (default: mese corrente)
+
+        Somma in SQL i campi memorizzati net_mrr / cassa_mrr degli abbonamenti
+        attivi nel mese per azienda e valuta, senza caricare gli abbonamenti
+        nell'ORM; le somme in altre valute vengono convertite nella valuta
+        dell'azienda al cambio di fine mese.
+        """
+        if not self._subscriptions_available():
+            _logger.info("Modello sale.subscription non installato: aggregati MRR non aggiornati")
+            return
+        month = fields.Date.start_of(month or fields.Date.context_today(self), 'month')
+        month_end = fields.Date.end_of(month, 'month')
+        rate_date = min(month_end, fields.Date.context_today(self))
+        self.env['sale.subscription'].flush_model(['company_id', 'currency_id', 'state', 'net_mrr', 'cassa_mrr'])
+        self.env.cr.execute(f"""
+            SELECT s.company_id, s.currency_id, COUNT(*),
+                   COALESCE(SUM(s.net_mrr), 0), COALESCE(SUM(s.cassa_mrr), 0)
+              FROM sale_subscription s
+             WHERE s.company_id IS NOT NULL
+               AND {self._active_subscriptions_query(month)}
+          GROUP BY s.company_id, s.currency_id
+        """, {'month': month, 'month_end': month_end})
+
+        totals = defaultdict(lambda: {'subscription_count': 0, 'net_mrr': 0.0, 'cassa_mrr': 0.0})
+        Currency = self.env['res.currency']
+        for company_id, currency_id, count, net_mrr, cassa_mrr in self.env.cr.fetchall():
+            company = self.env['res.company'].browse(company_id)
+            currency = Currency.browse(currency_id) if currency_id else company.currency_id
+            row = totals[company_id]
+            row['subscription_count'] += count
+            for fname, amount in (('net_mrr', net_mrr), ('cassa_mrr', cassa_mrr)):
+                row[fname] += currency._convert(float(amount), company.currency_id, company, rate_date)
+
+        self.search([('month', '=', month)]).unlink()
+        self.create([dict(values, company_id=company_id, month=month) for company_id, values in totals.items()])
+        _logger.info("Aggregati MRR fiscale aggiornati per %s (%s aziende)", month, len(totals))
+
+    @api.model
+    def _cron_refresh_mrr(self):
+        """Aggiorna il mese corrente e aggiunge i mesi mancanti dall'ultimo aggregato
+
+        I mesi passati già aggregati sono chiusi: ricalcolarli dai valori
+        correnti degli abbonamenti ne sovrascriverebbe lo storico.
+        """
+        if not self._subscriptions_available():
+            return
+        current = fields.Date.start_of(fields.Date.context_today(self), 'month')
+        last = self.search([], order='month desc', limit=1).month
+        month = last + relativedelta(months=1) if last and last < current else current
+        while month <= current:
+            self._refresh_month(month)
+            month += relativedelta(months=1)
@@ -84,6 +84,18 @@ class SaleSubscriptionWithFiscalLines(models.Model):
     """Estensione di SaleSubscription con la logica di aggiornamento delle righe fiscali"""
     _inherit = 'sale.subscription'
 
+    vat_label = fields.Char(string="Etichetta IVA", compute='_compute_vat_label')
+
+    @api.depends('recurring_invoice_line_ids.product_id', 'company_id')
+    def _compute_vat_label(self):
+        # Le imposte si applicano in fattura: aliquote dei prodotti
+        # nell'azienda (o nelle aziende madri, per le filiali)
+        for subscription in self:
+            companies = subscription.company_id.parent_ids
+            taxes = subscription.recurring_invoice_line_ids.product_id.taxes_id.filtered(
+                lambda t: t.company_id in companies)
+            subscription.vat_label = taxes._l10n_it_vat_label()
+
     def _is_fiscal_line(self, line):
         """Identifica se una riga è una riga fiscale auto-generata"""
         if not line.name:
@@ -205,19 +217,6 @@ class SaleSubscriptionWithFiscalLines(models.Model):
             'taxes_id': [],  # Nessuna imposta di default
         })
 
-    @api.onchange('apply_cassa', 'apply_withholding', 'cassa_percent', 'withholding_percent')
-    def _onchange_fiscal_settings(self):
-        """Aggiorna le righe fiscali quando cambiano le impostazioni"""
-        if self.state in ['draft', 'open']:
-            # Solo messaggio informativo, l'aggiornamento avverrà automaticamente
-            if (self.apply_cassa or self.apply_withholding) and self.recurring_invoice_line_ids:
-                return {
-                    'warning': {
-                        'title': 'Aggiornamento Automatico',
-                        'message': 'Le righe fiscali verranno aggiornate automaticamente quando salvi o modifichi le righe prodotto.'
-                    }
-                }
-
     def _prepare_invoice_data(self):
         """Override per trasferire i dati fiscali all'invoice"""
         invoice_data = super()._prepare_invoice_data()
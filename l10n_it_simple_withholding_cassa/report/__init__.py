@@ -0,0 +1 @@
+from . import fiscal_report
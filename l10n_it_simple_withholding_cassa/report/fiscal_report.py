@@ -0,0 +1,171 @@
+from odoo import models, fields, api, tools
+import logging
+
+_logger = logging.getLogger(__name__)
+
+MATERIALIZED_PARAM = 'l10n_it_simple_withholding_cassa.fiscal_report_materialized'
+
+
+class FiscalReport(models.Model):
+    """Analisi di cassa e ritenuta su offerte, fatture e abbonamenti
+
+    Vista SQL in sola lettura che unisce i campi memorizzati dei tre documenti.
+    Gli importi sono convertiti nella valuta dell'azienda del documento
+    (cambio del documento per ordini e fatture, cambio alla data di inizio
+    per gli abbonamenti): le misure si possono sommare tra valute diverse.
+    Se il parametro di sistema MATERIALIZED_PARAM è attivo la vista viene
+    creata come materializzata (con indici) e aggiornata dal cron.
+    """
+    _name = 'l10n_it.fiscal.report'
+    _description = "Analisi Cassa e Ritenuta"
+    _auto = False
+    _order = 'date desc'
+    _rec_name = 'name'
+
+    document_type = fields.Selection([
+        ('order', 'Offerta/Ordine'),
+        ('invoice', 'Fattura'),
+        ('subscription', 'Abbonamento'),
+    ], string="Tipo Documento", readonly=True)
+    name = fields.Char(string="Documento", readonly=True)
+    res_id = fields.Integer(string="ID Documento", readonly=True)
+    date = fields.Date(string="Data", readonly=True)
+    company_id = fields.Many2one('res.company', string="Azienda", readonly=True)
+    partner_id = fields.Many2one('res.partner', string="Cliente", readonly=True)
+    user_id = fields.Many2one('res.users', string="Commerciale", readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Valuta", readonly=True,
+                                  help="Valuta dell'azienda, in cui sono espressi gli importi")
+    document_currency_id = fields.Many2one('res.currency', string="Valuta documento", readonly=True)
+    state = fields.Char(string="Stato", readonly=True)
+    cassa_amount = fields.Monetary(string="Importo Cassa Previdenziale", readonly=True)
+    withholding_amount = fields.Monetary(string="Importo Ritenuta", readonly=True)
+    total_gross = fields.Monetary(string="Totale lordo", readonly=True)
+    net_amount = fields.Monetary(string="Netto a Pagare", readonly=True)
+
+    def _select_orders(self):
+        return """
+            SELECT so.id * 3 AS id,
+                   'order' AS document_type,
+                   so.name AS name,
+                   so.id AS res_id,
+                   so.date_order::date AS date,
+                   so.company_id,
+                   so.partner_id,
+                   so.user_id,
+                   c.currency_id,
+                   so.currency_id AS document_currency_id,
+                   so.state::varchar AS state,
+                   so.cassa_amount / {rate} AS cassa_amount,
+                   so.withholding_amount / {rate} AS withholding_amount,
+                   so.total_gross / {rate} AS total_gross,
+                   so.net_amount / {rate} AS net_amount
+              FROM sale_order so
+              JOIN res_company c ON c.id = so.company_id
+        """.format(rate="COALESCE(NULLIF(so.currency_rate, 0), 1.0)")
+
+    def _select_invoices(self):
+        # Le note di credito entrano con segno negativo; il cambio è quello
+        # della fattura (totale in valuta aziendale / totale in valuta)
+        return """
+            SELECT am.id * 3 + 1 AS id,
+                   'invoice' AS document_type,
+                   am.name AS name,
+                   am.id AS res_id,
+                   COALESCE(am.invoice_date, am.date) AS date,
+                   am.company_id,
+                   am.commercial_partner_id AS partner_id,
+                   am.invoice_user_id AS user_id,
+                   c.currency_id,
+                   am.currency_id AS document_currency_id,
+                   am.state::varchar AS state,
+                   {sign} * {factor} * am.cassa_amount AS cassa_amount,
+                   {sign} * {factor} * am.withholding_amount AS withholding_amount,
+                   {sign} * {factor} * am.total_gross AS total_gross,
+                   {sign} * {factor} * am.net_amount AS net_amount
+              FROM account_move am
+              JOIN res_company c ON c.id = am.company_id
+             WHERE am.move_type IN ('out_invoice', 'out_refund')
+        """.format(
+            sign="(CASE WHEN am.move_type = 'out_refund' THEN -1 ELSE 1 END)",
+            factor="(CASE WHEN am.currency_id = c.currency_id OR COALESCE(am.amount_total, 0) = 0 THEN 1.0 "
+                   "ELSE ABS(am.amount_total_signed) / am.amount_total END)",
+        )
+
+    def _select_subscriptions(self):
+        return """
+            SELECT ss.id * 3 + 2 AS id,
+                   'subscription' AS document_type,
+                   ss.name AS name,
+                   ss.id AS res_id,
+                   ss.date_start AS date,
+                   ss.company_id,
+                   ss.partner_id,
+                   ss.user_id,
+                   c.currency_id,
+                   ss.currency_id AS document_currency_id,
+                   ss.state::varchar AS state,
+                   ss.cassa_amount / {rate} AS cassa_amount,
+                   ss.withholding_amount / {rate} AS withholding_amount,
+                   ss.total_gross / {rate} AS total_gross,
+                   ss.net_amount / {rate} AS net_amount
+              FROM sale_subscription ss
+              JOIN res_company c ON c.id = ss.company_id
+        """.format(rate=self._currency_rate_sql('ss', 'ss.date_start'))
+
+    def _currency_rate_sql(self, alias, date_expr):
+        """Cambio della valuta del documento rispetto a quella dell'azienda alla data"""
+        return f"""(CASE WHEN {alias}.currency_id = c.currency_id THEN 1.0 ELSE COALESCE((
+                   SELECT NULLIF(r.rate, 0) FROM res_currency_rate r
+                    WHERE r.currency_id = {alias}.currency_id
+                      AND (r.company_id = {alias}.company_id OR r.company_id IS NULL)
+                      AND r.name <= COALESCE({date_expr}, CURRENT_DATE)
+                 ORDER BY r.company_id NULLS LAST, r.name DESC
+                    LIMIT 1), 1.0) END)"""
+
+    def _query(self):
+        queries = [self._select_orders(), self._select_invoices()]
+        if tools.sql.table_exists(self.env.cr, 'sale_subscription'):
+            queries.append(self._select_subscriptions())
+        return "\nUNION ALL\n".join(queries)
+
+    def _is_materialized(self):
+        return tools.str2bool(
+            self.env['ir.config_parameter'].sudo().get_param(MATERIALIZED_PARAM, 'False'))
+
+    def _get_relkind(self):
+        self.env.cr.execute("SELECT relkind FROM pg_class WHERE relname = %s", [self._table])
+        row = self.env.cr.fetchone()
+        return row and row[0]
+
+    def _drop_view(self):
+        relkind = self._get_relkind()
+        if relkind == 'm':
+            self.env.cr.execute(f"DROP MATERIALIZED VIEW {self._table}")
+        elif relkind:
+            self.env.cr.execute(f"DROP VIEW {self._table}")
+
+    def init(self):
+        self._drop_view()
+        if self._is_materialized():
+            self.env.cr.execute(f"CREATE MATERIALIZED VIEW {self._table} AS ({self._query()})")
+            # L'indice univoco permette REFRESH ... CONCURRENTLY
+            self.env.cr.execute(f"CREATE UNIQUE INDEX {self._table}_id_idx ON {self._table} (id)")
+            self.env.cr.execute(f"CREATE INDEX {self._table}_company_date_idx ON {self._table} (company_id, date)")
+            self.env.cr.execute(f"CREATE INDEX {self._table}_partner_idx ON {self._table} (partner_id)")
+        else:
+            self.env.cr.execute(f"CREATE VIEW {self._table} AS ({self._query()})")
+
+    @api.model
+    def _refresh_materialized_view(self):
+        materialized = self._is_materialized()
+        if materialized != (self._get_relkind() == 'm'):
+            # Parametro cambiato dopo l'installazione: ricrea la vista
+            self.init()
+        elif materialized:
+            self.env.flush_all()
+            self.env.cr.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}")
+            _logger.info("Vista materializzata %s aggiornata", self._table)
+
+    @api.model
+    def _cron_refresh(self):
+        self._refresh_materialized_view()
@@ -0,0 +1,109 @@
+/** @odoo-module **/
+
+import { roundPrecision } from "@web/core/utils/numbers";
+
+/**
+ * Calcolo degli importi fiscali lato client.
+ *
+ * Replica le formule (e gli arrotondamenti) di tools/fiscal.py compute_fiscal_totals:
+ * cassa arrotondata sul totale, IVA calcolata riga per riga sulla base con
+ * cassa e arrotondata sul totale, ritenuta su imponibile + cassa.
+ *
+ * @param {Object} params
+ * @param {Array<{subtotal: number, taxRates: number[]}>} params.lines righe normali
+ * @param {boolean} params.applyCassa
+ * @param {number} params.cassaPercent
+ * @param {boolean} params.applyWithholding
+ * @param {number} params.withholdingPercent
+ * @param {number} params.rounding arrotondamento della valuta (es. 0.01)
+ * @param {boolean} [params.withTaxes=true] false per i documenti senza IVA (abbonamenti)
+ */
+export function computeFiscalTotals({
+    lines,
+    applyCassa,
+    cassaPercent,
+    applyWithholding,
+    withholdingPercent,
+    rounding,
+    withTaxes = true,
+}) {
+    const round = (value) => roundPrecision(value, rounding);
+    const untaxed = lines.reduce((sum, line) => sum + line.subtotal, 0);
+
+    const cassa = applyCassa ? round((untaxed * cassaPercent) / 100) : 0;
+    const taxableWithCassa = untaxed + cassa;
+
+    let tax = 0;
+    if (withTaxes) {
+        for (const line of lines) {
+            let base = line.subtotal;
+            if (applyCassa) {
+                base += (base * cassaPercent) / 100;
+            }
+            for (const rate of line.taxRates) {
+                tax += (base * rate) / 100;
+            }
+        }
+        tax = round(tax);
+    }
+    const gross = taxableWithCassa + tax;
+    const withholding = applyWithholding ? round((taxableWithCassa * withholdingPercent) / 100) : 0;
+    const net = round(gross - withholding);
+    return { untaxed, cassa, tax, gross, withholding, net };
+}
+
+/**
+ * Calcolo degli importi di un ordine di vendita lato client.
+ *
+ * Replica _prepare_amount_all e le righe [AUTO] di _sync_auto_lines: la riga
+ * cassa (percentuale sull'imponibile) ha l'imposta della cassa, la ritenuta
+ * si calcola su imponibile + cassa non arrotondata, l'IVA è la somma delle
+ * IVA di riga (arrotondate riga per riga) compresa quella della riga cassa.
+ * Senza imponibile l'ordine non ha righe [AUTO].
+ *
+ * @param {Object} params
+ * @param {Array<{subtotal: number, taxRates: number[]}>} params.lines righe normali
+ * @param {boolean} params.applyCassa
+ * @param {number} params.cassaPercent
+ * @param {number[]} params.cassaTaxRates aliquote dell'imposta della riga cassa
+ * @param {boolean} params.applyWithholding
+ * @param {number} params.withholdingPercent
+ * @param {number} params.rounding arrotondamento della valuta (es. 0.01)
+ */
+export function computeOrderTotals({
+    lines,
+    applyCassa,
+    cassaPercent,
+    cassaTaxRates,
+    applyWithholding,
+    withholdingPercent,
+    rounding,
+}) {
+    const round = (value) => roundPrecision(value, rounding);
+    const lineTax = (subtotal, rates) => round(rates.reduce((sum, rate) => sum + (subtotal * rate) / 100, 0));
+    const untaxed = lines.reduce((sum, line) => sum + line.subtotal, 0);
+    let tax = lines.reduce((sum, line) => sum + lineTax(line.subtotal, line.taxRates), 0);
+
+    let cassa = 0;
+    let withholding = 0;
+    if (untaxed) {
+        const cassaUnrounded = applyCassa ? (untaxed * cassaPercent) / 100 : 0;
+        cassa = round(cassaUnrounded);
+        tax += lineTax(cassa, cassaTaxRates);
+        if (applyWithholding) {
+            withholding = round(((untaxed + cassaUnrounded) * withholdingPercent) / 100);
+        }
+    }
+    const gross = untaxed + cassa + tax;
+    const net = gross - withholding;
+    return { untaxed, cassa, tax, gross, withholding, net };
+}
+
+/**
+ * Subtotale di una riga come lo calcola il server (prezzo scontato per
+ * quantità, arrotondato alla valuta), per righe senza imposte incluse nel
+ * prezzo: con imposte incluse si usa il price_subtotal della riga.
+ */
+export function lineSubtotal(quantity, priceUnit, discount, rounding) {
+    return roundPrecision(quantity * priceUnit * (1 - (discount || 0) / 100), rounding);
+}
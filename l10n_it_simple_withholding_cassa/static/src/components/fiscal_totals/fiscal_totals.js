@@ -0,0 +1,219 @@
+/** @odoo-module **/
+
+import { Component, onWillStart, useEffect, useState } from "@odoo/owl";
+import { getCurrency } from "@web/core/currency";
+import { registry } from "@web/core/registry";
+import { useService } from "@web/core/utils/hooks";
+import { formatMonetary } from "@web/views/fields/formatters";
+import { standardWidgetProps } from "@web/views/widgets/standard_widget_props";
+import { computeFiscalTotals, computeOrderTotals, lineSubtotal } from "./fiscal_amounts";
+
+const FISCAL_LINE_RE = /Cassa previdenziale|Ritenuta d'acconto/;
+
+// Per ogni modello: campo delle righe, campi quantità e imposte, righe fiscali da escludere
+const MODEL_CONFIG = {
+    "account.move": {
+        linesField: "invoice_line_ids",
+        quantityField: "quantity",
+        taxesField: "tax_ids",
+        isFiscalLine: (name) => FISCAL_LINE_RE.test(name),
+    },
+    "sale.order": {
+        linesField: "order_line",
+        quantityField: "product_uom_qty",
+        taxesField: "tax_id",
+        isFiscalLine: (name) => name.startsWith("[AUTO]"),
+        // Totali come _prepare_amount_all: riga cassa con la sua imposta
+        orderTotals: true,
+    },
+    "sale.subscription": {
+        linesField: "recurring_invoice_line_ids",
+        quantityField: "quantity",
+        taxesField: null,
+        isFiscalLine: (name) => FISCAL_LINE_RE.test(name),
+    },
+};
+
+// Aliquote già lette, condivise tra tutti i widget: {tax_id: aliquota %}
+const taxRateCache = new Map();
+// Imposte incluse nel prezzo tra quelle già lette
+const priceIncludedTaxes = new Set();
+// Imposta della riga cassa degli ordini: {"profilo-azienda": tax_id o false}
+const cassaTaxCache = new Map();
+
+function relationId(value) {
+    return Array.isArray(value) ? value[0] : value?.id;
+}
+
+/**
+ * Anteprima di cassa, IVA, ritenuta e netto calcolata nel browser dalle righe
+ * già caricate nel form: si aggiorna a ogni modifica senza chiamate al
+ * server (solo la prima lettura delle aliquote di imposte mai viste).
+ */
+export class FiscalTotals extends Component {
+    static template = "l10n_it_simple_withholding_cassa.FiscalTotals";
+    static props = { ...standardWidgetProps };
+
+    setup() {
+        this.orm = useService("orm");
+        this.state = useState({ loadedTaxes: 0 });
+        this.loading = null;
+        onWillStart(() => this.loadTaxRates());
+        // Letture solo quando compaiono imposte o profili nuovi, mai nel rendering
+        useEffect(
+            () => {
+                this.loadTaxRates();
+            },
+            () => [this.getMissingTaxIds().join(","), this.cassaTaxKey]
+        );
+    }
+
+    get config() {
+        return MODEL_CONFIG[this.props.record.resModel];
+    }
+
+    get currency() {
+        const currencyId = relationId(this.props.record.data.currency_id);
+        return (currencyId && getCurrency(currencyId)) || { digits: [69, 2] };
+    }
+
+    get rounding() {
+        return Math.pow(10, -this.currency.digits[1]);
+    }
+
+    getNormalLines() {
+        const lines = this.props.record.data[this.config.linesField]?.records || [];
+        return lines.filter((line) => {
+            const { display_type: displayType, name } = line.data;
+            if (displayType && displayType !== "product") {
+                return false;
+            }
+            return !this.config.isFiscalLine(name || "");
+        });
+    }
+
+    getTaxIds(line) {
+        const taxesField = this.config.taxesField;
+        return (taxesField && line.data[taxesField]?.currentIds) || [];
+    }
+
+    /**
+     * Chiave dell'imposta della riga cassa (profilo e azienda), solo per gli
+     * ordini con cassa
+     */
+    get cassaTaxKey() {
+        const { data } = this.props.record;
+        if (!this.config.orderTotals || !data.apply_cassa) {
+            return null;
+        }
+        return `${relationId(data.fiscal_profile_id) || 0}-${relationId(data.company_id) || 0}`;
+    }
+
+    get cassaTaxId() {
+        return cassaTaxCache.get(this.cassaTaxKey) || false;
+    }
+
+    getMissingTaxIds() {
+        const missing = new Set();
+        const taxIds = this.getNormalLines().flatMap((line) => this.getTaxIds(line));
+        if (this.cassaTaxId) {
+            taxIds.push(this.cassaTaxId);
+        }
+        for (const taxId of taxIds) {
+            if (!taxRateCache.has(taxId)) {
+                missing.add(taxId);
+            }
+        }
+        return [...missing];
+    }
+
+    async loadCassaTax() {
+        const key = this.cassaTaxKey;
+        if (!key || cassaTaxCache.has(key)) {
+            return;
+        }
+        const [profileId, companyId] = key.split("-").map(Number);
+        cassaTaxCache.set(key, await this.orm.call("sale.order", "l10n_it_get_cassa_tax_id", [profileId, companyId]));
+    }
+
+    /**
+     * Legge le aliquote delle imposte non ancora in cache (e l'imposta della
+     * cassa degli ordini): una sola chiamata quando compare un'imposta nuova,
+     * non a ogni modifica.
+     */
+    loadTaxRates() {
+        if (this.loading) {
+            return this.loading;
+        }
+        if (!this.getMissingTaxIds().length && (!this.cassaTaxKey || cassaTaxCache.has(this.cassaTaxKey))) {
+            return null;
+        }
+        this.loading = (async () => {
+            await this.loadCassaTax();
+            const missing = this.getMissingTaxIds();
+            if (missing.length) {
+                const taxes = await this.orm.read("account.tax", missing, ["amount", "amount_type", "price_include"]);
+                for (const tax of taxes) {
+                    taxRateCache.set(tax.id, tax.amount_type === "percent" ? tax.amount : 0);
+                    if (tax.price_include) {
+                        priceIncludedTaxes.add(tax.id);
+                    }
+                }
+            }
+        })().finally(() => {
+            this.loading = null;
+            // Nuovo rendering con le aliquote lette
+            this.state.loadedTaxes++;
+        });
+        return this.loading;
+    }
+
+    get totals() {
+        const { data } = this.props.record;
+        const rounding = this.rounding;
+        // Lettura dello stato: nuovo rendering quando arrivano le aliquote
+        void this.state.loadedTaxes;
+        const lines = this.getNormalLines().map((line) => {
+            const { price_unit: priceUnit, discount, price_subtotal: priceSubtotal } = line.data;
+            const quantity = line.data[this.config.quantityField];
+            const taxIds = this.getTaxIds(line);
+            // Con imposte incluse nel prezzo il subtotale è quello calcolato dal server
+            const subtotal =
+                priceUnit === undefined || quantity === undefined || taxIds.some((taxId) => priceIncludedTaxes.has(taxId))
+                    ? priceSubtotal || 0
+                    : lineSubtotal(quantity, priceUnit, discount, rounding);
+            return {
+                subtotal,
+                taxRates: taxIds.map((taxId) => taxRateCache.get(taxId) || 0),
+            };
+        });
+        if (this.config.orderTotals) {
+            return computeOrderTotals({
+                lines,
+                applyCassa: data.apply_cassa,
+                cassaPercent: data.cassa_percent || 0,
+                cassaTaxRates: this.cassaTaxId ? [taxRateCache.get(this.cassaTaxId) || 0] : [],
+                applyWithholding: data.apply_withholding,
+                withholdingPercent: data.withholding_percent || 0,
+                rounding,
+            });
+        }
+        return computeFiscalTotals({
+            lines,
+            applyCassa: data.apply_cassa,
+            cassaPercent: data.cassa_percent || 0,
+            applyWithholding: data.apply_withholding,
+            withholdingPercent: data.withholding_percent || 0,
+            rounding,
+            withTaxes: Boolean(this.config.taxesField),
+        });
+    }
+
+    format(value) {
+        return formatMonetary(value, { currencyId: relationId(this.props.record.data.currency_id) });
+    }
+}
+
+registry.category("view_widgets").add("l10n_it_fiscal_totals", {
+    component: FiscalTotals,
+});
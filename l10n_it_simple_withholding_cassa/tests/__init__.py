@@ -0,0 +1,9 @@
+from . import test_fiscal_simulation
+from . import test_pdf_cache
+from . import test_order_proration
+from . import test_portal
+from . import test_fiscal_profile
+from . import test_cassa_breakdown
+from . import test_bank_net_match
+from . import test_fiscal_reversal
+from . import test_fiscal_check
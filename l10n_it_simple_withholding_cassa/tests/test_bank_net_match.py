@@ -0,0 +1,100 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestBankNetMatch(AccountTestInvoicingCommon):
+    """Riconciliazione degli incassi sul Netto a Pagare
+
+    Fattura di 1000 senza IVA con cassa 4% e ritenuta 20%: lordo 1040,
+    ritenuta 208, netto 832.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.withholding_account = cls.env['account.account'].create({
+            'name': "Crediti per ritenute subite",
+            'code': '160901',
+            'account_type': 'asset_current',
+        })
+        cls.env.company.write({
+            'enable_cassa_previdenziale': True,
+            'enable_withholding_tax': True,
+            'withholding_account_id': cls.withholding_account.id,
+            'withholding_auto_match': False,
+        })
+
+    def _create_invoice(self, withholding_line=True):
+        invoice = self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_a.id,
+            'invoice_date': '2026-01-15',
+            'apply_cassa': True,
+            'cassa_percent': 4.0,
+            'apply_withholding': True,
+            'withholding_percent': 20.0,
+            'invoice_line_ids': [(0, 0, {
+                'product_id': self.product_a.id,
+                'quantity': 1.0,
+                'price_unit': 1000.0,
+                'tax_ids': [(6, 0, [])],
+            })],
+        })
+        if not withholding_line:
+            # Ritenuta solo negli importi: il credito verso il cliente è il lordo
+            invoice.invoice_line_ids.filtered(lambda l: 'Ritenuta d\'acconto' in l.name).unlink()
+        invoice.action_post()
+        self.assertAlmostEqual(invoice.net_amount, 832.0)
+        self.assertAlmostEqual(invoice.withholding_amount, 208.0)
+        return invoice
+
+    def _register_payment(self, invoice, amount):
+        self.env['account.payment.register'].with_context(
+            active_model='account.move', active_ids=invoice.ids,
+        ).create({'amount': amount, 'payment_date': '2026-01-20'})._create_payments()
+        self.assertEqual(invoice.payment_state, 'partial')
+
+    def _create_statement_line(self, amount):
+        return self.env['account.bank.statement.line'].create({
+            'journal_id': self.company_data['default_journal_bank'].id,
+            'partner_id': self.partner_a.id,
+            'payment_ref': "Incasso fattura",
+            'amount': amount,
+            'date': '2026-02-01',
+        })
+
+    def _match(self, amount, invoice, withholding):
+        line = self._create_statement_line(amount)
+        self.assertEqual(line._l10n_it_match_net_amount(), line)
+        self.assertTrue(line.is_reconciled)
+        self.assertIn(invoice.payment_state, ('paid', 'in_payment'))
+        withholding_lines = line.move_id.line_ids.filtered(lambda l: l.account_id == self.withholding_account)
+        self.assertAlmostEqual(sum(withholding_lines.mapped('balance')), withholding)
+
+    def test_net_amount_with_withholding_line(self):
+        invoice = self._create_invoice()
+        self.assertAlmostEqual(invoice.amount_residual, 832.0)
+        self._match(832.0, invoice, 0.0)
+
+    def test_net_amount_without_withholding_line(self):
+        invoice = self._create_invoice(withholding_line=False)
+        self.assertAlmostEqual(invoice.amount_residual, 1040.0)
+        self._match(832.0, invoice, 208.0)
+
+    def test_partial_with_withholding_line(self):
+        invoice = self._create_invoice()
+        self._register_payment(invoice, 300.0)
+        self._match(532.0, invoice, 0.0)
+
+    def test_partial_without_withholding_line(self):
+        invoice = self._create_invoice(withholding_line=False)
+        self._register_payment(invoice, 300.0)
+        # Residuo 740, incasso 532: la differenza è la ritenuta
+        self._match(532.0, invoice, 208.0)
+
+    def test_no_match_on_other_amount(self):
+        self._create_invoice()
+        line = self._create_statement_line(800.0)
+        self.assertFalse(line._l10n_it_match_net_amount())
+        self.assertFalse(line.is_reconciled)
@@ -0,0 +1,67 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestCassaBreakdown(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env.company.enable_cassa_previdenziale = True
+        cls.taxes = {
+            rate: cls.env['account.tax'].create({
+                'name': f"IVA {rate}% ripartizione",
+                'amount': rate,
+                'amount_type': 'percent',
+                'type_tax_use': 'sale',
+                'company_id': cls.env.company.id,
+            })
+            for rate in (22.0, 10.0, 4.0)
+        }
+
+    def _create_invoice(self, lines):
+        return self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_a.id,
+            'invoice_date': '2026-01-15',
+            'apply_cassa': True,
+            'cassa_percent': 4.0,
+            'apply_withholding': False,
+            'invoice_line_ids': [
+                (0, 0, {
+                    'product_id': self.product_a.id,
+                    'quantity': 1.0,
+                    'price_unit': price_unit,
+                    'tax_ids': [(6, 0, self.taxes[rate].ids)],
+                })
+                for rate, price_unit in lines
+            ],
+        })
+
+    def test_breakdown_residual_on_largest_group(self):
+        # Cassa per gruppo 8.0044 / 4.0044 / 4.0044 -> 8.00 / 4.00 / 4.00,
+        # cassa totale 400.33 * 4% = 16.0132 -> 16.01: il centesimo mancante
+        # va al gruppo con imponibile maggiore
+        invoice = self._create_invoice([(22.0, 200.11), (10.0, 100.11), (4.0, 100.11)])
+        rows = {row['tax_rate']: row for row in invoice._prepare_cassa_breakdown()}
+        self.assertEqual(len(rows), 3)
+        self.assertAlmostEqual(rows[22.0]['cassa_amount'], 8.01)
+        self.assertAlmostEqual(rows[10.0]['cassa_amount'], 4.0)
+        self.assertAlmostEqual(rows[4.0]['cassa_amount'], 4.0)
+        self.assertAlmostEqual(rows[22.0]['tax_amount'], 1.76)
+        self.assertAlmostEqual(sum(row['cassa_amount'] for row in rows.values()), invoice.cassa_amount)
+
+        # Ripartizione memorizzata e righe cassa, una per aliquota
+        stored = {row.tax_rate: row.cassa_amount for row in invoice.fiscal_breakdown_ids}
+        self.assertEqual(set(stored), set(rows))
+        for rate, row in rows.items():
+            self.assertAlmostEqual(stored[rate], row['cassa_amount'])
+        cassa_lines = invoice.invoice_line_ids.filtered(lambda l: l.name.startswith('Cassa previdenziale'))
+        self.assertEqual(len(cassa_lines), 3)
+
+    def test_vat_label(self):
+        invoice = self._create_invoice([(22.0, 200.0), (10.0, 100.0)])
+        self.assertEqual(invoice.vat_label, "IVA 10% / 22%")
+        invoice = self._create_invoice([(4.0, 100.0)])
+        self.assertEqual(invoice.vat_label, "IVA 4%")
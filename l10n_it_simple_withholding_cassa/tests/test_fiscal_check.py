@@ -0,0 +1,84 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestFiscalCheck(AccountTestInvoicingCommon):
+    """Controllo di coerenza: differenze rilevate e riparazione"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env.company.write({'enable_cassa_previdenziale': True, 'enable_withholding_tax': True})
+        tax_22 = cls.env['account.tax'].create({
+            'name': "IVA 22% controllo",
+            'amount': 22.0,
+            'amount_type': 'percent',
+            'type_tax_use': 'sale',
+            'company_id': cls.env.company.id,
+        })
+        cls.invoice = cls.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': cls.partner_a.id,
+            'invoice_date': '2026-01-15',
+            'apply_cassa': True,
+            'cassa_percent': 4.0,
+            'apply_withholding': True,
+            'withholding_percent': 20.0,
+            'invoice_line_ids': [(0, 0, {
+                'product_id': cls.product_a.id,
+                'quantity': 1.0,
+                'price_unit': 1000.0,
+                'tax_ids': [(6, 0, tax_22.ids)],
+            })],
+        })
+        cls.invoice.action_post()
+
+    def _create_check(self):
+        return self.env['l10n_it.fiscal.check'].create({
+            'target': 'account.move',
+            'company_ids': [(6, 0, self.env.company.ids)],
+        })
+
+    def _drifts(self, check):
+        return {
+            (drift.res_id, drift.check_type, drift.field_name): (drift.stored_value, drift.expected_value)
+            for drift in check.drift_ids
+        }
+
+    def test_consistent_invoice(self):
+        check = self._create_check()
+        check.action_run()
+        self.assertEqual(check.state, 'done')
+        self.assertFalse(check.drift_ids)
+
+    def test_drift_and_repair(self):
+        self.assertAlmostEqual(self.invoice.cassa_amount, 40.0)
+        self.assertAlmostEqual(self.invoice.net_amount, 1060.8)
+        self.env.flush_all()
+        self.env.cr.execute(
+            "UPDATE account_move SET net_amount = 1061.8, cassa_amount = 39.5 WHERE id = %s",
+            [self.invoice.id],
+        )
+        self.invoice.invalidate_recordset()
+
+        check = self._create_check()
+        check.action_run()
+        self.assertEqual(check.drift_document_count, 1)
+        # La cassa memorizzata è confrontata sia con le righe sia con la ripartizione
+        self.assertEqual(self._drifts(check), {
+            (self.invoice.id, 'lines', 'net_amount'): (1061.8, 1060.8),
+            (self.invoice.id, 'lines', 'cassa_amount'): (39.5, 40.0),
+            (self.invoice.id, 'breakdown', 'cassa_amount'): (39.5, 40.0),
+        })
+        self.assertFalse(any(check.drift_ids.mapped('repaired')))
+
+        check.action_repair()
+        self.assertTrue(all(check.drift_ids.mapped('repaired')))
+        self.assertAlmostEqual(self.invoice.cassa_amount, 40.0)
+        self.assertAlmostEqual(self.invoice.net_amount, 1060.8)
+
+        # Nessuna differenza al controllo successivo
+        check = self._create_check()
+        check.action_run()
+        self.assertFalse(check.drift_ids)
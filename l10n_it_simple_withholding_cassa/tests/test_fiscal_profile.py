@@ -0,0 +1,32 @@
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestFiscalProfile(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        Profile = cls.env['l10n_it.fiscal.profile']
+        cls.company_profile = Profile.create({'name': "Profilo azienda", 'cassa_percent': 2.0})
+        cls.partner_profile = Profile.create({'name': "Profilo cliente", 'cassa_percent': 5.0})
+        cls.partner = cls.env['res.partner'].create({'name': "Cliente profilo"})
+        cls.partner.fiscal_profile_id = cls.partner_profile
+        cls.company.fiscal_profile_id = cls.company_profile
+
+    def _profile(self):
+        return self.env['l10n_it.fiscal.profile']._get_document_profile(self.partner, self.company)
+
+    def test_partner_profile_first(self):
+        self.assertEqual(self._profile(), self.partner_profile)
+
+    def test_archived_profiles_not_applied(self):
+        self.partner_profile.active = False
+        self.assertEqual(self._profile(), self.company_profile)
+
+        self.company_profile.active = False
+        self.assertFalse(self._profile())
+        defaults = self.company._l10n_it_fiscal_config()['defaults']
+        self.assertEqual(defaults['cassa_percent'], 4.0)
+        self.assertEqual(defaults['withholding_percent'], 20.0)
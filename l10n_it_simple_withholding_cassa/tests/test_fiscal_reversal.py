@@ -0,0 +1,95 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestFiscalReversal(AccountTestInvoicingCommon):
+    """Note di credito: righe, importi e ripartizione copiati dall'originale"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env.company.write({'enable_cassa_previdenziale': True, 'enable_withholding_tax': True})
+        cls.tax_22 = cls.env['account.tax'].create({
+            'name': "IVA 22% storno",
+            'amount': 22.0,
+            'amount_type': 'percent',
+            'type_tax_use': 'sale',
+            'company_id': cls.env.company.id,
+        })
+        cls.product = cls.env['product.product'].create({
+            'name': "Consulenza a ore",
+            'type': 'service',
+            'invoice_policy': 'delivery',
+            'list_price': 100.0,
+            'taxes_id': [(6, 0, cls.tax_22.ids)],
+        })
+
+    def _fiscal_lines(self, move):
+        return sorted(
+            (line.name, line.price_unit, tuple(line.tax_ids.ids))
+            for line in move.invoice_line_ids.filtered(move._is_fiscal_line)
+        )
+
+    def _breakdown(self, move):
+        return sorted(
+            (row.tax_rate, row.base_amount, row.cassa_amount, row.tax_amount, tuple(row.tax_ids.ids))
+            for row in move.fiscal_breakdown_ids
+        )
+
+    def _assert_reversal(self, invoice, cassa, withholding):
+        self.assertAlmostEqual(invoice.cassa_amount, cassa)
+        self.assertAlmostEqual(invoice.withholding_amount, withholding)
+        refund = invoice._reverse_moves()
+        self.assertEqual(refund.move_type, 'out_refund')
+        self.assertEqual(refund.fiscal_from_order, invoice.fiscal_from_order)
+        for fname in ('cassa_amount', 'total_gross', 'withholding_amount', 'net_amount'):
+            self.assertAlmostEqual(refund[fname], invoice[fname], msg=fname)
+        self.assertEqual(self._fiscal_lines(refund), self._fiscal_lines(invoice))
+        self.assertTrue(refund.fiscal_breakdown_ids)
+        self.assertEqual(self._breakdown(refund), self._breakdown(invoice))
+        self.assertAlmostEqual(refund.amount_total, invoice.amount_total)
+        # Nessuna differenza rispetto al ricalcolo da zero
+        self.assertFalse(refund._verify_fiscal_amounts())
+        return refund
+
+    def test_reverse_invoice(self):
+        invoice = self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_a.id,
+            'invoice_date': '2026-01-15',
+            'apply_cassa': True,
+            'cassa_percent': 4.0,
+            'apply_withholding': True,
+            'withholding_percent': 20.0,
+            'invoice_line_ids': [(0, 0, {
+                'product_id': self.product.id,
+                'quantity': 10.0,
+                'price_unit': 100.0,
+                'tax_ids': [(6, 0, self.tax_22.ids)],
+            })],
+        })
+        invoice.action_post()
+        self._assert_reversal(invoice, 40.0, 208.0)
+
+    def test_reverse_partial_order_invoice(self):
+        order = self.env['sale.order'].create({
+            'partner_id': self.partner_a.id,
+            'apply_cassa': True,
+            'cassa_percent': 4.0,
+            'apply_withholding': True,
+            'withholding_percent': 20.0,
+            'order_line': [(0, 0, {
+                'product_id': self.product.id,
+                'product_uom_qty': 10.0,
+                'price_unit': 100.0,
+                'tax_id': [(6, 0, self.tax_22.ids)],
+            })],
+        })
+        order.action_confirm()
+        order.order_line.filtered(lambda l: not l._is_fiscal_auto_line()).qty_delivered = 3.0
+        invoice = order._create_invoices()
+        invoice.action_post()
+        self.assertTrue(invoice.fiscal_from_order)
+        # Quota del 30% dell'ordine: cassa 12, ritenuta 62.4
+        self._assert_reversal(invoice, 12.0, 62.4)
@@ -0,0 +1,96 @@
+from odoo.tests import HttpCase, TransactionCase, tagged
+
+
+class FiscalSimulationCommon:
+
+    @classmethod
+    def _setup_simulation(cls):
+        cls.company = cls.env.company
+        cls.company.write({'enable_cassa_previdenziale': True, 'enable_withholding_tax': True})
+        cls.tax_22 = cls.env['account.tax'].create({
+            'name': "IVA 22% test",
+            'amount': 22.0,
+            'amount_type': 'percent',
+            'type_tax_use': 'sale',
+            'company_id': cls.company.id,
+        })
+        cls.item = {
+            'lines': [{'amount': 1000.0, 'tax_ids': [cls.tax_22.id]}],
+            'apply_cassa': True,
+            'cassa_percent': 4.0,
+            'apply_withholding': True,
+            'withholding_percent': 20.0,
+        }
+
+
+@tagged('post_install', '-at_install')
+class TestFiscalSimulation(FiscalSimulationCommon, TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._setup_simulation()
+
+    def test_simulate_totals(self):
+        result, = self.company._l10n_it_simulate_fiscal([self.item])
+        self.assertAlmostEqual(result['cassa_amount'], 40.0)
+        self.assertAlmostEqual(result['amount_tax'], 228.8)
+        self.assertAlmostEqual(result['total_gross'], 1268.8)
+        self.assertAlmostEqual(result['withholding_amount'], 208.0)
+        self.assertAlmostEqual(result['net_amount'], 1060.8)
+
+    def test_branch_uses_parent_tax(self):
+        branch = self.env['res.company'].create({'name': "Filiale test", 'parent_id': self.company.id})
+        result, = branch._l10n_it_simulate_fiscal([self.item])
+        self.assertNotIn('error', result)
+        self.assertAlmostEqual(result['amount_tax'], 228.8)
+
+    def test_foreign_company_tax_rejected(self):
+        other = self.env['res.company'].create({'name': "Altra azienda test"})
+        result, = other._l10n_it_simulate_fiscal([self.item])
+        self.assertIn('error', result)
+
+    def test_tax_rate_cache_invalidation(self):
+        self.company._l10n_it_simulate_fiscal([self.item])
+        self.tax_22.amount = 10.0
+        result, = self.company._l10n_it_simulate_fiscal([self.item])
+        self.assertAlmostEqual(result['amount_tax'], 104.0)
+
+        self.tax_22.unlink()
+        result, = self.company._l10n_it_simulate_fiscal([self.item])
+        self.assertIn('error', result)
+
+    def test_rounding_follows_company_currency(self):
+        self.company._l10n_it_simulate_fiscal([self.item])
+        self.company.currency_id.rounding = 1.0
+        item = dict(self.item, lines=[{'amount': 1001.0, 'tax_ids': []}])
+        result, = self.company._l10n_it_simulate_fiscal([item])
+        self.assertEqual(result['cassa_amount'], 40.0)
+
+
+@tagged('post_install', '-at_install')
+class TestFiscalSimulationRoute(FiscalSimulationCommon, HttpCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._setup_simulation()
+
+    def test_simulate_route(self):
+        self.authenticate('admin', 'admin')
+        result = self.make_jsonrpc_request('/l10n_it_withholding/simulate', {
+            'items': [self.item, {'lines': [{'amount': 100.0, 'tax_ids': [0]}]}],
+        })
+        self.assertEqual(result['company_id'], self.company.id)
+        first, second = result['items']
+        self.assertAlmostEqual(first['net_amount'], 1060.8)
+        self.assertIn('error', second)
+
+    def test_simulate_route_forbidden_company(self):
+        other = self.env['res.company'].create({'name': "Azienda non consentita test"})
+        self.authenticate('admin', 'admin')
+        with self.assertRaises(Exception):
+            self.make_jsonrpc_request('/l10n_it_withholding/simulate', {
+                'items': [self.item],
+                'company_id': other.id,
+            })
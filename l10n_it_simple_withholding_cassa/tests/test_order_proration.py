@@ -0,0 +1,142 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestOrderProration(AccountTestInvoicingCommon):
+    """Cassa e ritenuta dell'ordine ripartite sulle fatture
+
+    Ordine di 10 x 100 con cassa 4% e ritenuta 20%: cassa 40, ritenuta
+    (1000 + 40) * 20% = 208.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env.company.write({'enable_cassa_previdenziale': True, 'enable_withholding_tax': True})
+        cls.tax_22 = cls.env['account.tax'].create({
+            'name': "IVA 22% ripartizione",
+            'amount': 22.0,
+            'amount_type': 'percent',
+            'type_tax_use': 'sale',
+            'company_id': cls.env.company.id,
+        })
+        cls.product = cls.env['product.product'].create({
+            'name': "Consulenza a ore",
+            'type': 'service',
+            'invoice_policy': 'delivery',
+            'list_price': 100.0,
+            'taxes_id': [(6, 0, cls.tax_22.ids)],
+        })
+
+    def setUp(self):
+        super().setUp()
+        self.order = self.env['sale.order'].create({
+            'partner_id': self.partner_a.id,
+            'apply_cassa': True,
+            'cassa_percent': 4.0,
+            'apply_withholding': True,
+            'withholding_percent': 20.0,
+            'order_line': [(0, 0, {
+                'product_id': self.product.id,
+                'product_uom_qty': 10.0,
+                'price_unit': 100.0,
+                'tax_id': [(6, 0, self.tax_22.ids)],
+            })],
+        })
+        self.order.action_confirm()
+        self.auto_lines = self.order._get_fiscal_auto_lines()
+        self.product_line = self.order.order_line.filtered(lambda l: not l._is_fiscal_auto_line())
+
+    def _invoice_delivered(self, qty_delivered, post=True, final=False):
+        self.product_line.qty_delivered = qty_delivered
+        invoice = self.order._create_invoices(final=final)
+        if post:
+            invoice.action_post()
+        return invoice
+
+    def _base_amount(self, move):
+        """Imponibile della fattura senza righe cassa e ritenuta"""
+        lines = move.invoice_line_ids.filtered(lambda l: l.display_type == 'product' and not move._is_fiscal_line(l))
+        return sum(lines.mapped('price_subtotal'))
+
+    def _fiscal_amounts(self, move):
+        """(cassa, ritenuta) della fattura, dalle righe collegate alle righe [AUTO]"""
+        def total(auto_line):
+            return sum(move.invoice_line_ids.filtered(lambda l: auto_line in l.sale_line_ids).mapped('price_subtotal'))
+        return total(self.auto_lines['cassa']), -total(self.auto_lines['withholding'])
+
+    def _assert_fiscal_amounts(self, move, cassa, withholding):
+        move_cassa, move_withholding = self._fiscal_amounts(move)
+        self.assertAlmostEqual(move_cassa, cassa)
+        self.assertAlmostEqual(move_withholding, withholding)
+
+    def _assert_order_invoiced(self, cassa, withholding):
+        invoiced = self.order._get_fiscal_invoiced_amounts()
+        self.assertAlmostEqual(invoiced['cassa'], cassa)
+        self.assertAlmostEqual(invoiced['withholding'], withholding)
+        # Quantità fatturata delle righe [AUTO]: quota dell'importo fatturata
+        self.assertAlmostEqual(self.auto_lines['cassa'].qty_invoiced, cassa / 40.0)
+        self.assertAlmostEqual(self.auto_lines['withholding'].qty_invoiced, withholding / 208.0)
+
+    def test_order_totals(self):
+        self.assertAlmostEqual(self.order.amount_untaxed, 1000.0)
+        self.assertAlmostEqual(self.order.cassa_amount, 40.0)
+        self.assertAlmostEqual(self.order.withholding_amount, 208.0)
+
+    def test_partial_partial_final(self):
+        first = self._invoice_delivered(3.0)
+        self._assert_fiscal_amounts(first, 12.0, 62.4)
+        self._assert_order_invoiced(12.0, 62.4)
+        second = self._invoice_delivered(7.0)
+        self._assert_fiscal_amounts(second, 16.0, 83.2)
+        self._assert_order_invoiced(28.0, 145.6)
+        final = self._invoice_delivered(10.0)
+        self._assert_fiscal_amounts(final, 12.0, 62.4)
+        self._assert_order_invoiced(40.0, 208.0)
+
+    def test_residual_only_on_completing_move(self):
+        first = self._invoice_delivered(3.0, post=False)
+        final = self._invoice_delivered(10.0, post=False)
+        self.assertEqual(self.order._get_fiscal_completing_move(), final)
+        self._assert_fiscal_amounts(first, 12.0, 62.4)
+        self._assert_fiscal_amounts(final, 28.0, 145.6)
+
+        # La bozza ripartita di nuovo riceve la quota proporzionale, il
+        # residuo resta sulla fattura che completa l'ordine
+        first.invoice_line_ids.filtered(lambda l: self.product_line in l.sale_line_ids).price_unit = 50.0
+        self._assert_fiscal_amounts(first, 6.0, 31.2)
+        self._assert_fiscal_amounts(final, 34.0, 176.8)
+        self._assert_order_invoiced(40.0, 208.0)
+
+    def test_down_payment(self):
+        wizard = self.env['sale.advance.payment.inv'].with_context(
+            active_model='sale.order', active_ids=self.order.ids,
+        ).create({'advance_payment_method': 'percentage', 'amount': 10.0})
+        wizard.create_invoices()
+        down_payment = self.order.invoice_ids
+        self.assertEqual(len(down_payment), 1)
+        # Base dell'acconto: solo le righe prodotto, senza cassa e ritenuta [AUTO]
+        self.assertAlmostEqual(self._base_amount(down_payment), 100.0)
+        self._assert_fiscal_amounts(down_payment, 4.0, 20.8)
+        down_payment.action_post()
+
+        partial = self._invoice_delivered(4.0)
+        self._assert_fiscal_amounts(partial, 16.0, 83.2)
+        final = self._invoice_delivered(10.0, final=True)
+        # Acconto detratto dall'ultima fattura: imponibile 600 - 100
+        self.assertAlmostEqual(self._base_amount(final), 500.0)
+        self._assert_fiscal_amounts(final, 20.0, 104.0)
+        self._assert_order_invoiced(40.0, 208.0)
+
+    def test_credit_note(self):
+        first = self._invoice_delivered(3.0)
+        refund = first._reverse_moves(cancel=True)
+        self._assert_fiscal_amounts(refund, 12.0, 62.4)
+        self._assert_order_invoiced(0.0, 0.0)
+
+        second = self._invoice_delivered(6.0)
+        self._assert_fiscal_amounts(second, 24.0, 124.8)
+        final = self._invoice_delivered(10.0)
+        self._assert_fiscal_amounts(final, 16.0, 83.2)
+        self._assert_order_invoiced(40.0, 208.0)
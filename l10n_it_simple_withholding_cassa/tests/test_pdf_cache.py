@@ -0,0 +1,106 @@
+from unittest.mock import patch
+
+from odoo.addons.base.models.ir_actions_report import IrActionsReport
+from odoo.exceptions import AccessError
+from odoo.tests import TransactionCase, new_test_user, tagged
+
+from ..models.ir_actions_report import PDF_CACHE_FIELD, PDF_CACHE_TAG
+
+
+@tagged('post_install', '-at_install')
+class TestPdfCache(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': "Cliente cache PDF"})
+        cls.product = cls.env['product.product'].create({'name': "Consulenza", 'type': 'service', 'list_price': 100.0})
+        cls.order = cls.env['sale.order'].create({
+            'partner_id': cls.partner.id,
+            'order_line': [(0, 0, {'product_id': cls.product.id, 'product_uom_qty': 1.0, 'price_unit': 100.0})],
+        })
+        cls.order.action_confirm()
+        cls.report = cls.env.ref('sale.action_report_saleorder')
+
+    def setUp(self):
+        super().setUp()
+        self.renders = 0
+
+        def fake_render(report, report_ref, res_ids=None, data=None):
+            self.renders += 1
+            return f"%PDF-{self.renders}".encode(), 'pdf'
+
+        patcher = patch.object(IrActionsReport, '_render_qweb_pdf', autospec=True, side_effect=fake_render)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _render(self, record=None):
+        return self.env['ir.actions.report']._render_qweb_pdf(self.report.report_name, (record or self.order).ids)[0]
+
+    def _cache_attachments(self, record=None):
+        record = record or self.order
+        return self.env['ir.attachment'].search([
+            ('res_model', '=', record._name),
+            ('res_id', '=', record.id),
+            ('res_field', '=', PDF_CACHE_FIELD),
+        ])
+
+    def test_cache_hit_and_miss(self):
+        first = self._render()
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(self._render(), first)
+        self.assertEqual(self.renders, 1, "La seconda stampa deve venire dalla cache")
+        self.assertEqual(len(self._cache_attachments()), 1)
+
+        self.env['ir.actions.report'].with_context(l10n_it_pdf_cache=False)._render_qweb_pdf(
+            self.report.report_name, self.order.ids)
+        self.assertEqual(self.renders, 2, "Con la cache disattivata il PDF viene sempre generato")
+
+    def test_draft_not_cached(self):
+        quotation = self.order.copy()
+        self._render(quotation)
+        self._render(quotation)
+        self.assertEqual(self.renders, 2)
+        self.assertFalse(self._cache_attachments(quotation))
+
+    def test_invalidation_on_line_change(self):
+        self._render()
+        # Riga creata direttamente: la write_date dell'ordine non cambia
+        self.env['sale.order.line'].create({
+            'order_id': self.order.id,
+            'product_id': self.product.id,
+            'product_uom_qty': 2.0,
+            'price_unit': 50.0,
+        })
+        self._render()
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(len(self._cache_attachments()), 1, "La copia precedente va eliminata")
+
+    def test_invalidation_on_company_bank(self):
+        self._render()
+        self.env['res.partner.bank'].create({
+            'acc_number': 'IT60X0542811101000000123456',
+            'partner_id': self.order.company_id.partner_id.id,
+        })
+        self.assertFalse(self._cache_attachments())
+        self._render()
+        self.assertEqual(self.renders, 2)
+
+    def test_cache_hidden_and_not_downloadable(self):
+        self._render()
+        attachment = self._cache_attachments()
+        self.assertEqual(attachment.description, PDF_CACHE_TAG)
+        # Non compare tra gli allegati del documento (chatter)
+        self.assertFalse(self.env['ir.attachment'].search([
+            ('res_model', '=', self.order._name), ('res_id', '=', self.order.id)]))
+
+        salesman = new_test_user(self.env, login='pdf_cache_salesman', groups='sales_team.group_sale_manager')
+        self.order.with_user(salesman).check_access('read')
+        with self.assertRaises(AccessError):
+            attachment.with_user(salesman).read(['datas'])
+
+    def test_gc_respects_max_size(self):
+        self._render()
+        self.env['ir.config_parameter'].sudo().set_param('l10n_it_simple_withholding_cassa.pdf_cache_max_mb', '0.000001')
+        self.env['ir.actions.report']._cron_gc_l10n_it_pdf_cache()
+        self.assertFalse(self._cache_attachments())
@@ -0,0 +1,36 @@
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import HttpCase, new_test_user, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestPortalPages(AccountTestInvoicingCommon, HttpCase):
+    """Pagine di dettaglio del portale, in sola lettura e con download del PDF"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.portal_user = new_test_user(cls.env, login='portal_fiscale', groups='base.group_portal')
+        partner = cls.portal_user.partner_id
+        cls.invoice = cls.init_invoice('out_invoice', partner=partner, amounts=[1000.0], post=True)
+        cls.order = cls.env['sale.order'].create({
+            'partner_id': partner.id,
+            'order_line': [(0, 0, {'product_id': cls.product_a.id, 'product_uom_qty': 1.0, 'price_unit': 100.0})],
+        })
+        cls.order.action_confirm()
+
+    def _assert_page(self, url):
+        response = self.url_open(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_detail_pages(self):
+        self.authenticate('portal_fiscale', 'portal_fiscale')
+        pages = [
+            (f'/my/invoices/{self.invoice.id}', self.invoice),
+            (f'/my/orders/{self.order.id}', self.order),
+        ]
+        for url, record in pages:
+            token = record._portal_ensure_token()
+            with self.subTest(url=url):
+                self._assert_page(f'{url}?access_token={token}')
+                self._assert_page(f'{url}?access_token={token}&report_type=pdf&download=true')
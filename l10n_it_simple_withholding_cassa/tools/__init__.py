@@ -0,0 +1,4 @@
+from .cache import clear_ormcache
+from .fiscal import compute_fiscal_totals, fiscal_code, vat_label
+from .recompute import recompute_fields
+from .stream import stream_rows
@@ -0,0 +1,21 @@
+def clear_ormcache(model, method_name, calls=None):
+    """Rimuove dalla cache del processo solo le voci di un metodo ``ormcache``
+
+    ``calls`` è un elenco di tuple di argomenti (``self`` compreso) con cui il
+    metodo è stato chiamato: le voci corrispondenti vengono scartate e le altre
+    cache del registry restano intatte. Con ``calls`` a None vengono scartate
+    tutte le voci del metodo. Gli altri processi vengono avvisati con il
+    normale segnale di invalidazione del gruppo di cache.
+    """
+    cache = getattr(type(model), method_name).__cache__
+    lru, key0, _counter = cache.lru(model)
+    if calls is None:
+        keys = [key for key in list(lru.d) if key[:len(key0)] == key0]
+    else:
+        keys = [key0 + cache.key(*args) for args in calls]
+    for key in keys:
+        try:
+            lru.pop(key)
+        except KeyError:
+            pass
+    model.env.registry.cache_invalidated.add(cache.cache_name)
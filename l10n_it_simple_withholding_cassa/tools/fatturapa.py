@@ -0,0 +1,167 @@
+"""Scrittura incrementale dei file FatturaPA (FPR12)
+
+Le funzioni di questo modulo lavorano solo su dizionari preparati dall'ORM
+(vedi ``account.move._l10n_it_fatturapa_payload``) e non accedono al database.
+"""
+import io
+
+from lxml import etree
+
+NAMESPACE = 'http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2'
+NSMAP = {
+    'p': NAMESPACE,
+    'ds': 'http://www.w3.org/2000/09/xmldsig#',
+    'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+}
+
+
+def _amount(value, digits=2):
+    return f"{value:.{digits}f}"
+
+
+def _leaf(parent, tag, value):
+    if value in (None, False, ''):
+        return None
+    element = etree.SubElement(parent, tag)
+    element.text = str(value)
+    return element
+
+
+def _fiscal_id(parent, country, code):
+    fiscal_id = etree.SubElement(parent, 'IdFiscaleIVA')
+    _leaf(fiscal_id, 'IdPaese', country)
+    _leaf(fiscal_id, 'IdCodice', code)
+
+
+def _address(parent, address):
+    sede = etree.SubElement(parent, 'Sede')
+    _leaf(sede, 'Indirizzo', address['street'] or '-')
+    _leaf(sede, 'CAP', address['zip'] or '00000')
+    _leaf(sede, 'Comune', address['city'] or '-')
+    _leaf(sede, 'Provincia', address['state'])
+    _leaf(sede, 'Nazione', address['country'] or 'IT')
+
+
+def _header(payload):
+    company = payload['company']
+    partner = payload['partner']
+    header = etree.Element('FatturaElettronicaHeader')
+
+    transmission = etree.SubElement(header, 'DatiTrasmissione')
+    transmitter = etree.SubElement(transmission, 'IdTrasmittente')
+    _leaf(transmitter, 'IdPaese', company['country'])
+    _leaf(transmitter, 'IdCodice', company['vat'])
+    _leaf(transmission, 'ProgressivoInvio', payload['progressive'])
+    _leaf(transmission, 'FormatoTrasmissione', 'FPR12')
+    _leaf(transmission, 'CodiceDestinatario', partner['destination_code'])
+
+    seller = etree.SubElement(header, 'CedentePrestatore')
+    seller_data = etree.SubElement(seller, 'DatiAnagrafici')
+    _fiscal_id(seller_data, company['country'], company['vat'])
+    registry = etree.SubElement(seller_data, 'Anagrafica')
+    _leaf(registry, 'Denominazione', company['name'])
+    _leaf(seller_data, 'RegimeFiscale', company['tax_regime'])
+    _address(seller, company)
+
+    buyer = etree.SubElement(header, 'CessionarioCommittente')
+    buyer_data = etree.SubElement(buyer, 'DatiAnagrafici')
+    if partner['vat']:
+        _fiscal_id(buyer_data, partner['country'] or 'IT', partner['vat'])
+    else:
+        _leaf(buyer_data, 'CodiceFiscale', partner['fiscal_code'])
+    registry = etree.SubElement(buyer_data, 'Anagrafica')
+    _leaf(registry, 'Denominazione', partner['name'])
+    _address(buyer, partner)
+    return header
+
+
+def _general_data(payload):
+    general = etree.Element('DatiGenerali')
+    document = etree.SubElement(general, 'DatiGeneraliDocumento')
+    _leaf(document, 'TipoDocumento', payload['document_type'])
+    _leaf(document, 'Divisa', payload['currency'])
+    _leaf(document, 'Data', payload['date'])
+    _leaf(document, 'Numero', payload['number'])
+
+    withholding = payload['withholding']
+    if withholding:
+        block = etree.SubElement(document, 'DatiRitenuta')
+        _leaf(block, 'TipoRitenuta', withholding['type'])
+        _leaf(block, 'ImportoRitenuta', _amount(withholding['amount']))
+        _leaf(block, 'AliquotaRitenuta', _amount(withholding['percent']))
+        _leaf(block, 'CausalePagamento', withholding['reason'])
+
+    # Un blocco DatiCassaPrevidenziale per ogni aliquota IVA
+    for cassa in payload['cassa']:
+        block = etree.SubElement(document, 'DatiCassaPrevidenziale')
+        _leaf(block, 'TipoCassa', cassa['type'])
+        _leaf(block, 'AlCassa', _amount(cassa['percent']))
+        _leaf(block, 'ImportoContributoCassa', _amount(cassa['amount']))
+        _leaf(block, 'ImponibileCassa', _amount(cassa['base']))
+        _leaf(block, 'AliquotaIVA', _amount(cassa['tax_rate']))
+        if withholding:
+            _leaf(block, 'Ritenuta', 'SI')
+        if not cassa['tax_rate']:
+            _leaf(block, 'Natura', cassa['nature'])
+
+    _leaf(document, 'ImportoTotaleDocumento', _amount(payload['amount_total']))
+    return general
+
+
+def _line(payload, line):
+    detail = etree.Element('DettaglioLinee')
+    _leaf(detail, 'NumeroLinea', line['sequence'])
+    _leaf(detail, 'Descrizione', line['name'])
+    _leaf(detail, 'Quantita', _amount(line['quantity'], 8))
+    _leaf(detail, 'PrezzoUnitario', _amount(line['price_unit'], 8))
+    _leaf(detail, 'PrezzoTotale', _amount(line['price_subtotal'], 8))
+    _leaf(detail, 'AliquotaIVA', _amount(line['tax_rate']))
+    if payload['withholding']:
+        _leaf(detail, 'Ritenuta', 'SI')
+    if not line['tax_rate']:
+        _leaf(detail, 'Natura', line['nature'])
+    return detail
+
+
+def _summary(row):
+    summary = etree.Element('DatiRiepilogo')
+    _leaf(summary, 'AliquotaIVA', _amount(row['tax_rate']))
+    if not row['tax_rate']:
+        _leaf(summary, 'Natura', row['nature'])
+    _leaf(summary, 'ImponibileImporto', _amount(row['base']))
+    _leaf(summary, 'Imposta', _amount(row['tax']))
+    _leaf(summary, 'EsigibilitaIVA', 'I')
+    return summary
+
+
+def _payment(payload):
+    payment = etree.Element('DatiPagamento')
+    _leaf(payment, 'CondizioniPagamento', 'TP02')
+    detail = etree.SubElement(payment, 'DettaglioPagamento')
+    _leaf(detail, 'ModalitaPagamento', 'MP05')
+    _leaf(detail, 'DataScadenzaPagamento', payload['date_due'])
+    _leaf(detail, 'ImportoPagamento', _amount(payload['net_amount']))
+    _leaf(detail, 'IBAN', payload['company']['iban'])
+    return payment
+
+
+def render_invoice(payload):
+    """Restituisce (nome file, contenuto XML) per il payload di una fattura
+
+    L'XML viene scritto con ``etree.xmlfile``: in memoria c'è solo il blocco
+    corrente, mai l'albero completo del documento.
+    """
+    buffer = io.BytesIO()
+    with etree.xmlfile(buffer, encoding='UTF-8') as xf:
+        xf.write_declaration()
+        with xf.element(f'{{{NAMESPACE}}}FatturaElettronica', nsmap=NSMAP, versione='FPR12'):
+            xf.write(_header(payload))
+            with xf.element('FatturaElettronicaBody'):
+                xf.write(_general_data(payload))
+                with xf.element('DatiBeniServizi'):
+                    for line in payload['lines']:
+                        xf.write(_line(payload, line))
+                    for row in payload['summary']:
+                        xf.write(_summary(row))
+                xf.write(_payment(payload))
+    return payload['filename'], buffer.getvalue()
@@ -0,0 +1,65 @@
+import re
+
+from odoo.tools import float_round
+
+
+def fiscal_code(vat):
+    """Codice fiscale / partita IVA senza prefisso paese"""
+    code = re.sub(r'[^0-9A-Za-z]', '', vat or '').upper()
+    return code[2:] if code.startswith('IT') else code
+
+
+def vat_label(rates):
+    """Etichetta IVA dei totali con le aliquote del documento (es. "IVA 10% / 22%")"""
+    rates = sorted(set(rates))
+    if not rates:
+        return "IVA"
+    return "IVA " + " / ".join(f"{rate:g}%" for rate in rates)
+
+
+def compute_fiscal_totals(lines, apply_cassa, cassa_percent, apply_withholding, withholding_percent, rounding,
+                          cassa_amount=None, withholding_amount=None):
+    """Importi fiscali di un documento a partire dalle righe normali
+
+    ``lines`` è un iterabile di coppie (imponibile riga, [aliquote IVA %]).
+    La cassa si calcola sul totale, l'IVA riga per riga sulla base con cassa,
+    la ritenuta su imponibile + cassa. È la formula degli importi memorizzati
+    sulle fatture (``account.move._prepare_fiscal_amounts``) e non accede al
+    database, così la stessa funzione serve anche alla simulazione via API.
+    ``cassa_amount`` e ``withholding_amount``, se indicati, sostituiscono il
+    calcolo (quote ripartite dall'ordine nelle fatture parziali); la cassa
+    indicata viene distribuita sulle righe in proporzione all'imponibile.
+    """
+    lines = list(lines)
+    amount_untaxed = sum(subtotal for subtotal, _rates in lines)
+
+    if cassa_amount is not None:
+        cassa_ratio = cassa_amount / amount_untaxed if amount_untaxed else 0.0
+    else:
+        cassa_amount = 0.0
+        cassa_ratio = cassa_percent / 100.0 if apply_cassa else 0.0
+        if apply_cassa:
+            cassa_amount = float_round(amount_untaxed * cassa_percent / 100.0, precision_rounding=rounding)
+    base_imponibile = amount_untaxed + cassa_amount
+
+    amount_tax = 0.0
+    for subtotal, rates in lines:
+        base_line = subtotal + subtotal * cassa_ratio
+        amount_tax += sum(base_line * rate / 100.0 for rate in rates)
+    amount_tax = float_round(amount_tax, precision_rounding=rounding)
+    total_gross = base_imponibile + amount_tax
+
+    if withholding_amount is None:
+        withholding_amount = 0.0
+        if apply_withholding:
+            withholding_amount = float_round(base_imponibile * withholding_percent / 100.0,
+                                             precision_rounding=rounding)
+
+    return {
+        'amount_untaxed': amount_untaxed,
+        'cassa_amount': cassa_amount,
+        'amount_tax': amount_tax,
+        'total_gross': total_gross,
+        'withholding_amount': withholding_amount,
+        'net_amount': float_round(total_gross - withholding_amount, precision_rounding=rounding),
+    }
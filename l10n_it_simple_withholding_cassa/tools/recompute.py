@@ -0,0 +1,26 @@
+import logging
+
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+
+def recompute_fields(env, model_name, ids, fnames, chunk_size=1000):
+    """Ricalcola i campi calcolati memorizzati ``fnames`` a blocchi
+
+    Ogni blocco viene marcato da ricalcolare, scritto con un flush e poi
+    rimosso dalla cache, così la memoria resta limitata anche su milioni di
+    record.
+    """
+    model = env[model_name]
+    fields_to_compute = [model._fields[fname] for fname in fnames]
+    done = 0
+    for chunk_ids in split_every(chunk_size, list(ids)):
+        records = model.browse(chunk_ids)
+        for field in fields_to_compute:
+            env.add_to_compute(field, records)
+        env.flush_all()
+        env.invalidate_all()
+        done += len(chunk_ids)
+        _logger.info("%s: ricalcolati %s/%s record", model_name, done, len(ids))
+    return done
@@ -0,0 +1,19 @@
+import uuid
+
+
+def stream_rows(cr, query, params=None, itersize=2000):
+    """Esegue la query su un cursore lato server e ne restituisce le righe una alla volta
+
+    Le righe arrivano dal database a blocchi di ``itersize``: la memoria usata
+    resta costante qualunque sia il numero di record. Il cursore con nome vive
+    nella transazione di ``cr``, quindi vede le stesse modifiche non committate
+    (chiamare ``env.flush_all()`` prima se servono i valori dell'ORM).
+    """
+    name = f"l10n_it_stream_{uuid.uuid4().hex}"
+    server_cursor = cr._cnx.cursor(name)
+    server_cursor.itersize = itersize
+    try:
+        server_cursor.execute(query, params)
+        yield from server_cursor
+    finally:
+        server_cursor.close()
@@ -0,0 +1,4 @@
+from . import cu_export
+from . import fatturapa_export
+from . import fiscal_totals_export
+from . import sale_advance_payment_inv
@@ -0,0 +1,331 @@
+import hashlib
+import re
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+
+from ..tools import fiscal_code, stream_rows
+
+# Record telematico: 1897 caratteri di dati + 'A' + CRLF (1900 in tutto)
+RECORD_LENGTH = 1897
+RECORD_END = 'A\r\n'
+MAX_LOGGED_ERRORS = 200
+
+# Record D/H: parte posizionale fino alla posizione 89, poi 75 campi non
+# posizionali da 24 caratteri (codice campo 8 + valore 16) e filler
+POSITIONAL_LENGTH = 89
+NP_FIELDS_PER_RECORD = 75
+NP_CODE_LENGTH = 8
+NP_VALUE_LENGTH = 16
+
+# Causale del quadro lavoro autonomo: prestazioni di arte o professione abituale
+CU_CAUSALE = 'A'
+
+
+def _alpha(value, length):
+    """Campo alfanumerico: maiuscolo, allineato a sinistra, riempito con spazi"""
+    value = re.sub(r'[^\x20-\x7e]', ' ', str(value or '')).upper()
+    return value[:length].ljust(length)
+
+
+def _numeric(value, length):
+    """Campo numerico: allineato a destra, riempito con zeri"""
+    return str(int(value or 0)).rjust(length, '0')[-length:]
+
+
+def _np_amount(amount):
+    """Valore non posizionale di un importo: due decimali con virgola, allineato a destra"""
+    return f"{abs(amount or 0.0):.2f}".replace('.', ',').rjust(NP_VALUE_LENGTH)
+
+
+def _np_fields(code, value):
+    """Elementi non posizionali di un campo
+
+    I valori alfanumerici più lunghi di 16 caratteri proseguono in elementi
+    successivi con lo stesso codice, il cui valore inizia con "+".
+    """
+    if not isinstance(value, str):
+        # Gli importi a zero non vanno indicati
+        return [code + _np_amount(value)] if value else []
+    value = _alpha(value, len(value)).strip()
+    if not value:
+        return []
+    chunks = [value[:NP_VALUE_LENGTH]]
+    rest = value[NP_VALUE_LENGTH:]
+    while rest:
+        chunks.append('+' + rest[:NP_VALUE_LENGTH - 1])
+        rest = rest[NP_VALUE_LENGTH - 1:]
+    return [code + chunk.ljust(NP_VALUE_LENGTH) for chunk in chunks]
+
+
+def _split_name(name, is_company):
+    """(cognome o denominazione, nome) del percipiente
+
+    Per le persone fisiche il nome del contatto è inteso come "Cognome Nome".
+    """
+    name = (name or '').strip()
+    if is_company or ' ' not in name:
+        return name, ''
+    last, first = name.split(' ', 1)
+    return last, first
+
+
+class CuExport(models.TransientModel):
+    """Esportazione telematica Certificazione Unica (quadro lavoro autonomo)
+
+    Il file viene generato in streaming: le fatture sono aggregate in SQL per
+    cliente e anno e lette da un cursore lato server, così la memoria resta
+    costante anche con migliaia di clienti. Il file segue il tracciato
+    telematico a record di 1900 caratteri: A (testata) e B (frontespizio)
+    posizionali, per ogni certificazione un record D (dati anagrafici) e un
+    record H (lavoro autonomo) con campi non posizionali "codice + valore",
+    Z (coda) con il numero di record per tipo.
+
+    Il file riguarda un solo anno (quello della data fattura); i campi del
+    quadro lavoro autonomo riportati sono ammontare lordo (imponibile con
+    cassa), imponibile e ritenute a titolo d'acconto.
+    """
+    _name = 'l10n_it.cu.export'
+    _description = "Esportazione Certificazione Unica"
+
+    company_id = fields.Many2one(
+        'res.company', string="Azienda", required=True,
+        default=lambda self: self.env.company)
+    date_from = fields.Date(
+        string="Dal", required=True,
+        default=lambda self: self._default_last_year().replace(month=1, day=1))
+    date_to = fields.Date(
+        string="Al", required=True,
+        default=lambda self: self._default_last_year().replace(month=12, day=31))
+    state = fields.Selection([
+        ('draft', 'Da validare'),
+        ('validated', 'Validato'),
+    ], default='draft', readonly=True)
+
+    # Riepilogo della validazione
+    partner_count = fields.Integer(string="Certificazioni", readonly=True)
+    record_count = fields.Integer(string="Record totali", readonly=True)
+    error_count = fields.Integer(string="Errori", readonly=True)
+    total_gross = fields.Float(string="Totale compensi", readonly=True)
+    total_withholding = fields.Float(string="Totale ritenute", readonly=True)
+    checksum = fields.Char(string="SHA-256 file", readonly=True)
+    # Data di firma nel file (DA003001): fissata alla validazione, così il
+    # file scaricato in seguito coincide con il checksum
+    generation_date = fields.Date(string="Data del file", readonly=True)
+    error_log = fields.Text(string="Dettaglio errori", readonly=True)
+
+    def _default_last_year(self):
+        today = fields.Date.context_today(self)
+        return today.replace(year=today.year - 1)
+
+    @api.constrains('date_from', 'date_to')
+    def _check_dates(self):
+        for wizard in self:
+            if wizard.date_from > wizard.date_to:
+                raise ValidationError(_("La data iniziale deve precedere quella finale."))
+            if wizard.date_from.year != wizard.date_to.year:
+                raise ValidationError(_("Il periodo deve essere compreso in un solo anno."))
+
+    def _get_cu_filename(self):
+        self.ensure_one()
+        return f"CU_{fiscal_code(self.company_id.vat) or self.company_id.id}_{self.date_to.year}.txt"
+
+    def _cu_query(self):
+        """Aggregato per cliente e anno fiscale delle fatture con ritenuta"""
+        query = """
+            SELECT am.commercial_partner_id,
+                   EXTRACT(YEAR FROM am.invoice_date)::int AS fiscal_year,
+                   p.name,
+                   p.vat,
+                   p.is_company,
+                   SUM({sign} * (am.total_gross - am.amount_tax)) AS gross,
+                   SUM({sign} * am.withholding_amount) AS withholding,
+                   SUM({sign} * am.cassa_amount) AS cassa,
+                   COUNT(*) AS invoice_count
+              FROM account_move am
+              JOIN res_partner p ON p.id = am.commercial_partner_id
+             WHERE am.company_id = %(company_id)s
+               AND am.state = 'posted'
+               AND am.move_type IN ('out_invoice', 'out_refund')
+               AND am.apply_withholding
+               AND am.invoice_date BETWEEN %(date_from)s AND %(date_to)s
+          GROUP BY am.commercial_partner_id, fiscal_year, p.name, p.vat, p.is_company
+          ORDER BY am.commercial_partner_id, fiscal_year
+        """.format(sign="(CASE WHEN am.move_type = 'out_refund' THEN -1 ELSE 1 END)")
+        return query, {
+            'company_id': self.company_id.id,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+        }
+
+    def _cu_record(self, record_type, *parts):
+        content = record_type + ''.join(parts)
+        return content[:RECORD_LENGTH].ljust(RECORD_LENGTH) + RECORD_END
+
+    def _cu_np_records(self, record_type, company_code, partner_code, progressive, elements):
+        """Record D/H: parte posizionale e campi non posizionali
+
+        Oltre i 75 elementi la certificazione prosegue su un altro modulo
+        (progressivo modulo incrementato) con la stessa parte posizionale.
+        """
+        records = []
+        for module, start in enumerate(range(0, len(elements) or 1, NP_FIELDS_PER_RECORD), start=1):
+            header = ''.join([
+                _alpha(company_code, 16),      # 2-17 codice fiscale del sostituto
+                _numeric(module, 8),           # 18-25 progressivo modulo
+                _alpha(partner_code, 16),      # 26-41 codice fiscale del percipiente
+                _numeric(progressive, 5),      # 42-46 progressivo certificazione
+                _alpha('', 17),                # 47-63 protocollo dell'invio da sostituire/annullare
+                _numeric(0, 6),                # 64-69 progressivo certificazione da sostituire/annullare
+                _alpha('', 1),                 # 70 tipo operazione (A annullamento, S sostituzione)
+            ])
+            header = header.ljust(POSITIONAL_LENGTH - 1)
+            body = ''.join(elements[start:start + NP_FIELDS_PER_RECORD])
+            records.append(self._cu_record(record_type, header, body))
+        return records
+
+    def _cu_d_elements(self, company, partner_code, name, is_company):
+        """Campi non posizionali del record D: sostituto, percipiente, firma"""
+        last_name, first_name = _split_name(name, is_company)
+        return [
+            *_np_fields('DA001001', fiscal_code(company.vat)),
+            *_np_fields('DA001002', company.name),
+            *_np_fields('DA002001', partner_code),
+            *_np_fields('DA002002', last_name),
+            *_np_fields('DA002003', first_name),
+            *_np_fields('DA003001', (self.generation_date or fields.Date.context_today(self)).strftime('%d%m%Y')),
+            *_np_fields('DA003002', '1'),
+        ]
+
+    def _cu_h_elements(self, gross, withholding):
+        """Campi non posizionali del record H (lavoro autonomo)"""
+        return [
+            *_np_fields('AU001001', CU_CAUSALE),
+            *_np_fields('AU001004', gross),
+            *_np_fields('AU001008', gross),
+            *_np_fields('AU001009', withholding),
+        ]
+
+    def _cu_validate_row(self, partner_id, fiscal_year, name, vat, gross, withholding):
+        errors = []
+        if not fiscal_code(vat):
+            errors.append(_("manca codice fiscale / partita IVA"))
+        if gross <= 0:
+            errors.append(_("compenso lordo non positivo (%s)", gross))
+        if withholding < 0 or withholding > gross:
+            errors.append(_("ritenuta fuori intervallo (%(withholding)s su %(gross)s)",
+                            withholding=withholding, gross=gross))
+        return [f"[{fiscal_year}] {name} (ID {partner_id}): {error}" for error in errors]
+
+    def _generate_cu_lines(self, stats=None):
+        """Generatore delle righe del file telematico
+
+        Se ``stats`` è un dizionario viene popolato con conteggi, totali ed
+        errori di validazione mentre il file scorre.
+        """
+        self.ensure_one()
+        stats = stats if stats is not None else {}
+        stats.update(partners=0, records=0, gross=0.0, withholding=0.0, errors=0, error_lines=[],
+                     record_types={})
+        company = self.company_id
+        company_code = fiscal_code(company.vat)
+        supply_code = f"CUR{str(self.date_to.year + 1)[-2:]}"
+
+        def emit(line):
+            stats['records'] += 1
+            stats['record_types'][line[0]] = stats['record_types'].get(line[0], 0) + 1
+            return line
+
+        # A: 2-15 filler, 16-20 codice fornitura, 21-22 tipo fornitore, 23-38 codice fiscale fornitore
+        yield emit(self._cu_record('A', _alpha('', 14), _alpha(supply_code, 5), '01', _alpha(company_code, 16)))
+        # B: 2-17 codice fiscale del sostituto, 18-25 progressivo modulo, 26-28 spazio utente,
+        # poi la denominazione del sostituto
+        yield emit(self._cu_record('B', _alpha(company_code, 16), _numeric(1, 8), _alpha('', 3),
+                                   _alpha('', 61), _alpha(company.name, 60)))
+
+        self.env.flush_all()
+        query, params = self._cu_query()
+        for row in stream_rows(self.env.cr, query, params):
+            partner_id, fiscal_year, name, vat, is_company, gross, withholding, cassa, count = row
+            gross, withholding, cassa = float(gross or 0.0), float(withholding or 0.0), float(cassa or 0.0)
+            errors = self._cu_validate_row(partner_id, fiscal_year, name, vat, gross, withholding)
+            if errors:
+                stats['errors'] += len(errors)
+                room = MAX_LOGGED_ERRORS - len(stats['error_lines'])
+                stats['error_lines'].extend(errors[:max(room, 0)])
+
+            stats['partners'] += 1
+            stats['gross'] += gross
+            stats['withholding'] += withholding
+            partner_code = fiscal_code(vat)
+            progressive = stats['partners']
+            for record in self._cu_np_records('D', company_code, partner_code, progressive,
+                                              self._cu_d_elements(company, partner_code, name, is_company)):
+                yield emit(record)
+            for record in self._cu_np_records('H', company_code, partner_code, progressive,
+                                              self._cu_h_elements(gross, withholding)):
+                yield emit(record)
+
+        # Z: 2-15 filler, poi numero di record B, C, D, G, H
+        counts = stats['record_types']
+        yield emit(self._cu_record('Z', _alpha('', 14), *(_numeric(counts.get(t, 0), 9) for t in 'BCDGH')))
+
+    def _generate_cu_file(self, stats=None):
+        """Come _generate_cu_lines ma in byte, calcolando l'hash SHA-256 del file"""
+        stats = stats if stats is not None else {}
+        digest = hashlib.sha256()
+        for line in self._generate_cu_lines(stats):
+            chunk = line.encode('ascii', 'replace')
+            digest.update(chunk)
+            yield chunk
+        stats['checksum'] = digest.hexdigest()
+
+    def action_validate(self):
+        """Passaggio di validazione: scorre l'intero file senza conservarlo"""
+        self.ensure_one()
+        self.generation_date = fields.Date.context_today(self)
+        stats = {}
+        for _chunk in self._generate_cu_file(stats):
+            pass
+        if not stats['partners']:
+            raise UserError(_("Nessuna fattura con ritenuta nel periodo selezionato."))
+        self.write({
+            'state': 'validated',
+            'partner_count': stats['partners'],
+            'record_count': stats['records'],
+            'error_count': stats['errors'],
+            'total_gross': stats['gross'],
+            'total_withholding': stats['withholding'],
+            'checksum': stats['checksum'],
+            'error_log': '\n'.join(stats['error_lines']),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _check_exportable(self):
+        self.ensure_one()
+        if self.state != 'validated':
+            raise UserError(_("Validare il file prima di esportarlo."))
+        if self.error_count:
+            raise UserError(_(
+                "Il file contiene %s errori: correggere i dati indicati nel dettaglio e validare di nuovo.",
+                self.error_count))
+
+    def action_export(self):
+        self.ensure_one()
+        if self.state != 'validated':
+            action = self.action_validate()
+            if self.error_count:
+                # Mostra il dettaglio degli errori invece di esportare
+                return action
+        self._check_exportable()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/l10n_it_withholding/cu/{self.id}',
+            'target': 'self',
+        }
@@ -0,0 +1,134 @@
+import logging
+import tempfile
+import zipfile
+
+import requests
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+from ..tools.fatturapa import render_invoice
+
+_logger = logging.getLogger(__name__)
+
+SDI_ENDPOINT_PARAM = 'l10n_it_simple_withholding_cassa.sdi_endpoint'
+SDI_ENDPOINT_DEFAULT = 'http://localhost:8075/sdi'
+
+
+class FatturaPAExport(models.TransientModel):
+    """Esportazione massiva delle fatture in formato FatturaPA (ZIP)
+
+    Le fatture vengono lette a blocchi di ``chunk_size`` record (un solo
+    prefetch per blocco, cache svuotata a fine blocco) e ogni XML viene
+    scritto subito nello ZIP, che vive in un file temporaneo: la memoria
+    dipende dalla dimensione del blocco, non dal numero di fatture.
+    """
+    _name = 'l10n_it.fatturapa.export'
+    _description = "Esportazione FatturaPA"
+
+    move_ids = fields.Many2many('account.move', string="Fatture")
+    chunk_size = fields.Integer(string="Fatture per blocco", default=200)
+    invoice_count = fields.Integer(string="Fatture esportabili", compute='_compute_invoice_count')
+    sdi_response = fields.Text(string="Risposta SdI", readonly=True)
+    # {id fattura: progressivo invio}, assegnati una sola volta dall'esportazione
+    progressives = fields.Json(string="Progressivi invio", readonly=True, copy=False)
+
+    @api.model
+    def default_get(self, fields_list):
+        values = super().default_get(fields_list)
+        if self.env.context.get('active_model') == 'account.move' and 'move_ids' in fields_list:
+            values['move_ids'] = [(6, 0, self.env.context.get('active_ids', []))]
+        return values
+
+    def _get_export_domain(self):
+        return [
+            ('id', 'in', self.move_ids.ids),
+            ('state', '=', 'posted'),
+            ('move_type', 'in', ['out_invoice', 'out_refund']),
+        ]
+
+    @api.depends('move_ids')
+    def _compute_invoice_count(self):
+        for wizard in self:
+            wizard.invoice_count = self.env['account.move'].search_count(wizard._get_export_domain())
+
+    def _get_filename(self):
+        return f"FatturaPA_{fields.Date.context_today(self).isoformat()}.zip"
+
+    def _assign_progressives(self):
+        """Assegna il progressivo invio alle fatture che non lo hanno ancora
+
+        I progressivi restano sul wizard: download ripetuti e invio a SdI
+        producono gli stessi file senza consumare altri numeri.
+        """
+        self.ensure_one()
+        Move = self.env['account.move']
+        move_ids = Move.search(self._get_export_domain(), order='id').ids
+        if not move_ids:
+            raise UserError(_("Nessuna fattura cliente validata da esportare."))
+        progressives = dict(self.progressives or {})
+        for move_id in move_ids:
+            if str(move_id) not in progressives:
+                progressives[str(move_id)] = Move._l10n_it_next_progressive()
+        self.progressives = progressives
+
+    def _write_zip(self, fileobj):
+        """Scrive lo ZIP delle fatture in ``fileobj`` e restituisce il numero di file
+
+        Serializza soltanto le fatture con il progressivo già assegnato da
+        ``_assign_progressives``.
+        """
+        self.ensure_one()
+        if not self.progressives:
+            raise UserError(_("Avviare l'esportazione dal wizard prima di scaricare lo ZIP."))
+        Move = self.env['account.move']
+        progressives = self.progressives
+        move_ids = sorted(int(move_id) for move_id in progressives)
+
+        chunk_size = max(self.chunk_size, 1)
+        count = 0
+        with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for chunk_ids in split_every(chunk_size, move_ids):
+                for move in Move.browse(chunk_ids):
+                    filename, content = render_invoice(move._l10n_it_fatturapa_payload(progressives[str(move.id)]))
+                    archive.writestr(filename, content)
+                    count += 1
+                self.env.invalidate_all()
+                _logger.info("FatturaPA: %s/%s fatture esportate", count, len(move_ids))
+        return count
+
+    def action_export(self):
+        self.ensure_one()
+        self._assign_progressives()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/l10n_it_withholding/fatturapa/{self.id}',
+            'target': 'self',
+        }
+
+    def action_send_sdi(self):
+        """Invia lo ZIP all'endpoint SdI configurato (o al simulatore locale)"""
+        self.ensure_one()
+        endpoint = self.env['ir.config_parameter'].sudo().get_param(SDI_ENDPOINT_PARAM, SDI_ENDPOINT_DEFAULT)
+        self._assign_progressives()
+        with tempfile.TemporaryFile() as tmp:
+            count = self._write_zip(tmp)
+            tmp.seek(0)
+            try:
+                response = requests.post(
+                    endpoint,
+                    files={'file': (self._get_filename(), tmp, 'application/zip')},
+                    timeout=300,
+                )
+                response.raise_for_status()
+            except requests.RequestException as e:
+                raise UserError(_("Invio a %(endpoint)s non riuscito: %(error)s", endpoint=endpoint, error=e))
+        self.sdi_response = _("%(count)s fatture inviate.\n%(body)s", count=count, body=response.text)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
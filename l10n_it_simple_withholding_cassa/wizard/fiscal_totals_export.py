@@ -0,0 +1,205 @@
+import csv
+import io
+import tempfile
+
+import xlsxwriter
+
+from odoo import models, fields, api, _
+from odoo.exceptions import AccessError, ValidationError
+
+from ..tools import stream_rows
+
+CSV_CHUNK_ROWS = 1000
+FILE_CHUNK_SIZE = 64 * 1024
+XLSX_MAX_ROW = 1048575
+
+HEADER = [
+    "Tipo", "Numero", "Data", "Azienda", "Cliente", "Partita IVA", "Valuta",
+    "Imponibile", "Cassa previdenziale", "IVA", "Totale lordo", "Ritenuta", "Netto a pagare",
+]
+# Indice della prima colonna con importi
+AMOUNT_COLUMN = 7
+
+
+class FiscalTotalsExport(models.TransientModel):
+    """Esportazione CSV/XLSX dei totali fiscali di fatture e ordini
+
+    Le righe vengono lette da un cursore lato server e scritte nella risposta
+    man mano: il CSV parte subito e arriva a blocchi, l'XLSX viene scritto
+    in modalità ``constant_memory`` su file temporaneo e poi inviato a
+    blocchi. In entrambi i casi la memoria non dipende dal numero di righe.
+    """
+    _name = 'l10n_it.fiscal.totals.export'
+    _description = "Esportazione totali Ritenuta e Cassa"
+
+    company_ids = fields.Many2many(
+        'res.company', string="Aziende", required=True,
+        default=lambda self: self.env.company)
+    date_from = fields.Date(
+        string="Dal", required=True,
+        default=lambda self: fields.Date.context_today(self).replace(month=1, day=1))
+    date_to = fields.Date(
+        string="Al", required=True,
+        default=lambda self: fields.Date.context_today(self).replace(month=12, day=31))
+    partner_ids = fields.Many2many('res.partner', string="Clienti", help="Vuoto: tutti i clienti")
+    document_type = fields.Selection([
+        ('invoice', 'Fatture e note di credito'),
+        ('order', 'Ordini di vendita'),
+        ('all', 'Fatture e ordini'),
+    ], string="Documenti", required=True, default='invoice')
+    file_format = fields.Selection([
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel (XLSX)'),
+    ], string="Formato", required=True, default='csv')
+
+    @api.constrains('date_from', 'date_to')
+    def _check_dates(self):
+        for wizard in self:
+            if wizard.date_from > wizard.date_to:
+                raise ValidationError(_("La data iniziale deve precedere quella finale."))
+
+    def _get_filename(self):
+        self.ensure_one()
+        return f"totali_fiscali_{self.date_from.isoformat()}_{self.date_to.isoformat()}.{self.file_format}"
+
+    def _check_companies(self):
+        """La query SQL salta le regole di accesso: si ammettono solo le aziende dell'utente"""
+        forbidden = self.company_ids - self.env.user.company_ids
+        if forbidden:
+            raise AccessError(_("Non hai accesso alle aziende: %s", ", ".join(forbidden.mapped('name'))))
+
+    def _export_query(self):
+        """Query unica (fatture e/o ordini) ordinata per data e numero"""
+        self.ensure_one()
+        partner_filter = "AND {alias}.commercial_partner_id = ANY(%(partner_ids)s)" if self.partner_ids else ""
+        parts = []
+        if self.document_type in ('invoice', 'all'):
+            sign = "(CASE WHEN am.move_type = 'out_refund' THEN -1 ELSE 1 END)"
+            parts.append(f"""
+                SELECT CASE WHEN am.move_type = 'out_refund' THEN 'Nota di credito' ELSE 'Fattura' END AS doc_type,
+                       am.name, am.invoice_date AS doc_date, c.name AS company, p.name AS partner, p.vat,
+                       cur.name AS currency,
+                       {sign} * (am.total_gross - am.amount_tax - am.cassa_amount),
+                       {sign} * am.cassa_amount,
+                       {sign} * am.amount_tax,
+                       {sign} * am.total_gross,
+                       {sign} * am.withholding_amount,
+                       {sign} * am.net_amount
+                  FROM account_move am
+                  JOIN res_company c ON c.id = am.company_id
+                  JOIN res_partner p ON p.id = am.commercial_partner_id
+                  JOIN res_currency cur ON cur.id = am.currency_id
+                 WHERE am.company_id = ANY(%(company_ids)s)
+                   AND am.state = 'posted'
+                   AND am.move_type IN ('out_invoice', 'out_refund')
+                   AND am.invoice_date BETWEEN %(date_from)s AND %(date_to)s
+                   {partner_filter.format(alias='am')}
+            """)
+        if self.document_type in ('order', 'all'):
+            parts.append(f"""
+                SELECT 'Ordine' AS doc_type,
+                       so.name, so.date_order::date AS doc_date, c.name AS company, p.name AS partner, p.vat,
+                       cur.name AS currency,
+                       so.amount_untaxed,
+                       so.cassa_amount,
+                       so.amount_tax,
+                       so.total_gross,
+                       so.withholding_amount,
+                       so.net_amount
+                  FROM sale_order so
+                  JOIN res_partner sp ON sp.id = so.partner_id
+                  JOIN res_partner p ON p.id = COALESCE(sp.commercial_partner_id, sp.id)
+                  JOIN res_company c ON c.id = so.company_id
+                  JOIN res_currency cur ON cur.id = so.currency_id
+                 WHERE so.company_id = ANY(%(company_ids)s)
+                   AND so.state = 'sale'
+                   AND so.date_order::date BETWEEN %(date_from)s AND %(date_to)s
+                   {partner_filter.format(alias='sp')}
+            """)
+        query = " UNION ALL ".join(parts) + " ORDER BY 3, 2"
+        return query, {
+            'company_ids': self.company_ids.ids,
+            'partner_ids': self.partner_ids.commercial_partner_id.ids,
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+        }
+
+    def _export_rows(self):
+        self._check_companies()
+        self.env.flush_all()
+        query, params = self._export_query()
+        return stream_rows(self.env.cr, query, params)
+
+    def _generate_csv(self):
+        """Generatore del CSV in byte, un blocco ogni CSV_CHUNK_ROWS righe"""
+        self.ensure_one()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        # BOM: Excel apre correttamente il file UTF-8
+        buffer.write('\ufeff')
+        writer.writerow(HEADER)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+        count = 0
+        for row in self._export_rows():
+            writer.writerow([
+                value.isoformat() if index == 2 and value else
+                f"{value:.2f}" if index >= AMOUNT_COLUMN and value is not None else value
+                for index, value in enumerate(row)
+            ])
+            count += 1
+            if count % CSV_CHUNK_ROWS == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+
+    def _generate_xlsx(self):
+        """Generatore dell'XLSX in byte: foglio scritto riga per riga, poi inviato a blocchi"""
+        self.ensure_one()
+        with tempfile.TemporaryFile() as tmp:
+            workbook = xlsxwriter.Workbook(tmp, {'constant_memory': True, 'in_memory': False})
+            sheet = workbook.add_worksheet(_("Totali fiscali"))
+            bold = workbook.add_format({'bold': True})
+            date_format = workbook.add_format({'num_format': 'dd/mm/yyyy'})
+            amount_format = workbook.add_format({'num_format': '#,##0.00'})
+            sheet.write_row(0, 0, HEADER, bold)
+            row_index = 0
+            for row in self._export_rows():
+                row_index += 1
+                if row_index > XLSX_MAX_ROW:
+                    # Limite di righe del foglio: si prosegue su un nuovo foglio
+                    sheet = workbook.add_worksheet()
+                    sheet.write_row(0, 0, HEADER, bold)
+                    row_index = 1
+                for col, value in enumerate(row):
+                    if value is None:
+                        continue
+                    if col == 2:
+                        sheet.write_datetime(row_index, col, value, date_format)
+                    elif col >= AMOUNT_COLUMN:
+                        sheet.write_number(row_index, col, float(value), amount_format)
+                    else:
+                        sheet.write_string(row_index, col, str(value))
+            workbook.close()
+            tmp.seek(0)
+            while chunk := tmp.read(FILE_CHUNK_SIZE):
+                yield chunk
+
+    def _generate_export(self):
+        self.ensure_one()
+        if self.file_format == 'xlsx':
+            return self._generate_xlsx()
+        return self._generate_csv()
+
+    def action_export(self):
+        self.ensure_one()
+        self._check_companies()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/l10n_it_withholding/fiscal_totals/{self.id}',
+            'target': 'self',
+        }
@@ -0,0 +1,34 @@
+from odoo import models
+from odoo.tools import float_is_zero
+
+
+class SaleAdvancePaymentInv(models.TransientModel):
+    _inherit = 'sale.advance.payment.inv'
+
+    def _create_invoices(self, sale_orders):
+        """Fatture d'acconto: quota di cassa e ritenuta dell'ordine in un solo passaggio"""
+        if self.advance_payment_method == 'delivered':
+            # Passa da sale.order._create_invoices
+            return super()._create_invoices(sale_orders)
+        invoices = super(SaleAdvancePaymentInv, self.with_context(skip_fiscal_update=True))._create_invoices(
+            sale_orders)
+        invoices = invoices.with_context(skip_fiscal_update=False)
+        invoices._update_order_fiscal_lines()
+        return invoices
+
+    def _prepare_down_payment_lines_values(self, order):
+        """Base dell'acconto senza le righe [AUTO]
+
+        Cassa e ritenuta dell'ordine vengono poi ripartite sulla fattura
+        d'acconto in proporzione all'imponibile (vedi
+        ``account.move._update_order_fiscal_lines``): con le righe [AUTO]
+        nella base sarebbero conteggiate due volte.
+        """
+        lines_values = super(
+            SaleAdvancePaymentInv, self.with_context(l10n_it_down_payment_base=True)
+        )._prepare_down_payment_lines_values(order.with_context(l10n_it_down_payment_base=True))
+        # Gruppi composti solo da righe [AUTO] (es. ritenuta senza IVA)
+        return [
+            values for values in lines_values
+            if not float_is_zero(values.get('price_unit', 0.0), precision_rounding=order.currency_id.rounding)
+        ]
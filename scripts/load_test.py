@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""Load test locale per l10n_it_simple_withholding_cassa.
+
+Simula N utenti concorrenti che, via JSON-RPC su un'istanza Odoo locale,
+eseguono il flusso completo del modulo:
+
+    1. create      -> crea un preventivo con righe prodotto (sale.order.create
+                      esegue _sync_auto_lines)
+    2. onchange    -> onchange del sale.order su apply_cassa / apply_withholding
+    3. save        -> write delle percentuali (rilancia _sync_auto_lines)
+    4. invoice     -> conferma + fatturazione tramite sale.advance.payment.inv
+    5. post        -> validazione della fattura (account.move.action_post)
+
+Gli utenti avanzano fase per fase sincronizzati da una barriera: a ogni
+passaggio di fase vengono letti i contatori di PostgreSQL, cosi' le query
+(pg_stat_statements), i rollback e i deadlock (pg_stat_database) sono
+attribuiti alla singola operazione. Gli errori di serializzazione sono
+contati dalle risposte JSON-RPC (dopo i retry interni di Odoo).
+
+Esempio:
+
+    python scripts/load_test.py --db odoo18 --users 20 --iterations 10 \\
+        --dsn "dbname=odoo18 host=localhost"
+
+Dipendenze: solo libreria standard; psycopg2 e' opzionale e serve solo per
+le statistiche lato database (--dsn).
+"""
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+PHASES = ('create', 'onchange', 'save', 'invoice', 'post')
+
+SERIALIZATION_MARKERS = (
+    'SerializationFailure',
+    'could not serialize access',
+    'concurrent update',
+    'DeadlockDetected',
+)
+
+
+class RpcError(Exception):
+    """Errore restituito dal server Odoo via JSON-RPC"""
+
+    def __init__(self, error):
+        data = error.get('data') or {}
+        self.name = data.get('name') or ''
+        self.message = data.get('message') or error.get('message') or ''
+        super().__init__(f"{self.name}: {self.message}")
+
+    @property
+    def is_serialization_failure(self):
+        text = f"{self.name} {self.message}"
+        return any(marker in text for marker in SERIALIZATION_MARKERS)
+
+
+class OdooClient:
+    """Client JSON-RPC minimale (una connessione logica per utente simulato)"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, url, db, login, password, timeout=120):
+        self.url = url.rstrip('/') + '/jsonrpc'
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.uid = self._call('common', 'login', db, login, password)
+        if not self.uid:
+            raise SystemExit(f"Login fallito per l'utente {login!r}")
+
+    def _call(self, service, method, *args):
+        payload = json.dumps({
+            'jsonrpc': '2.0',
+            'method': 'call',
+            'id': next(self._ids),
+            'params': {'service': service, 'method': method, 'args': args},
+        }).encode()
+        request = urllib.request.Request(
+            self.url, payload, {'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            reply = json.load(response)
+        if reply.get('error'):
+            raise RpcError(reply['error'])
+        return reply['result']
+
+    def execute(self, model, method, *args, **kwargs):
+        return self._call(
+            'object', 'execute_kw', self.db, self.uid, self.password,
+            model, method, list(args), kwargs)
+
+
+class PgStats:
+    """Lettura opzionale dei contatori di PostgreSQL"""
+
+    def __init__(self, dsn):
+        self.conn = None
+        self.has_statements = False
+        if not dsn:
+            return
+        try:
+            import psycopg2
+        except ImportError:
+            print("psycopg2 non disponibile: statistiche DB disattivate", file=sys.stderr)
+            return
+        self.conn = psycopg2.connect(dsn)
+        self.conn.autocommit = True
+        with self.conn.cursor() as cr:
+            cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+            self.has_statements = bool(cr.fetchone())
+        if not self.has_statements:
+            print("pg_stat_statements non installata: query/op non disponibili", file=sys.stderr)
+
+    def snapshot(self):
+        if not self.conn:
+            return None
+        with self.conn.cursor() as cr:
+            cr.execute("""
+                SELECT xact_commit, xact_rollback, deadlocks
+                  FROM pg_stat_database
+                 WHERE datname = current_database()
+            """)
+            commits, rollbacks, deadlocks = cr.fetchone()
+            queries = 0
+            if self.has_statements:
+                cr.execute("""
+                    SELECT COALESCE(SUM(calls), 0)
+                      FROM pg_stat_statements s
+                      JOIN pg_database d ON d.oid = s.dbid
+                     WHERE d.datname = current_database()
+                """)
+                queries = cr.fetchone()[0]
+        return {
+            'commits': commits,
+            'rollbacks': rollbacks,
+            'deadlocks': deadlocks,
+            'queries': queries,
+        }
+
+
+class LoadTest:
+
+    def __init__(self, args):
+        self.args = args
+        self.pg = PgStats(args.dsn)
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.serialization_failures = defaultdict(int)
+        self.db_deltas = defaultdict(lambda: defaultdict(int))
+        self.phase_time = defaultdict(float)
+        self._phase_iter = None
+        self._last_snapshot = None
+        self._last_mark = None
+        self.barrier = threading.Barrier(args.users, action=self._on_phase_end)
+
+    # ------------------------------------------------------------------
+    # Setup
+    # ------------------------------------------------------------------
+
+    def setup(self):
+        client = self._client()
+        partner_id = self.args.partner_id or client.execute(
+            'res.partner', 'create', {'name': 'Load test - Cliente'})
+        product_id = self.args.product_id or client.execute(
+            'product.product', 'create', {
+                'name': 'Load test - Consulenza',
+                'type': 'service',
+                'invoice_policy': 'order',
+                'list_price': 100.0,
+            })
+        return partner_id, product_id
+
+    def _client(self):
+        return OdooClient(self.args.url, self.args.db, self.args.login, self.args.password)
+
+    # ------------------------------------------------------------------
+    # Misurazioni
+    # ------------------------------------------------------------------
+
+    def _on_phase_end(self):
+        """Eseguita da un solo thread quando tutti gli utenti chiudono la fase"""
+        now = time.perf_counter()
+        snapshot = self.pg.snapshot()
+        if self._phase_iter is not None:
+            phase = PHASES[self._phase_iter % len(PHASES)]
+            self.phase_time[phase] += now - self._last_mark
+            if snapshot and self._last_snapshot:
+                for key, value in snapshot.items():
+                    self.db_deltas[phase][key] += value - self._last_snapshot[key]
+            self._phase_iter += 1
+        else:
+            self._phase_iter = 0
+        self._last_snapshot = snapshot
+        self._last_mark = time.perf_counter()
+
+    def _timed(self, phase, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception as e:
+            # Qualsiasi errore conta come richiesta fallita: il thread deve
+            # comunque arrivare alla barriera successiva
+            with self.lock:
+                self.errors[phase] += 1
+                if isinstance(e, RpcError) and e.is_serialization_failure:
+                    self.serialization_failures[phase] += 1
+            if self.args.verbose:
+                print(f"[{phase}] {e}", file=sys.stderr)
+            return None
+        finally:
+            with self.lock:
+                self.latencies[phase].append(time.perf_counter() - start)
+
+    # ------------------------------------------------------------------
+    # Operazioni
+    # ------------------------------------------------------------------
+
+    def _create(self, client, partner_id, product_id):
+        lines = [
+            (0, 0, {'product_id': product_id, 'product_uom_qty': 1 + i, 'price_unit': 100.0 + i})
+            for i in range(self.args.lines)
+        ]
+        return client.execute('sale.order', 'create', {
+            'partner_id': partner_id,
+            'apply_cassa': True,
+            'apply_withholding': True,
+            'order_line': lines,
+        })
+
+    def _onchange(self, client, order_id):
+        current = client.execute('sale.order', 'read', [order_id], ['apply_cassa'])[0]
+        values = {'apply_cassa': not current['apply_cassa']}
+        spec = {
+            'apply_cassa': {},
+            'cassa_percent': {},
+            'apply_withholding': {},
+            'withholding_percent': {},
+            'cassa_amount': {},
+            'withholding_amount': {},
+            'net_amount': {},
+            'order_line': {'fields': {'name': {}, 'price_unit': {}, 'price_subtotal': {}}},
+        }
+        return client.execute('sale.order', 'onchange', [order_id], values, ['apply_cassa'], spec)
+
+    def _save(self, client, order_id):
+        return client.execute('sale.order', 'write', [order_id], {
+            'cassa_percent': 4.0,
+            'withholding_percent': 20.0,
+        })
+
+    def _invoice(self, client, order_id):
+        client.execute('sale.order', 'action_confirm', [order_id])
+        context = {'active_model': 'sale.order', 'active_ids': [order_id], 'active_id': order_id}
+        wizard_id = client.execute(
+            'sale.advance.payment.inv', 'create',
+            {'advance_payment_method': 'delivered'}, context=context)
+        client.execute('sale.advance.payment.inv', 'create_invoices', [wizard_id], context=context)
+        order = client.execute('sale.order', 'read', [order_id], ['invoice_ids'])[0]
+        return order['invoice_ids']
+
+    def _post(self, client, invoice_ids):
+        return client.execute('account.move', 'action_post', invoice_ids)
+
+    def _user(self, partner_id, product_id):
+        try:
+            self._user_phases(partner_id, product_id)
+        except threading.BrokenBarrierError:
+            # Un altro utente si è interrotto: la barriera non si chiude più
+            pass
+        except BaseException:
+            # Sblocca gli altri utenti in attesa sulla barriera
+            self.barrier.abort()
+            raise
+
+    def _user_phases(self, partner_id, product_id):
+        client = self._client()
+        self.barrier.wait()
+        for _iteration in range(self.args.iterations):
+            order_id = self._timed('create', self._create, client, partner_id, product_id)
+            self.barrier.wait()
+            if order_id:
+                self._timed('onchange', self._onchange, client, order_id)
+            self.barrier.wait()
+            if order_id:
+                self._timed('save', self._save, client, order_id)
+            self.barrier.wait()
+            invoice_ids = order_id and self._timed('invoice', self._invoice, client, order_id)
+            self.barrier.wait()
+            if invoice_ids:
+                self._timed('post', self._post, client, invoice_ids)
+            self.barrier.wait()
+
+    # ------------------------------------------------------------------
+    # Esecuzione e report
+    # ------------------------------------------------------------------
+
+    def run(self):
+        partner_id, product_id = self.setup()
+        threads = [
+            threading.Thread(target=self._user, args=(partner_id, product_id), daemon=True)
+            for _i in range(self.args.users)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.barrier.broken:
+            print("Attenzione: test interrotto da un errore imprevisto, risultati parziali", file=sys.stderr)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        rows = []
+        for phase in PHASES:
+            samples = sorted(self.latencies[phase])
+            count = len(samples)
+            if not count:
+                continue
+            if count > 1:
+                cuts = statistics.quantiles(samples, n=100, method='inclusive')
+                p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+            else:
+                p50 = p95 = p99 = samples[0]
+            db = self.db_deltas.get(phase, {})
+            rows.append({
+                'operation': phase,
+                'count': count,
+                'throughput': count / self.phase_time[phase] if self.phase_time[phase] else 0.0,
+                'p50_ms': p50 * 1000,
+                'p95_ms': p95 * 1000,
+                'p99_ms': p99 * 1000,
+                'errors': self.errors[phase],
+                'serialization_failure_rate': self.serialization_failures[phase] / count,
+                'queries_per_op': db['queries'] / count if db.get('queries') else None,
+                'db_rollbacks': db.get('rollbacks'),
+                'db_deadlocks': db.get('deadlocks'),
+            })
+        return {'users': self.args.users, 'iterations': self.args.iterations,
+                'elapsed_s': elapsed, 'operations': rows}
+
+
+def print_report(result):
+    print(f"Utenti: {result['users']}  Iterazioni: {result['iterations']}  "
+          f"Durata: {result['elapsed_s']:.1f}s")
+    header = (f"{'operazione':<10} {'n':>6} {'op/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'errori':>7} {'serial%':>8} {'query/op':>9}")
+    print(header)
+    print('-' * len(header))
+    for row in result['operations']:
+        queries = f"{row['queries_per_op']:.1f}" if row['queries_per_op'] is not None else '-'
+        print(f"{row['operation']:<10} {row['count']:>6} {row['throughput']:>8.2f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+              f"{row['errors']:>7} {row['serialization_failure_rate'] * 100:>7.2f}% {queries:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--login', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--users', type=int, default=10, help="utenti concorrenti simulati")
+    parser.add_argument('--iterations', type=int, default=5, help="cicli completi per utente")
+    parser.add_argument('--lines', type=int, default=5, help="righe prodotto per preventivo")
+    parser.add_argument('--partner-id', type=int, help="cliente esistente (default: ne crea uno)")
+    parser.add_argument('--product-id', type=int, help="prodotto esistente (default: ne crea uno)")
+    parser.add_argument('--dsn', help="DSN psycopg2 del database locale per le statistiche DB")
+    parser.add_argument('--json', action='store_true', help="stampa il risultato in JSON")
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = LoadTest(args).run()
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Simulatore locale dell'endpoint SdI per i test dell'esportazione FatturaPA.
+
+Riceve via POST multipart (campo ``file``) lo ZIP prodotto da
+"Esporta FatturaPA", controlla che ogni XML sia ben formato e contenga i
+blocchi attesi, salva i file nella cartella indicata e risponde con una
+ricevuta JSON per file. Non serve alcuna connessione di rete esterna.
+
+    python scripts/sdi_stub.py --port 8075 --output /tmp/sdi
+
+Nel database impostare il parametro di sistema
+``l10n_it_simple_withholding_cassa.sdi_endpoint`` a
+``http://localhost:8075/sdi`` (valore predefinito).
+"""
+import argparse
+import io
+import json
+import os
+import uuid
+import zipfile
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lxml import etree
+
+NAMESPACE = 'http://ivaservizi.agenziaentrate.gov.it/docs/xsd/fatture/v1.2'
+
+
+def check_invoice(content):
+    """Restituisce la lista degli errori trovati in un XML FatturaPA"""
+    try:
+        root = etree.fromstring(content)
+    except etree.XMLSyntaxError as e:
+        return [f"XML non valido: {e}"]
+    errors = []
+    if root.tag != f'{{{NAMESPACE}}}FatturaElettronica':
+        errors.append(f"radice inattesa {root.tag}")
+    for path in ('FatturaElettronicaHeader', 'FatturaElettronicaBody/DatiGenerali/DatiGeneraliDocumento'):
+        if root.find(path) is None:
+            errors.append(f"manca {path}")
+    for cassa in root.iterfind('.//DatiCassaPrevidenziale'):
+        for tag in ('TipoCassa', 'AlCassa', 'ImportoContributoCassa', 'AliquotaIVA'):
+            if cassa.find(tag) is None:
+                errors.append(f"DatiCassaPrevidenziale senza {tag}")
+    for withholding in root.iterfind('.//DatiRitenuta'):
+        for tag in ('TipoRitenuta', 'ImportoRitenuta', 'AliquotaRitenuta', 'CausalePagamento'):
+            if withholding.find(tag) is None:
+                errors.append(f"DatiRitenuta senza {tag}")
+    return errors
+
+
+class SdiHandler(BaseHTTPRequestHandler):
+    output_dir = None
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, indent=2).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + raw)
+        data = None
+        for part in message.iter_parts() if message.is_multipart() else []:
+            if part.get_param('name', header='content-disposition') == 'file':
+                data = part.get_payload(decode=True)
+        if data is None:
+            return self._reply(400, {'error': "campo 'file' mancante"})
+        receipts = []
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for name in archive.namelist():
+                    content = archive.read(name)
+                    errors = check_invoice(content)
+                    if self.output_dir:
+                        with open(os.path.join(self.output_dir, os.path.basename(name)), 'wb') as fh:
+                            fh.write(content)
+                    receipts.append({
+                        'file': name,
+                        'id_sdi': uuid.uuid4().hex[:12],
+                        'esito': 'NS' if errors else 'RC',
+                        'errori': errors,
+                    })
+        except zipfile.BadZipFile:
+            return self._reply(400, {'error': "ZIP non valido"})
+        accepted = sum(1 for receipt in receipts if receipt['esito'] == 'RC')
+        self._reply(200, {'ricevute': receipts, 'accettate': accepted, 'scartate': len(receipts) - accepted})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8075)
+    parser.add_argument('--output', help="cartella dove salvare gli XML ricevuti")
+    args = parser.parse_args(argv)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    SdiHandler.output_dir = args.output
+    server = ThreadingHTTPServer((args.host, args.port), SdiHandler)
+    print(f"Simulatore SdI in ascolto su http://{args.host}:{args.port}/sdi")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()